@@ -74,18 +74,91 @@ CREATE TRIGGER bookmarks_ad AFTER DELETE ON bookmarks
         INSERT INTO bookmarks_fts (bookmarks_fts, rowid, URL, metadata, "desc")
         VALUES ('delete', old.id, old.URL, old.metadata, old.desc);
     END;
-CREATE TRIGGER bookmarks_au AFTER UPDATE ON bookmarks
+CREATE TRIGGER bookmarks_au AFTER UPDATE OF id, URL, metadata, "desc" ON bookmarks
     BEGIN
         INSERT INTO bookmarks_fts (bookmarks_fts, rowid, URL, metadata, "desc")
         VALUES ('delete', old.id, old.URL, old.metadata, old.desc);
         INSERT INTO bookmarks_fts (rowid, URL, metadata, "desc")
         VALUES (new.id, new.URL, new.metadata, new.desc);
     END;
-CREATE TRIGGER [UpdateLastTime] AFTER UPDATE ON bookmarks
+CREATE TRIGGER [UpdateLastTime] AFTER UPDATE OF URL, metadata, tags, "desc", flags ON bookmarks
     FOR EACH ROW WHEN NEW.last_update_ts <= OLD.last_update_ts
     BEGIN
         update bookmarks set last_update_ts=CURRENT_TIMESTAMP where id=OLD.id;
     END;
+CREATE TABLE bookmark_tags (
+    bookmark_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (bookmark_id, tag)
+) WITHOUT ROWID;
+CREATE INDEX bookmark_tags_tag ON bookmark_tags (tag, bookmark_id);
+CREATE TRIGGER bookmark_tags_ai AFTER INSERT ON bookmarks
+    BEGIN
+        INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag)
+        SELECT new.id, value FROM json_each('[' || replace(json_quote(trim(new.tags, ',')), ',', '","') || ']') WHERE value <> '';
+    END;
+CREATE TRIGGER bookmark_tags_ad AFTER DELETE ON bookmarks
+    BEGIN
+        DELETE FROM bookmark_tags WHERE bookmark_id = old.id;
+    END;
+CREATE TRIGGER bookmark_tags_au AFTER UPDATE OF id, tags ON bookmarks
+    BEGIN
+        DELETE FROM bookmark_tags
+        WHERE bookmark_id = old.id
+          AND (new.id <> old.id OR tag NOT IN (SELECT value FROM json_each('[' || replace(json_quote(trim(new.tags, ',')), ',', '","') || ']')));
+        INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag)
+        SELECT new.id, value FROM json_each('[' || replace(json_quote(trim(new.tags, ',')), ',', '","') || ']') WHERE value <> '';
+    END;
+CREATE TABLE tag_counts (
+    tag TEXT NOT NULL PRIMARY KEY,
+    n INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER tag_counts_ai AFTER INSERT ON bookmark_tags
+    BEGIN
+        INSERT INTO tag_counts (tag, n) VALUES (new.tag, 1)
+        ON CONFLICT (tag) DO UPDATE SET n = n + 1;
+    END;
+CREATE TRIGGER tag_counts_ad AFTER DELETE ON bookmark_tags
+    BEGIN
+        UPDATE tag_counts SET n = n - 1 WHERE tag = old.tag;
+        DELETE FROM tag_counts WHERE tag = old.tag AND n <= 0;
+    END;
+CREATE TABLE tag_pairs (
+    tag TEXT NOT NULL,
+    other TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (tag, other)
+) WITHOUT ROWID;
+CREATE TRIGGER tag_pairs_ai AFTER INSERT ON bookmark_tags
+    BEGIN
+        INSERT INTO tag_pairs (tag, other, n)
+        SELECT new.tag, tag, 1 FROM bookmark_tags
+        WHERE bookmark_id = new.bookmark_id AND tag <> new.tag
+        ON CONFLICT (tag, other) DO UPDATE SET n = n + 1;
+        INSERT INTO tag_pairs (tag, other, n)
+        SELECT tag, new.tag, 1 FROM bookmark_tags
+        WHERE bookmark_id = new.bookmark_id AND tag <> new.tag
+        ON CONFLICT (tag, other) DO UPDATE SET n = n + 1;
+    END;
+CREATE TRIGGER tag_pairs_ad AFTER DELETE ON bookmark_tags
+    BEGIN
+        UPDATE tag_pairs SET n = n - 1
+        WHERE tag = old.tag
+          AND other IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+        UPDATE tag_pairs SET n = n - 1
+        WHERE other = old.tag
+          AND tag IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+        DELETE FROM tag_pairs WHERE tag = old.tag AND n <= 0;
+        DELETE FROM tag_pairs
+        WHERE other = old.tag AND n <= 0
+          AND tag IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+    END;
+/* schema of alembic revision head (twbm/db/alembic): `alembic upgrade head` is a no-op */
+CREATE TABLE alembic_version (
+    version_num VARCHAR(32) NOT NULL,
+    CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num)
+);
+INSERT INTO alembic_version (version_num) VALUES ('d2f7a9c4e816');
 
 attach "$BUKU_DB" as bm;
 .databases
@@ -0,0 +1,102 @@
+"""Benchmarks, based on pytest-benchmark.
+
+Not part of the regular test run: `make benchmark` sets TWBM_BENCHMARK.
+TWBM_BENCHMARK_SIZES selects the generated databases of the suite, e.g. "10k,1m".
+"""
+import os
+import random
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+from alembic import command
+from generator import SIZES, alembic_config, cached_db
+
+from twbm.db.connection import close_all
+from twbm.environment import config
+
+collect_ignore_glob = [] if os.environ.get("TWBM_BENCHMARK") else ["test_*.py"]
+
+BENCHMARK_SIZES = os.environ.get("TWBM_BENCHMARK_SIZES", "10k,100k").split(",")
+
+# a, b, c are the most frequent tags
+TAGS = ["a", "b", "c"] + [f"t{i}" for i in range(197)]
+TAG_WEIGHTS = [1 / (rank + 1) for rank in range(len(TAGS))]
+WORDS = "python sqlite search bookmark web security rust database index tag".split()
+
+
+def create_db(path: Path, revision: str = "head") -> str:
+    dsn = f"sqlite:///{path}"
+    command.upgrade(alembic_config(dsn), revision)
+    return dsn
+
+
+def fill_db(path: Path, n: int, seed: int = 42) -> None:
+    """Insert n bookmarks with 1-5 tags each, deterministic for seed."""
+    rng = random.Random(seed)
+
+    def rows():
+        for i in range(n):
+            tags = set(rng.choices(TAGS, TAG_WEIGHTS, k=rng.randint(1, 5)))
+            yield (
+                f"https://host{i % 1000}.example.com/{i}",
+                " ".join(rng.choices(WORDS, k=5)),
+                f",{','.join(sorted(tags))},",
+                " ".join(rng.choices(WORDS, k=12)),
+                0,
+            )
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "insert into bookmarks (URL, metadata, tags, desc, flags) values (?, ?, ?, ?, ?)",
+        rows(),
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture()
+def db_url(tmp_path):
+    """Empty database at alembic head."""
+    return create_db(tmp_path / "bm_bench.db")
+
+
+@pytest.fixture(scope="session")
+def db_url_500k(tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / "bm_500k.db"
+    dsn = create_db(path)
+    fill_db(path, 500_000)
+    return dsn
+
+
+@pytest.fixture(scope="session", params=BENCHMARK_SIZES)
+def bench_db(request) -> Path:
+    """Generated database of each TWBM_BENCHMARK_SIZES size, read only."""
+    assert request.param in SIZES, f"{request.param=} not in {list(SIZES)}"
+    return cached_db(request.param)
+
+
+@pytest.fixture()
+def bench_config(bench_db, monkeypatch):
+    """config pointing at the read only generated database."""
+    monkeypatch.setattr(config, "twbm_db_url", f"sqlite:///{bench_db}")
+    yield config
+    close_all()
+
+
+@pytest.fixture()
+def bench_copy(bench_db, tmp_path, monkeypatch):
+    """Callable: fresh copy of the generated database, config pointing at it.
+
+    For benchmarks which modify the database, as pedantic setup of each round.
+    """
+    path = tmp_path / bench_db.name
+
+    def copy():
+        close_all()
+        shutil.copyfile(bench_db, path)
+        monkeypatch.setattr(config, "twbm_db_url", f"sqlite:///{path}")
+
+    yield copy
+    close_all()
@@ -0,0 +1,191 @@
+"""Deterministic synthetic twbm databases for the benchmark suite.
+
+Same size and seed, same database: bookmarks with Zipf distributed tags,
+hosts and title/description words, so that FTS and tag queries hit realistic
+posting list lengths.
+
+    python tests/benchmarks/generator.py 1m /tmp/bm_1m.db
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from html import escape
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+ALEMBIC_ROOT = Path(__file__).parent.parent.parent / "twbm/db"
+BASE_REVISION = "7c2eff0bf291"  # bookmarks and FTS, tag tables are backfilled
+
+SIZES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "5m": 5_000_000,
+}
+
+# share of bookmarks with 0, 1, ... 8 tags
+TAG_COUNT_WEIGHTS = (5, 20, 30, 20, 12, 6, 4, 2, 1)
+SYLLABLES = (
+    "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu "
+    "na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu"
+).split()
+# a, b, c: the most frequent tags, used by the benchmark queries
+TOP_TAGS = ("a", "b", "c", "python", "security", "sqlite", "rust", "web", "doc")
+
+
+def alembic_config(dsn: str) -> Config:
+    alembic_cfg = Config(ALEMBIC_ROOT / "alembic.ini")
+    alembic_cfg.set_main_option("script_location", str(ALEMBIC_ROOT / "alembic"))
+    alembic_cfg.set_main_option("sqlalchemy.url", dsn)
+    return alembic_cfg
+
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config("sqlite://")).get_current_head()
+
+
+def zipf_cum_weights(n: int, s: float = 1.1) -> List[float]:
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+def words(rng: random.Random, n: int) -> List[str]:
+    """n distinct pseudo words of 2-4 syllables."""
+    result = set()
+    while len(result) < n:
+        result.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(result)
+
+
+class Vocabulary:
+    """Tags, hosts and words, scaled with the number of bookmarks."""
+
+    def __init__(self, n: int, rng: random.Random):
+        n_tags = min(5000, max(200, n // 200))
+        self.tags = list(TOP_TAGS) + [
+            f"t{w}" for w in words(rng, n_tags - len(TOP_TAGS))
+        ]
+        self.hosts = [f"{w}.example.com" for w in words(rng, max(100, n // 50))]
+        self.words = words(rng, 20_000)
+        self.tag_weights = zipf_cum_weights(len(self.tags))
+        self.host_weights = zipf_cum_weights(len(self.hosts))
+        self.word_weights = zipf_cum_weights(len(self.words), s=1.0)
+
+
+def bookmark_rows(
+    n: int, seed: int = 42, url_prefix: str = ""
+) -> Iterator[Tuple[str, str, str, str, int]]:
+    """(URL, metadata, tags, desc, flags) of n bookmarks, deterministic for seed."""
+    rng = random.Random(seed)
+    voc = Vocabulary(n, rng)
+    n_tags = range(len(TAG_COUNT_WEIGHTS))
+    for i in range(n):
+        k = rng.choices(n_tags, TAG_COUNT_WEIGHTS)[0]
+        tags = set(rng.choices(voc.tags, cum_weights=voc.tag_weights, k=k))
+        host = rng.choices(voc.hosts, cum_weights=voc.host_weights)[0]
+        n_title = rng.randint(2, 10)
+        title = rng.choices(voc.words, cum_weights=voc.word_weights, k=n_title)
+        n_desc = rng.choice((0, 0, 0, rng.randint(5, 40)))
+        desc = rng.choices(voc.words, cum_weights=voc.word_weights, k=n_desc)
+        yield (
+            f"https://{url_prefix}{host}/{title[0]}/{i}",
+            " ".join(title).capitalize(),
+            f",{','.join(sorted(tags))},",
+            " ".join(desc),
+            0,
+        )
+
+
+def build_db(path: Path, n: int, seed: int = 42) -> str:
+    """Database at alembic head with n bookmarks, returns its DSN.
+
+    Bookmarks are inserted at the base revision without FTS trigger, then
+    indexed in one statement and the later revisions backfill the tag tables.
+    """
+    dsn = f"sqlite:///{path}"
+    command.upgrade(alembic_config(dsn), BASE_REVISION)
+
+    conn = sqlite3.connect(path)
+    (trigger_sql,) = conn.execute(
+        "select sql from sqlite_master where type = 'trigger' and name = 'bookmarks_ai'"
+    ).fetchone()
+    conn.execute("drop trigger bookmarks_ai")
+    rows = bookmark_rows(n, seed)
+    while chunk := list(itertools.islice(rows, 100_000)):
+        conn.executemany(
+            "insert into bookmarks (URL, metadata, tags, desc, flags)"
+            " values (?, ?, ?, ?, ?)",
+            chunk,
+        )
+    conn.execute(trigger_sql)
+    # columns of the bookmarks_ai trigger, 'rebuild' would index id as well
+    conn.execute(
+        'insert into bookmarks_fts (rowid, URL, metadata, tags, "desc")'
+        ' select id, URL, metadata, tags, "desc" from bookmarks'
+    )
+    conn.commit()
+    conn.close()
+
+    command.upgrade(alembic_config(dsn), "head")
+    return dsn
+
+
+def cached_db(size: str, seed: int = 42) -> Path:
+    """Database of SIZES[size] bookmarks, built once per schema revision.
+
+    Cache directory: TWBM_BENCHMARK_DATA, default <tmp>/twbm-benchmark.
+    """
+    cache_dir = Path(
+        os.environ.get(
+            "TWBM_BENCHMARK_DATA", Path(tempfile.gettempdir()) / "twbm-benchmark"
+        )
+    )
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"bm_{size}_{seed}_{head_revision()}.db"
+    if not path.exists():
+        partial = path.with_suffix(".partial")
+        partial.unlink(missing_ok=True)
+        build_db(partial, SIZES[size], seed)
+        partial.rename(path)
+    return path
+
+
+def write_netscape_html(path: Path, n: int, seed: int = 7) -> None:
+    """Bookmarks HTML (browser export format) with n bookmarks for import."""
+    lines = [
+        "<!DOCTYPE NETSCAPE-Bookmark-file-1>",
+        "<TITLE>Bookmarks</TITLE>",
+        "<H1>Bookmarks</H1>",
+        "<DL><p>",
+    ]
+    for url, title, tags, desc, _ in bookmark_rows(n, seed, url_prefix="import."):
+        lines.append(
+            f'<DT><A HREF="{escape(url)}" TAGS="{escape(tags.strip(","))}">'
+            f"{escape(title)}</A>"
+        )
+        if desc:
+            lines.append(f"<DD>{escape(desc)}")
+    lines.append("</DL><p>")
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def main(argv: Sequence[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", choices=SIZES)
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.path.exists():
+        sys.exit(f"{args.path} exists")
+    build_db(args.path, SIZES[args.size], args.seed)
+
+
+if __name__ == "__main__":
+    main()
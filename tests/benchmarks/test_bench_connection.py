@@ -0,0 +1,36 @@
+"""Per-command open overhead: `twbm add` opens the DB for check_tags(),
+BukuDb.add_rec() and show_bms().
+"""
+import pytest
+from sqlalchemy import create_engine
+from twbm.buku import BukuDb
+from twbm.db.connection import close_all, get_dbapi_connection
+from twbm.db.dal import DAL
+from twbm.environment import Environment
+
+
+def open_per_block(env: Environment):
+    """Before: new engine per `with DAL()` block, new BukuDb connection."""
+    for _ in range(2):
+        engine = create_engine(env.twbm_db_url)
+        conn = engine.connect()
+        conn.connection.execute("select count(*) from bookmarks").fetchall()
+        conn.close()
+        engine.dispose()
+    BukuDb(dbfile=env.dbfile).close()
+
+
+def open_shared(env: Environment):
+    """After: one shared connection per process."""
+    close_all()  # every command starts in a fresh process
+    for _ in range(2):
+        with DAL(env_config=env) as dal:
+            dal.conn.connection.execute("select count(*) from bookmarks").fetchall()
+    BukuDb(dbfile=env.dbfile, conn=get_dbapi_connection(env.twbm_db_url))
+
+
+@pytest.mark.parametrize("open_db", (open_per_block, open_shared))
+def test_open_overhead(benchmark, db_url, open_db):
+    env = Environment(twbm_db_url=db_url)
+    benchmark(open_db, env)
+    close_all()
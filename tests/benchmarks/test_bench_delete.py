@@ -0,0 +1,46 @@
+"""`twbm delete` of 10k ids out of 20k bookmarks: per id vs. batched."""
+import pytest
+from twbm.buku import BukuDb
+from twbm.db.connection import close_all, get_dbapi_connection
+from twbm.db.dal import DAL
+from twbm.environment import Environment
+
+from conftest import create_db, fill_db
+
+N = 20_000
+IDS = list(range(2, N + 1, 2))
+
+
+def delete_per_id(env: Environment):
+    """Former `twbm delete`: one BukuDb.delete_rec (commit, compactdb) per id."""
+    for id_ in sorted(IDS, reverse=True):
+        with DAL(env_config=env) as dal:
+            _ = dal.get_bookmark_by_id(id_=id_)
+        bukudb = BukuDb(dbfile=env.dbfile, conn=get_dbapi_connection(env.twbm_db_url))
+        bukudb.delete_rec(index=id_, delay_commit=False)
+
+
+def delete_batched(env: Environment):
+    with DAL(env_config=env) as dal:
+        _ = dal.get_bookmarks_by_ids(ids=IDS)
+        dal.delete_bookmarks(ids=IDS, compact=True)
+
+
+@pytest.mark.parametrize("delete", (delete_per_id, delete_batched))
+def test_delete(benchmark, tmp_path, delete):
+    envs = []
+
+    def setup():
+        close_all()
+        path = tmp_path / f"bm_bench_{len(envs)}.db"
+        env = Environment(twbm_db_url=create_db(path))
+        fill_db(path, N)
+        envs.append(env)
+        return (env,), {}
+
+    benchmark.pedantic(delete, setup=setup, rounds=3)
+    with DAL(env_config=envs[-1]) as dal:
+        assert [row[0] for row in dal.conn.execute("select id from bookmarks order by id")] == (
+            list(range(1, N - len(IDS) + 1))
+        )
+    close_all()
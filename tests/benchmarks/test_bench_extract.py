@@ -0,0 +1,46 @@
+"""Page metadata extraction: single html.parser pass vs. the former BeautifulSoup path.
+
+Corpus: the saved pages in tests/tests_data/pages.
+"""
+from email.message import Message
+from pathlib import Path
+
+import pytest
+
+from twbm import buku
+
+PAGES = sorted((Path(__file__).parent.parent / "tests_data" / "pages").glob("*.html"))
+
+
+class Response:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.headers = {"content-type": "text/html"}
+
+
+def beautifulsoup(resp):
+    """get_data_from_page before the single-pass extractor: two parses."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(resp.data, "html.parser")
+    charset = None
+    if soup.meta and soup.meta.get("charset") is not None:
+        charset = soup.meta.get("charset")
+    if not charset:
+        meta_tag = soup.find("meta", attrs={"http-equiv": "Content-Type"})
+        if meta_tag:
+            header = Message()
+            header["content-type"] = meta_tag.attrs["content"]
+            charset = header.get_param("charset")
+    return buku.parse_decoded_page(resp.data.decode(charset or "utf-8", "replace"))
+
+
+@pytest.mark.parametrize(
+    "extract", (beautifulsoup, buku.get_data_from_page), ids=("bs4", "htmlparser")
+)
+@pytest.mark.parametrize("page", PAGES, ids=[p.stem for p in PAGES])
+def test_extract(benchmark, extract, page):
+    benchmark.group = f"extract {page.stem}"
+    resp = Response(page.read_bytes())
+    title, *_ = benchmark(extract, resp)
+    assert title
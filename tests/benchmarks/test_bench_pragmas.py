@@ -0,0 +1,49 @@
+"""Pragma profiles (TWBM_PRAGMA_PROFILE): default vs. fast on generated databases."""
+import pytest
+from generator import write_netscape_html
+
+from twbm.bookmarks import Bookmarks
+from twbm.db.connection import get_dbapi_connection
+from twbm.environment import config
+from twbm.twb import _bukudb
+
+
+@pytest.fixture(params=("default", "fast"))
+def profile(request, monkeypatch):
+    monkeypatch.setattr(config, "twbm_pragma_profile", request.param)
+    return request.param
+
+
+def test_add_commit_each(benchmark, profile, bench_copy):
+    """200 bookmarks, one commit each: like `twbm add` in a loop."""
+
+    def add():
+        bukudb = _bukudb()
+        for i in range(200):
+            bukudb.add_rec(f"https://added.example.com/{i}", tags_in=",a,", fetch=False)
+
+    benchmark.pedantic(add, setup=bench_copy, rounds=3)
+
+
+def test_import(benchmark, profile, bench_copy, tmp_path):
+    html = tmp_path / "bookmarks.html"
+    write_netscape_html(html, 1000)
+
+    def import_():
+        _bukudb().importdb(str(html), tacit=True)
+
+    benchmark.pedantic(import_, setup=bench_copy, rounds=3)
+
+
+@pytest.mark.parametrize(
+    "fts_query, tags_all", (("baba", None), ("", "a,b")), ids=("fts", "tags")
+)
+def test_search(benchmark, profile, bench_copy, fts_query, tags_all):
+    bench_copy()
+    journal_mode = get_dbapi_connection(config.twbm_db_url).execute(
+        "pragma journal_mode"
+    )
+    assert journal_mode.fetchone()[0] == ("wal" if profile == "fast" else "delete")
+
+    bms = benchmark(lambda: Bookmarks(fts_query).filter(tags_all=tags_all))
+    assert len(bms) > 0
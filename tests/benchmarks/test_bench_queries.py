@@ -0,0 +1,46 @@
+"""Per-call aiosql.from_str parsing vs. the module-level query registry."""
+import aiosql
+import pytest
+from twbm.db.connection import close_all
+from twbm.db.dal import DAL, Bookmark
+from twbm.environment import Environment
+
+N_IDS = 1000
+
+GET_BOOKMARK_BY_ID = """
+    -- name: get_bookmark_by_id^
+    -- record_class: Bookmark
+    select *
+    from bookmarks
+    where id = :id;
+"""
+
+
+@pytest.fixture()
+def dal(db_url):
+    with DAL(env_config=Environment(twbm_db_url=db_url)) as dal:
+        dal.conn.connection.executemany(
+            "insert into bookmarks (URL, metadata, tags, desc, flags) values (?, ?, ?, ?, 0)",
+            ((f"http://{i}", f"title {i}", ",a,b,", "desc") for i in range(N_IDS)),
+        )
+        dal.conn.connection.commit()
+        yield dal
+    close_all()
+
+
+def get_by_id_from_str(dal: DAL):
+    for id_ in range(1, N_IDS + 1):
+        queries = aiosql.from_str(
+            GET_BOOKMARK_BY_ID, "sqlite3", record_classes={"Bookmark": Bookmark}
+        )
+        queries.get_bookmark_by_id(dal.conn.connection, id=id_)
+
+
+def get_by_id_registry(dal: DAL):
+    for id_ in range(1, N_IDS + 1):
+        dal.get_bookmark_by_id(id_=id_)
+
+
+@pytest.mark.parametrize("get_by_id", (get_by_id_from_str, get_by_id_registry))
+def test_get_bookmark_by_id(benchmark, dal, get_by_id):
+    benchmark(get_by_id, dal)
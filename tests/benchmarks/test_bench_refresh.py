@@ -0,0 +1,46 @@
+"""Full refresh (BukuDb.refreshdb) against the local stub server serving heavy pages.
+
+Pages per second in extra_info["pages_per_s"]: parsing in the fetch threads
+(processes=0) vs. in one worker process per core.
+"""
+import os
+
+import pytest
+
+from twbm import buku
+from twbm.buku import BukuDb
+from twbm.environment import config
+
+N_PAGES = 500
+
+
+def heavy_page() -> bytes:
+    """~50 KB head: many meta and link tags, the title at its end."""
+    tags = "\n".join(
+        f'<meta name="x-{i}" content="value {i} with some more words">'
+        f'<link rel="preload" href="/static/{i}.js" as="script">'
+        for i in range(500)
+    )
+    return (
+        f'<html><head><meta charset="utf-8">{tags}<title>Heavy page</title>'
+        '<meta name="description" content="A page with a heavy head.">'
+        "</head><body></body></html>"
+    ).encode()
+
+
+@pytest.mark.parametrize("processes", (0, os.cpu_count()), ids=("threads", "processes"))
+def test_refresh(benchmark, tmp_path, http_server, monkeypatch, processes):
+    monkeypatch.setattr(config, "twbm_parse_processes", processes)
+    http_server.page = heavy_page()
+    bukudb = BukuDb(dbfile=str(tmp_path / "bm.db"))
+    for i in range(N_PAGES):
+        bukudb.add_rec(f"{http_server.url}/page/{i}", title_in="old", fetch=False)
+
+    def refresh():
+        assert bukudb.refreshdb(0, threads=64)
+
+    buku.clear_shared_PoolManagers()
+    benchmark.pedantic(refresh, rounds=3)
+    if benchmark.stats is not None:  # None with --benchmark-disable
+        benchmark.extra_info["pages_per_s"] = round(N_PAGES / benchmark.stats["mean"])
+    assert bukudb.get_rec_by_id(1)[2] == "Heavy page"
@@ -0,0 +1,61 @@
+"""Materializing 1M rows: pydantic Bookmark vs. slotted BookmarkRow."""
+import sqlite3
+import tracemalloc
+
+import pytest
+from twbm.bookmarks import Bookmarks
+from twbm.db.dal import Bookmark, BookmarkRow
+
+from conftest import fill_db
+
+N = 1_000_000
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    """Plain bookmarks table, no FTS and tag triggers: fast to fill."""
+    path = tmp_path_factory.mktemp("bench") / "bm_1m.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "create table bookmarks (id integer primary key, URL text, metadata text,"
+        " tags text, desc text, flags integer,"
+        " last_update_ts datetime default current_timestamp)"
+    )
+    conn.close()
+    fill_db(path, N)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def materialize(conn, record_class):
+    cursor = conn.execute("select * from bookmarks")
+    columns = [c[0] for c in cursor.description]
+    return [record_class(**dict(zip(columns, row))) for row in cursor]
+
+
+@pytest.mark.parametrize("record_class", (Bookmark, BookmarkRow))
+def test_materialize(benchmark, conn, record_class):
+    def traced():
+        tracemalloc.start()
+        try:
+            return materialize(conn, record_class)
+        finally:
+            benchmark.extra_info["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+    bms = benchmark.pedantic(traced, rounds=1)
+    assert len(bms) == N
+
+
+@pytest.mark.parametrize("record_class", (Bookmark, BookmarkRow))
+def test_filter_chain(benchmark, conn, record_class):
+    """-t a,b -N c -n t1 over materialized rows: tags split once vs. per stage."""
+    bms = materialize(conn, record_class)
+
+    def filter_chain():
+        bms_ = Bookmarks.match_all(["a", "b"], bms)
+        bms_ = Bookmarks.match_any(["c"], bms_, not_=True)
+        return Bookmarks.match_all(["t1"], bms_, not_=True)
+
+    assert len(benchmark.pedantic(filter_chain, rounds=3)) > 0
@@ -0,0 +1,31 @@
+"""`twbm search -t a,b -N c` on 500k bookmarks: Python set filtering vs. SQL."""
+import pytest
+from twbm.bookmarks import Bookmarks, normalize_tag_string
+from twbm.db.connection import close_all
+from twbm.db.dal import DAL
+from twbm.environment import config
+
+
+@pytest.fixture()
+def config_500k(db_url_500k, monkeypatch):
+    monkeypatch.setattr(config, "twbm_db_url", db_url_500k)
+    yield config
+    close_all()
+
+
+def search_python(tags_all: str, tags_any_not: str):
+    """Former Bookmarks.filter: materialize all rows, filter with sets."""
+    with DAL(env_config=config) as dal:
+        bms = dal.get_bookmarks(fts_query="")
+    bms = Bookmarks.match_all(normalize_tag_string(tags_all), bms)
+    return Bookmarks.match_any(normalize_tag_string(tags_any_not), bms, not_=True)
+
+
+def search_sql(tags_all: str, tags_any_not: str):
+    return Bookmarks(fts_query="").filter(tags_all=tags_all, tags_any_not=tags_any_not)
+
+
+@pytest.mark.parametrize("search", (search_python, search_sql))
+def test_search_tags(benchmark, config_500k, search):
+    bms = benchmark.pedantic(search, args=("a,b", "c"), rounds=3)
+    assert len(bms) > 0
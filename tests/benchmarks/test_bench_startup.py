@@ -0,0 +1,28 @@
+"""Startup time per `twbm` command, import time of twbm from -X importtime."""
+import os
+import subprocess
+import sys
+
+import pytest
+from twbm.environment import config
+
+from test_startup import LAZY_MODULES, twbm_import_times
+
+
+@pytest.mark.parametrize(
+    "args", (["--help"], ["show", "1"], ["tags"], ["search", "--np", "xxxxx"])
+)
+def test_startup(benchmark, dal, args):
+    env = {**os.environ, "TWBM_DB_URL": config.twbm_db_url}
+
+    def run():
+        subprocess.run(
+            [sys.executable, "-c", "from twbm import app; app()", *args],
+            env=env,
+            capture_output=True,
+        )
+
+    benchmark.pedantic(run, rounds=5)
+    times = twbm_import_times(args)
+    benchmark.extra_info["import_twbm_ms"] = times["twbm.twb"] / 1000
+    assert [m for m in LAZY_MODULES if m in times] == []
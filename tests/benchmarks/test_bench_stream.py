@@ -0,0 +1,60 @@
+"""Time to first result and memory of search: list vs. fetchmany pages."""
+import tracemalloc
+
+import pytest
+from twbm.db.connection import close_all
+from twbm.db.dal import DAL
+from twbm.environment import Environment
+
+from conftest import create_db, fill_db
+
+
+@pytest.fixture(scope="module")
+def db_url_10k(tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / "bm_10k.db"
+    dsn = create_db(path)
+    fill_db(path, 10_000)
+    return dsn
+
+
+@pytest.fixture(params=("db_url_10k", "db_url_500k"))
+def dal(request):
+    db_url = request.getfixturevalue(request.param)
+    with DAL(env_config=Environment(twbm_db_url=db_url)) as dal:
+        yield dal
+    close_all()
+
+
+def first_of_list(dal: DAL):
+    return dal.get_bookmarks(fts_query="")[0]
+
+
+def first_of_iter(dal: DAL):
+    return next(iter(dal.iter_bookmarks("")))
+
+
+@pytest.mark.parametrize("first", (first_of_list, first_of_iter))
+def test_time_to_first_result(benchmark, dal, first):
+    bm = benchmark.pedantic(first, args=(dal,), rounds=3)
+    assert bm.id == 1
+
+
+def ids_of_list(dal: DAL):
+    return sum(1 for _ in dal.get_bookmarks(fts_query=""))
+
+
+def ids_of_iter(dal: DAL):
+    return sum(1 for _ in dal.iter_bookmarks(""))
+
+
+@pytest.mark.parametrize("ids", (ids_of_list, ids_of_iter))
+def test_memory(benchmark, dal, ids):
+    def traced():
+        tracemalloc.start()
+        try:
+            return ids(dal)
+        finally:
+            benchmark.extra_info["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+    assert benchmark.pedantic(traced, rounds=1) > 0
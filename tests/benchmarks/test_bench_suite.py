@@ -0,0 +1,158 @@
+"""Benchmark suite on generated databases, see generator.py.
+
+One benchmark per user facing operation and TWBM_BENCHMARK_SIZES size.
+`make benchmark` saves results as JSON under .benchmarks/ for comparison across
+commits: `make benchmark-compare`. The SQL statements of one untimed run are
+saved with each result as extra_info, so N+1 regressions show up as well.
+"""
+import pytest
+from generator import write_netscape_html
+
+from twbm import trace
+from twbm.bookmarks import Bookmarks
+from twbm.db.connection import get_dbapi_connection
+from twbm.db.dal import DAL
+from twbm.environment import config
+from twbm.twb import _bukudb
+
+N_CHANGE = 1000  # bookmarks added, updated, deleted or imported per round
+
+
+def _ids(n_total: int, n: int = N_CHANGE):
+    """n ids spread over the whole id range."""
+    return list(range(1, n_total + 1, n_total // n))[:n]
+
+
+def _db_ids():
+    conn = get_dbapi_connection(config.twbm_db_url)
+    return [row[0] for row in conn.execute("select id from bookmarks order by id")]
+
+
+def count_statements(benchmark, fn, setup=None) -> int:
+    """Statements of one untimed run of fn, saved with the benchmark results."""
+    if setup is not None:
+        setup()
+    with trace.count_statements(warn_threshold=N_CHANGE) as counter:
+        fn()
+    benchmark.extra_info["sql_statements"] = counter.total
+    return counter.total
+
+
+@pytest.mark.parametrize(
+    "fts_query, tags",
+    (
+        ("baba", {}),
+        ("", {"tags_all": "a,b", "tags_any_not": "c"}),
+        ("baba", {"tags_any": "python,sqlite"}),
+        ("baba*", {"tags_exact": "a"}),
+    ),
+    ids=("fts", "tags", "fts_tags_any", "prefix_tags_exact"),
+)
+def test_search(benchmark, bench_config, fts_query, tags):
+    def search():
+        return Bookmarks(fts_query=fts_query).filter(**tags)
+
+    assert count_statements(benchmark, search) < 5
+    assert len(benchmark(search)) > 0
+
+
+def test_add(benchmark, bench_copy):
+    def add():
+        bukudb = _bukudb()
+        for i in range(N_CHANGE):
+            bukudb.add_rec(
+                f"https://added.example.com/{i}",
+                title_in=f"added {i}",
+                tags_in=",a,added,",
+                desc="added by benchmark",
+                delay_commit=True,
+                fetch=False,
+            )
+        bukudb.conn.commit()
+
+    count_statements(benchmark, add, setup=bench_copy)
+    benchmark.pedantic(add, setup=bench_copy, rounds=3)
+    with DAL(env_config=config) as dal:
+        assert len(dal.get_bookmarks(fts_query="added")) == N_CHANGE
+
+
+def test_update_tags(benchmark, bench_copy):
+    n_total = None
+
+    def setup():
+        nonlocal n_total
+        bench_copy()
+        n_total = len(_db_ids())
+
+    def update():
+        with DAL(env_config=config) as dal:
+            return dal.update_tags(_ids(n_total), tags=["updated"], tags_not=["a"])
+
+    assert count_statements(benchmark, update, setup=setup) < 10
+    benchmark.pedantic(update, setup=setup, rounds=3)
+    with DAL(env_config=config) as dal:
+        assert dal.get_related_tags("updated")[0] == ("updated", N_CHANGE)
+
+
+def test_delete_compact(benchmark, bench_copy):
+    n_total = None
+
+    def setup():
+        nonlocal n_total
+        bench_copy()
+        n_total = len(_db_ids())
+
+    def delete():
+        with DAL(env_config=config) as dal:
+            dal.delete_bookmarks(_ids(n_total), compact=True)
+
+    assert count_statements(benchmark, delete, setup=setup) < 2 * N_CHANGE
+    benchmark.pedantic(delete, setup=setup, rounds=3)
+    assert _db_ids() == list(range(1, n_total - N_CHANGE + 1))
+
+
+def test_tags(benchmark, bench_config):
+    def tags():
+        with DAL(env_config=config) as dal:
+            return dal.get_all_tags(with_frequency=True)
+
+    assert count_statements(benchmark, tags) < 5
+    assert len(benchmark(tags)) > 0
+
+
+@pytest.mark.parametrize("tags", (["a"], ["python"], ["a", "b"]))
+def test_related_tags(benchmark, bench_config, tags):
+    def related():
+        with DAL(env_config=config) as dal:
+            if len(tags) == 1:
+                return dal.get_related_tags(tags[0])
+            return dal.get_related_tags_all(tags)
+
+    assert count_statements(benchmark, related) < 5
+    assert len(benchmark(related)) > 0
+
+
+def test_import(benchmark, bench_copy, tmp_path):
+    html = tmp_path / "bookmarks.html"
+    write_netscape_html(html, N_CHANGE)
+
+    def import_():
+        _bukudb().importdb(str(html), tacit=True)
+
+    count_statements(benchmark, import_, setup=bench_copy)
+    benchmark.pedantic(import_, setup=bench_copy, rounds=3)
+    with DAL(env_config=config) as dal:
+        assert len(dal.get_bookmarks(fts_query='"import"')) == N_CHANGE
+
+
+def test_export(benchmark, bench_config, tmp_path):
+    paths = (tmp_path / f"export_{i}.html" for i in range(1000))
+
+    def export():
+        path = next(paths)
+        assert _bukudb().exportdb(str(path))
+        return path
+
+    count_statements(benchmark, export)
+    path = benchmark.pedantic(export, rounds=3)
+    assert path.stat().st_size > 0
@@ -0,0 +1,75 @@
+"""`twbm tags` on 500k bookmarks.
+
+All tags: recursive CTE split vs. tag_counts.
+Related tags: bookmark_tags group by vs. tag_pairs lookup.
+"""
+import pytest
+from twbm.db.connection import close_all
+from twbm.db.dal import DAL
+from twbm.environment import Environment
+
+ALL_TAGS_CTE = """
+with RECURSIVE split(tags, rest) AS (
+    SELECT '', tags || ','
+    FROM bookmarks
+    UNION ALL
+    SELECT substr(rest, 0, instr(rest, ',')),
+           substr(rest, instr(rest, ',') + 1)
+    FROM split
+    WHERE rest <> '')
+SELECT tags, count(tags) as n
+FROM split
+WHERE tags <> ''
+group by tags
+ORDER BY 2 desc;
+"""
+
+RELATED_TAGS_INDEX = """
+select tag, count(*) as n
+from bookmark_tags
+where bookmark_id in (select bookmark_id from bookmark_tags where tag = ?)
+group by tag
+order by 2 desc, 1 desc;
+"""
+
+
+@pytest.fixture()
+def dal(db_url_500k):
+    with DAL(env_config=Environment(twbm_db_url=db_url_500k)) as dal:
+        yield dal
+    close_all()
+
+
+def all_tags_cte(dal: DAL):
+    return dal.conn.connection.execute(ALL_TAGS_CTE).fetchall()
+
+
+def all_tags_counts(dal: DAL):
+    return dal.get_all_tags()
+
+
+@pytest.mark.parametrize("all_tags", (all_tags_cte, all_tags_counts))
+def test_all_tags(benchmark, dal, all_tags):
+    tags = benchmark.pedantic(all_tags, args=(dal,), rounds=3)
+    assert len(tags) == 200
+
+
+def related_tags_index(dal: DAL):
+    return dal.conn.connection.execute(RELATED_TAGS_INDEX, ("a",)).fetchall()
+
+
+def related_tags_pairs(dal: DAL):
+    return dal.get_related_tags(tag="a")
+
+
+@pytest.mark.parametrize("related_tags", (related_tags_index, related_tags_pairs))
+def test_related_tags(benchmark, dal, related_tags):
+    tags = benchmark.pedantic(related_tags, args=(dal,), rounds=3)
+    assert tags[0][0] == "a"
+
+
+def test_related_tags_top_k(benchmark, dal):
+    tags = benchmark.pedantic(
+        dal.get_related_tags_all, args=(["a", "b"],), kwargs={"limit": 10}, rounds=3
+    )
+    assert len(tags) == 10
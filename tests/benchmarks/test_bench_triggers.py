@@ -0,0 +1,35 @@
+"""Bulk tag update of 10k bookmarks: FTS trigger write amplification.
+
+c61e0a4b8d93: bookmarks_au fires on every update, also on the timestamp update
+of UpdateLastTime. head: column-aware triggers.
+"""
+import sqlite3
+
+import pytest
+
+from conftest import create_db, fill_db
+
+N = 10_000
+
+
+@pytest.mark.parametrize("revision", ("c61e0a4b8d93", "head"))
+def test_bulk_tag_update(benchmark, tmp_path, revision):
+    path = tmp_path / "bm_bench.db"
+    create_db(path, revision)
+    fill_db(path, N)
+    conn = sqlite3.connect(path)
+    changes = []
+
+    def update_tags():
+        total_changes = conn.total_changes
+        conn.executemany(
+            "update bookmarks set tags = tags || 'x,' where id = ?",
+            ((id_,) for id_ in range(1, N + 1)),
+        )
+        conn.commit()
+        changes.append(conn.total_changes - total_changes)
+
+    benchmark.pedantic(update_tags, rounds=3)
+    # rows written incl. triggers, per updated bookmark
+    benchmark.extra_info["changes_per_row"] = changes[0] / N
+    conn.close()
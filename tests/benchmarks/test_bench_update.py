@@ -0,0 +1,45 @@
+"""`twbm update -t x` of 10k ids out of 100k bookmarks: per row vs. one statement."""
+import pytest
+from twbm.bookmarks import Bookmarks
+from twbm.db.connection import close_all
+from twbm.db.dal import DAL
+from twbm.environment import config
+
+from conftest import create_db, fill_db
+
+N = 100_000
+IDS = list(range(1, N + 1, 10))
+
+
+@pytest.fixture()
+def config_100k(tmp_path, monkeypatch):
+    path = tmp_path / "bm_bench.db"
+    monkeypatch.setattr(config, "twbm_db_url", create_db(path))
+    fill_db(path, N)
+    yield config
+    close_all()
+
+
+def update_per_row(tags, tags_not):
+    """Former twb._update_tags: load all bookmarks, one commit per row."""
+    bms = Bookmarks(fts_query="").bms
+    with DAL(env_config=config) as dal:
+        for id_ in IDS:
+            bm = bms[id_ - 1]
+            new_tags = sorted((set(bm.split_tags) | set(tags)) - set(tags_not))
+            bm.tags = f",{','.join(new_tags)},"
+            dal.update_bookmark(bm)
+
+
+def update_bulk(tags, tags_not):
+    with DAL(env_config=config) as dal:
+        dal.update_tags(IDS, tags=tags, tags_not=tags_not)
+
+
+@pytest.mark.parametrize("update", (update_per_row, update_bulk))
+def test_update_tags(benchmark, config_100k, update):
+    benchmark.pedantic(update, args=(("x",), ("a",)), rounds=3)
+    if benchmark.stats is not None:  # None with --benchmark-disable
+        benchmark.extra_info["rows_per_s"] = len(IDS) / benchmark.stats.stats.mean
+    with DAL(env_config=config) as dal:
+        assert all("x" in bm.split_tags for bm in dal.get_bookmarks_by_ids(IDS))
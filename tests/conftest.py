@@ -1,11 +1,16 @@
 import logging
 import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import aiosql
 import pytest
 from alembic import command
 from alembic.config import Config
+from twbm.db.connection import close_all
 from twbm.db.dal import DAL
 from twbm.environment import config
 
@@ -410,6 +415,7 @@ def data():
 def init_db():
     # TWBM_DB_URL=sqlite:///tests/tests_data/bm_test.db
     dsn = os.environ.get("TWBM_DB_URL", "sqlite:///tests/tests_data/bm_test.db")
+    close_all()  # shared connections must not outlive the DB file
     (Path(__file__).parent / "tests_data/bm_test.db").unlink(missing_ok=True)
     alembic_root = Path(__file__).parent.parent / "twbm/db"
 
@@ -430,3 +436,79 @@ def dal(init_db):
         aiosql_queries.load_testdata(dal.conn.connection)
         dal.conn.connection.commit()
         yield dal
+
+
+@pytest.fixture()
+def legacy_dal():
+    """dal on a DB created by scripts/twbm-upgrade-db.sh, not by alembic."""
+    close_all()
+    p = Path(__file__).parent / "tests_data"
+    (p / "bm_test.db").unlink(missing_ok=True)
+    with sqlite3.connect(p / "bm_test.db") as conn:
+        conn.executescript((p / "legacy_schema.sql").read_text())
+
+    dal = DAL(env_config=config)
+    with dal as dal:
+        sql_files_path = Path(__file__).parent.absolute() / "sql"
+        aiosql_queries = aiosql.from_path(f"{sql_files_path}", "sqlite3")
+        aiosql_queries.load_testdata(dal.conn.connection)
+        dal.conn.connection.commit()
+        yield dal
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves /page/<n> as a small HTML page with title "Page <n>", or server.page."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            n = self.path.rsplit("/", 1)[-1]
+            body = server.page or (
+                f"<html><head><title>Page {n}</title>"
+                f'<meta name="description" content="Description {n}">'
+                f"</head><body>{server.body}</body></html>"
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client read only the head
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def http_server():
+    """Local stub HTTP server, counts requests, connections and concurrency."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.delay = 0.0
+    server.body = ""
+    server.page = None
+    server.requests = server.connections = 0
+    server.in_flight = server.max_in_flight = 0
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+from twbm import trace
+from twbm.db.connection import (
+    close_all,
+    get_connection,
+    get_dbapi_connection,
+    get_engine,
+    sqlite_uri,
+)
+from twbm.db.dal import DAL
+from twbm.db.pragmas import apply_pragmas
+from twbm.environment import config
+from twbm.twb import _bukudb
+
+
+def test_get_connection_is_shared(init_db):
+    conn = get_connection(config.twbm_db_url)
+    assert get_connection(config.twbm_db_url) is conn
+    assert get_engine(config.twbm_db_url) is conn.engine
+
+
+def test_dal_and_bukudb_share_connection(dal):
+    raw = get_dbapi_connection(config.twbm_db_url)
+    with DAL(env_config=config) as dal_:
+        assert dal_.conn.connection.dbapi_connection is raw
+    assert _bukudb().conn is raw
+
+
+def test_close_all(init_db):
+    conn = get_connection(config.twbm_db_url)
+    close_all()
+    assert conn.closed
+    assert get_connection(config.twbm_db_url) is not conn
+
+
+def test_pragma_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "twbm_pragma_profile", "fast")
+    monkeypatch.setattr(config, "twbm_synchronous", "off")
+    url = f"sqlite:///{tmp_path / 'bm_pragmas.db'}"
+    try:
+        raw = get_dbapi_connection(url)
+        assert raw.execute("pragma journal_mode").fetchone()[0] == "wal"
+        assert raw.execute("pragma synchronous").fetchone()[0] == 0  # off
+        assert raw.execute("pragma mmap_size").fetchone()[0] == 256 * 1024 * 1024
+        assert raw.execute("pragma temp_store").fetchone()[0] == 2  # memory
+    finally:
+        close_all()
+
+
+def test_pragma_profile_bukudb(tmp_path, monkeypatch):
+    from twbm.buku import BukuDb
+
+    monkeypatch.setattr(config, "twbm_pragma_profile", "safe")
+    bukudb = BukuDb(dbfile=str(tmp_path / "bm_buku.db"))
+    assert bukudb.conn.execute("pragma journal_mode").fetchone()[0] == "wal"
+    assert bukudb.conn.execute("pragma synchronous").fetchone()[0] == 2  # full
+    bukudb.conn.close()
+
+
+def test_apply_pragmas_invalid(init_db):
+    raw = get_dbapi_connection(config.twbm_db_url)
+    with pytest.raises(ValueError):
+        apply_pragmas(raw, {"journal_mode": "wal; drop table bookmarks"})
+    with pytest.raises(ValueError):
+        apply_pragmas(raw, {"foreign_keys": 1})
+
+
+def test_read_only_connection(dal):
+    ro = get_dbapi_connection(config.twbm_db_url, mode="ro")
+    assert ro is not get_dbapi_connection(config.twbm_db_url)
+    assert ro.execute("select count(*) from bookmarks").fetchone()[0] > 0
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        ro.execute("delete from bookmarks")
+
+
+def test_read_only_dal_sees_writes(dal):
+    with DAL(env_config=config, read_only=True) as dal_ro:
+        assert dal_ro.mode == "ro"
+        n = len(dal_ro.get_bookmarks(fts_query=""))
+        _bukudb().add_rec("http://read.only/new", fetch=False)
+        assert len(dal_ro.get_bookmarks(fts_query="")) == n + 1
+
+
+def test_immutable(dal, monkeypatch):
+    monkeypatch.setattr(config, "twbm_immutable", True)
+    assert DAL(env_config=config, read_only=True).mode == "immutable"
+    assert DAL(env_config=config).mode == "rw"
+    assert sqlite_uri("sqlite:///db/b m.db", "immutable") == (
+        "file:db/b%20m.db?mode=ro&immutable=1"
+    )
+
+
+def test_bukudb_reused_connection_no_ddl(dal):
+    with trace.count_statements() as counter:
+        _bukudb()
+    # only the sqlite_master lookups of the optional tag tables
+    assert all(sql.lower().startswith("select") for sql in counter.counts)
+
+
+def test_table_checks_cached(dal):
+    _bukudb()
+    with trace.count_statements() as counter:
+        bukudb = _bukudb()
+        with DAL(env_config=config) as dal_:
+            assert dal_.has_table("bookmark_tags") and bukudb.tag_counts
+    assert counter.total == 0  # checked once per shared connection
@@ -1,6 +1,6 @@
 import pytest
 from twbm import buku
-from twbm.db.dal import DAL, Bookmark, metadata
+from twbm.db.dal import DAL, Bookmark, BookmarkRow, metadata, query_stats
 from twbm.environment import config
 
 
@@ -29,7 +29,7 @@ def test_get_bookmarks(dal):
     # for result in results:
     #     print(f"{result.use_case}, {result.reason}, {result.strategy}")
     assert len(results) > 0
-    assert isinstance(results[0], Bookmark)
+    assert isinstance(results[0], BookmarkRow)
 
 
 def test_get_bookmark_by_id(dal):
@@ -102,7 +102,9 @@ def test_split_tags(dal):
     ("tag", "result"),
     (("ccc", [("ccc", 3), ("bbb", 2), ("aaa", 2), ("yyy", 1), ("xxx", 1)]),),
 )
-def test_get_related_tags(dal, tag, result):
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))  # legacy_dal: no tag tables
+def test_get_related_tags(request, db, tag, result):
+    dal = request.getfixturevalue(db)
     tags = dal.get_related_tags(tag=tag)
     print(tags)
     assert tags == result
@@ -110,7 +112,9 @@ def test_get_related_tags(dal, tag, result):
     _ = None
 
 
-def test_get_all_tags(dal):
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))
+def test_get_all_tags(request, db):
+    dal = request.getfixturevalue(db)
     tags = dal.get_all_tags()
     print(tags)
     result = [("bbb", 4), ("aaa", 4), ("ccc", 3), ("yyy", 1), ("xxx", 1)]
@@ -124,3 +128,329 @@ class TestBuku:
         print(f"Testing: {config.dbfile=}")
         db.add_rec("https://example.com", title_in="")
         # db.delete_rec(1)
+
+
+def test_query_stats(dal):
+    calls = query_stats["get_bookmark_by_id"].calls
+    dal.get_bookmark_by_id(id_=1)
+    dal.get_bookmark_by_id(id_=2)
+    assert query_stats["get_bookmark_by_id"].calls == calls + 2
+    assert query_stats["get_bookmark_by_id"].mean > 0
+
+
+@pytest.mark.parametrize(
+    "tags",
+    (
+        "aaa",
+        "ccc,xxx",
+        "aaa + ccc",
+        "aaa - xxx",
+        "aaa + bbb - ccc",
+        "- ccc",
+        "AAA",
+        "Ccc,XXX",
+        "aaa + CCC + Aaa",
+        "python",
+    ),
+)
+@pytest.mark.parametrize("tag_counts", (True, False))
+def test_bukudb_search_by_tag_index(dal, tags, tag_counts):
+    dal.insert_bookmark(Bookmark(URL="http://python.org", tags=",aaa,Python,"))
+    db = buku.BukuDb(dbfile=config.dbfile)
+    assert db.tag_index
+    db.tag_counts = tag_counts
+    result = db.search_by_tag(tags)
+    assert result
+
+    db.tag_index = False  # LIKE scan, ASCII case-insensitive
+    assert result == db.search_by_tag(tags)
+
+
+def test_bukudb_replace_tag_index(dal):
+    db = buku.BukuDb(dbfile=config.dbfile)
+    assert db.replace_tag("ccc", ["ddd"])
+    assert dal.get_related_tags(tag="ccc") == []
+    assert ("ddd", 3) in dal.get_all_tags()
+
+
+def test_bukudb_tag_index_mixed_case(dal, monkeypatch):
+    dal.insert_bookmark(Bookmark(URL="http://python.org", tags=",Python,"))
+    db = buku.BukuDb(dbfile=config.dbfile)
+    monkeypatch.setattr("builtins.input", lambda _: "2")  # ccc, yyy: not xxx
+    assert db.suggest_similar_tag("XXX") == ",xxx,yyy,"
+
+    assert db.replace_tag("PYTHON", ["py"])
+    assert dal.get_bookmarks(fts_query="python")[0].tags == ",py,"
+
+
+def test_bookmark_tags_in_sync(dal):
+    bm = dal.get_bookmarks(fts_query="xxxxx")[0]
+    bm.tags = ",bla,ccc,"
+    dal.update_bookmark(bm)
+    dal.delete_bookmark(id=2)
+    tags = dal.conn.connection.execute(
+        "select tag from bookmark_tags where bookmark_id in (1, 2) order by tag"
+    ).fetchall()
+    assert tags == [("bla",), ("ccc",)]
+
+
+def test_tag_counts_in_sync(dal):
+    bm = dal.get_bookmarks(fts_query="xxxxx")[0]
+    bm.tags = ",aaa,new,"
+    dal.update_bookmark(bm)
+    dal.delete_bookmark(id=2)
+
+    tags = dal.get_all_tags()
+    assert tags == [("aaa", 4), ("bbb", 3), ("ccc", 2), ("new", 1)]
+    assert tags == dal.conn.connection.execute(
+        "select tag, count(*) from bookmark_tags group by tag order by 2 desc, 1 desc"
+    ).fetchall()
+
+
+def test_bukudb_get_tag_all(dal):
+    db = buku.BukuDb(dbfile=config.dbfile)
+    assert db.tag_counts
+    unique_tags, dic = db.get_tag_all()
+
+    db.tag_counts = False  # split tags of all rows
+    unique_tags_, dic_ = db.get_tag_all()
+    assert unique_tags == unique_tags_
+    assert dic == {tag: dic_[tag] for tag in unique_tags_}
+
+
+def test_tag_pairs_in_sync(dal):
+    bm = dal.get_bookmarks(fts_query="xxxxx")[0]
+    bm.tags = ",aaa,new,xxx,"
+    dal.update_bookmark(bm)
+    dal.delete_bookmark(id=2)
+
+    conn = dal.conn.connection
+    assert conn.execute("select * from tag_pairs order by 1, 2").fetchall() == (
+        conn.execute(
+            "select a.tag, b.tag, count(*) from bookmark_tags a join bookmark_tags b"
+            " on a.bookmark_id = b.bookmark_id and a.tag <> b.tag"
+            " group by a.tag, b.tag order by 1, 2"
+        ).fetchall()
+    )
+    assert dal.get_related_tags(tag="new") == [("xxx", 1), ("new", 1), ("aaa", 1)]
+
+
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))
+def test_get_related_tags_limit(request, db):
+    dal = request.getfixturevalue(db)
+    assert dal.get_related_tags(tag="ccc", limit=2) == [("ccc", 3), ("bbb", 2)]
+
+
+@pytest.mark.parametrize(
+    ("tags", "limit", "result"),
+    (
+        (["ccc"], None, [("ccc", 3), ("bbb", 2), ("aaa", 2), ("yyy", 1), ("xxx", 1)]),
+        (["bbb", "ccc"], None, [("ccc", 2), ("bbb", 2), ("aaa", 2)]),
+        (["bbb", "ccc"], 1, [("ccc", 2)]),
+        (["ccc", "xxx"], None, [("yyy", 1), ("xxx", 1), ("ccc", 1)]),
+        (["aaa", "xxx"], None, []),
+    ),
+)
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))  # legacy_dal: no bookmark_tags
+def test_get_related_tags_all(request, db, tags, limit, result):
+    dal = request.getfixturevalue(db)
+    assert dal.get_related_tags_all(tags=tags, limit=limit) == result
+
+
+def test_fts_triggers_tag_update(dal):
+    conn = dal.conn.connection
+    conn.execute(
+        "update bookmarks set last_update_ts = '2000-01-01 00:00:00' where id = 1"
+    )
+    bm = dal.get_bookmark_by_id(id_=1)
+    bm.tags = ",aaa,zzzzz,"
+    dal.update_bookmark(bm)
+
+    assert [bm.id for bm in dal.get_bookmarks(fts_query="zzzzz")] == [1]
+    assert dal.get_bookmark_by_id(id_=1).last_update_ts.year > 2000
+
+
+def test_delete_bookmarks(dal):
+    ids = [bm.id for bm in dal.get_bookmarks(fts_query="")]
+    assert dal.delete_bookmarks(ids=[2, 4]) == 2
+
+    assert [bm.id for bm in dal.get_bookmarks(fts_query="")] == [
+        id_ for id_ in ids if id_ not in (2, 4)
+    ]
+    assert dal.conn.connection.execute(
+        "select count(*) from bookmark_tags where bookmark_id in (2, 4)"
+    ).fetchone() == (0,)
+
+
+def test_compact(dal):
+    n = len(dal.get_bookmarks(fts_query=""))
+    bm = dal.get_bookmark_by_id(id_=n)
+    dal.delete_bookmarks(ids=[2, 4, n - 1])
+
+    assert dal.compact() == [(n - 2, 2), (n, 4)]
+    assert [bm.id for bm in dal.get_bookmarks(fts_query="")] == list(range(1, n - 2))
+    assert dal.get_bookmark_by_id(id_=4).URL == bm.URL
+    assert dal.conn.connection.execute(
+        "select tag from bookmark_tags where bookmark_id = 4 order by tag"
+    ).fetchall() == [(tag,) for tag in sorted(bm.split_tags)]
+    assert dal.compact() == []
+
+
+def test_delete_bookmarks_compact(dal):
+    n = len(dal.get_bookmarks(fts_query=""))
+    progress = []
+    assert (
+        dal.delete_bookmarks(
+            ids=[2, 4, n], compact=True, on_progress=progress.append, chunk_size=2
+        )
+        == 3
+    )
+    assert progress == [2, 1]
+    assert [bm.id for bm in dal.get_bookmarks(fts_query="")] == list(range(1, n - 2))
+
+
+def test_get_bookmarks_by_ids(dal):
+    assert [bm.id for bm in dal.get_bookmarks_by_ids(ids=[3, 1, 999])] == [1, 3]
+
+
+@pytest.mark.parametrize(
+    ("tags", "tags_not", "force"),
+    (
+        (("x",), ("ccc",), False),
+        (("x", "aaa"), (), False),
+        ((), ("aaa", "bbb", "ccc", "xxx", "yyy"), False),
+        (("x", 'q"uote'), (), True),
+        ((), (), True),
+    ),
+)
+def test_update_tags(dal, tags, tags_not, force):
+    dal.delete_bookmarks(ids=[2])
+    bms = dal.get_bookmarks_by_ids(ids=[1, 3, 4])
+    result = dal.update_tags(
+        ids=[1, 2, 3, 4], tags=tags, tags_not=tags_not, force=force
+    )
+
+    for bm in bms:
+        new_tags = set(tags)
+        if not force:
+            new_tags = (set(bm.split_tags) | new_tags) - set(tags_not)
+        bm.tags = f",{','.join(sorted(new_tags))},"
+    assert sorted((bm.id, bm.tags) for bm in result) == [(bm.id, bm.tags) for bm in bms]
+    assert [bm.tags for bm in dal.get_bookmarks_by_ids(ids=[1, 3, 4])] == [
+        bm.tags for bm in bms
+    ]
+
+
+@pytest.mark.parametrize(
+    ("fts_query", "tags_all", "tags_any_not"),
+    (("", None, None), ("", ["aaa"], None), ("xxxxx", None, None), ("", None, ["ccc"])),
+)
+@pytest.mark.parametrize("page_size", (1, 2, 1000))
+def test_iter_bookmarks(dal, fts_query, tags_all, tags_any_not, page_size):
+    bms = dal.search_bookmarks(fts_query, tags_all=tags_all, tags_any_not=tags_any_not)
+    ids = [bm.id for bm in bms]
+
+    result = dal.iter_bookmarks(
+        fts_query, tags_all=tags_all, tags_any_not=tags_any_not, page_size=page_size
+    )
+    assert [bm.id for bm in result] == ids
+
+
+@pytest.mark.parametrize(
+    ("limit", "offset"), ((None, 0), (3, 0), (3, 2), (None, 5), (0, 0), (100, 100))
+)
+@pytest.mark.parametrize("page_size", (1, 2, 1000))
+def test_iter_bookmarks_limit_offset(dal, limit, offset, page_size):
+    ids = [bm.id for bm in dal.iter_bookmarks("")]
+    assert ids == sorted(ids)
+    result = dal.iter_bookmarks("", limit=limit, offset=offset, page_size=page_size)
+    end = None if limit is None else offset + limit
+    assert [bm.id for bm in result] == ids[offset:end]
+    bms = dal.search_bookmarks("", limit=limit, offset=offset)
+    assert [bm.id for bm in bms] == ids[offset:end]
+
+
+def test_search_bookmarks_rank_order(dal):
+    rows = dal.conn.connection.execute(
+        "select rowid from bookmarks_fts where bookmarks_fts match ? order by rank;",
+        ("bla OR description",),
+    ).fetchall()
+    ids = [r[0] for r in rows]
+    assert len(ids) == 5
+    assert [bm.id for bm in dal.search_bookmarks("bla OR description")] == ids
+    bms = dal.search_bookmarks("bla OR description", limit=2, offset=1)
+    assert [bm.id for bm in bms] == ids[1:3]
+
+
+def test_bookmark_row(dal):
+    bm = dal.get_bookmark_by_id(id_=1)
+    row = dal.get_bookmarks_by_ids(ids=[1])[0]
+    for field in Bookmark.__fields__:
+        assert getattr(row, field) == getattr(bm, field)
+    assert list(row.split_tags) == bm.split_tags
+    assert row.tag_set == bm.tag_set == frozenset(bm.split_tags)
+
+    row.tags = ",new,"
+    assert row.split_tags == ("new",)
+    assert row.tag_set == frozenset(("new",))
+
+
+def test_fts_last_update_ts_legacy(legacy_dal):
+    """FTS table of scripts/twbm-upgrade-db.sh: no last_update_ts column."""
+    ts = legacy_dal.get_bookmarks_by_ids(ids=[3])[0].last_update_ts
+    for bms in (
+        legacy_dal.get_bookmarks("bla"),
+        legacy_dal.search_bookmarks("bla"),
+        list(legacy_dal.iter_bookmarks("bla")),
+    ):
+        assert {bm.id for bm in bms} == {3, 4, 5}
+        assert all(bm.last_update_ts == ts for bm in bms)
+
+
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))
+def test_get_db_stats(request, db):
+    dal = request.getfixturevalue(db)
+    stats = dal.get_db_stats()
+    assert stats.bookmarks == len(dal.get_bookmarks(fts_query=""))
+    assert stats.page_count > 0
+    assert stats.size == stats.page_count * stats.page_size
+    assert stats.fts_segments > 0
+    assert stats.fts_size > 0
+    assert stats.tags == len(dal.get_all_tags())
+
+
+def test_fts_optimize_merge(dal):
+    for i in range(3):  # one segment per transaction
+        dal.update_tags([1], tags=[f"x{i}"])
+    assert dal.get_db_stats().fts_segments > 1
+
+    assert dal.fts_merge(pages=-100)
+    dal.fts_optimize()
+    assert dal.get_db_stats().fts_segments == 1
+    assert not dal.fts_merge(pages=100)
+    assert len(dal.search_bookmarks("xxxxx")) > 0
+
+
+def test_fts_config(dal):
+    assert dal.get_fts_config() == {"automerge": 4, "crisismerge": 16, "usermerge": 4}
+    dal.set_fts_config("automerge", 8)
+    assert dal.get_fts_config()["automerge"] == 8
+    with pytest.raises(ValueError):
+        dal.set_fts_config("pgsz", 100)
+
+
+def test_fts_integrity_check_rebuild(dal):
+    assert dal.fts_integrity_check() == []
+    bm = dal.get_bookmark_by_id(id_=1)
+    dal.conn.connection.execute(
+        "insert into bookmarks_fts (bookmarks_fts, rowid, URL, metadata, tags, desc)"
+        " values ('delete', ?, ?, ?, ?, ?)",
+        (bm.id, bm.URL, bm.metadata, bm.tags, bm.desc),
+    )
+    assert len(dal.fts_integrity_check()) == 1
+
+    progress = []
+    assert dal.fts_rebuild(chunk_size=3, on_progress=progress.append) == 10
+    assert progress == [3, 3, 3, 1]
+    assert dal.fts_integrity_check() == []
+    assert bm.id in [row.id for row in dal.search_bookmarks(f'"{bm.URL}"')]
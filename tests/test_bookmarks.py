@@ -6,6 +6,7 @@ from twbm.bookmarks import (
     match_all_tags,
     match_any_tag,
     match_exact_tags,
+    normalize_tag_string,
     parse_tags,
 )
 
@@ -51,6 +52,47 @@ class TestBookmarks:
         assert len(bms) == result
 
 
+@pytest.mark.parametrize(
+    ("fts_query", "tags_all", "tags_all_not", "tags_any", "tags_any_not", "tags_exact"),
+    (
+        ("", "aaa", None, None, None, None),
+        ("", "aaa,bbb", None, None, "ccc", None),
+        ("", None, "aaa,bbb", None, None, None),
+        ("", None, None, "xxx,bbb", None, None),
+        ("", None, None, None, "xxx,bbb", None),
+        ("", "aaa", "bbb,ccc", "bbb,xxx", "yyy", None),
+        ("", None, None, None, None, ""),
+        ("", None, None, None, None, "ccc,xxx,yyy"),
+        ("", ",", ",", ",", ",", None),
+        ("aaa", "bbb", None, None, "ccc", None),
+        ("bla", None, None, "aaa", None, None),
+        ("nice", None, None, None, None, "aaa,bbb"),
+    ),
+)
+@pytest.mark.parametrize("db", ("dal", "legacy_dal"))  # legacy_dal: no bookmark_tags
+def test_filter_sql_matches_python(
+    request, db, fts_query, tags_all, tags_all_not, tags_any, tags_any_not, tags_exact
+):
+    dal = request.getfixturevalue(db)
+    bms = [bm for bm in dal.get_bookmarks(fts_query=fts_query) if bm.id is not None]
+    if tags_exact is not None:
+        bms = Bookmarks.match_exact(normalize_tag_string(tags_exact), bms)
+    else:
+        if tags_all is not None:
+            bms = Bookmarks.match_all(normalize_tag_string(tags_all), bms)
+        if tags_any is not None:
+            bms = Bookmarks.match_any(normalize_tag_string(tags_any), bms)
+        if tags_any_not is not None:
+            bms = Bookmarks.match_any(normalize_tag_string(tags_any_not), bms, not_=True)
+        if tags_all_not is not None:
+            bms = Bookmarks.match_all(normalize_tag_string(tags_all_not), bms, not_=True)
+
+    filtered = Bookmarks(fts_query=fts_query).filter(
+        tags_all, tags_all_not, tags_any, tags_any_not, tags_exact
+    )
+    assert sorted(bm.id for bm in filtered) == sorted(bm.id for bm in bms)
+
+
 @pytest.mark.parametrize(
     ("tags", "result"),
     (
@@ -1,5 +1,9 @@
+import re
+
 import pytest
 from twbm import app
+from twbm.db.connection import close_all, get_dbapi_connections
+from twbm.environment import config
 from typer.testing import CliRunner
 
 runner = CliRunner()
@@ -12,6 +16,9 @@ class TestSearch:
         assert result.exit_code == 0
         assert "Index 4 deleted" in result.stdout
         assert "Index 3 deleted" in result.stdout
+        bms = {bm.id: bm.URL for bm in dal.get_bookmarks(fts_query="")}
+        assert sorted(bms) == list(range(1, 9))  # compacted: 9 -> 3, 10 -> 4
+        assert bms[3] == "$HOME/dev/py/twbm/tests/tests_data/test.pptx"
 
     def test_search_p(self, dal):
         result = runner.invoke(app, ["search", "-v"], input="p 1 2\n")
@@ -20,7 +27,7 @@ class TestSearch:
         assert "xxxxx" in result.stdout
 
     def test_edit_all(self, mocker, dal):
-        mocked = mocker.patch("twbm.twb.BukuDb.edit_update_rec")
+        mocked = mocker.patch("twbm.buku.BukuDb.edit_update_rec")
         result = runner.invoke(app, ["search", "-v"], input="e\n")
         print(result.stdout)
 
@@ -52,6 +59,14 @@ class TestSearch:
         assert result.exit_code == 0
         print(result.stdout)
 
+    def test_search_limit_offset(self, dal):
+        result = CliRunner(mix_stderr=False).invoke(
+            app, ["search", "--np", "--limit", "2", "--offset", "1"]
+        )
+        assert result.exit_code == 0
+        assert result.stdout == "2,3\n"
+        assert "Found: 2" in result.stderr
+
     def test_search_tags(self, dal):
         result = runner.invoke(app, ["search", "-v", "--np", "-t", "aaa,"])
         assert result.exit_code == 0
@@ -93,8 +108,33 @@ class TestManual:
 
 
 def test_delete(dal):
-    result = runner.invoke(app, ["delete", "-v", "6"])
+    urls = {bm.id: bm.URL for bm in dal.get_bookmarks(fts_query="")}
+    result = runner.invoke(app, ["delete", "-v"], input="6,2\n")  # piped ids
     print(result.stdout)
+    assert result.exit_code == 0
+    assert "Index 6 deleted" in result.stdout
+    assert "Index 2 deleted" in result.stdout
+
+    bms = {bm.id: bm.URL for bm in dal.get_bookmarks(fts_query="")}
+    assert sorted(bms) == list(range(1, 9))
+    assert (bms[2], bms[6]) == (urls[9], urls[10])  # gaps filled from the top
+    assert not {urls[2], urls[6]} & set(bms.values())
+
+
+def test_delete_stable_ids(dal, monkeypatch):
+    monkeypatch.setattr(config, "twbm_stable_ids", True)
+    ids = [bm.id for bm in dal.get_bookmarks(fts_query="")]
+    result = runner.invoke(app, ["search"], input="d 1 2\n")
+    print(result.stdout)
+    assert result.exit_code == 0
+    ids_ = [bm.id for bm in dal.get_bookmarks(fts_query="")]
+    assert len(ids_) == len(ids) - 2 and ids_[-1] == ids[-1]  # no compaction
+
+    result = runner.invoke(app, ["compact"])
+    print(result.stdout)
+    assert result.exit_code == 0
+    assert "-M- Compacted: 2 bookmarks moved." in result.stdout
+    assert [bm.id for bm in dal.get_bookmarks(fts_query="")] == ids[:-2]
 
 
 class TestAddUrl:
@@ -105,6 +145,12 @@ class TestAddUrl:
         print(result.stdout)
         assert result.exit_code == 0
 
+    def test_add_one_connection(self, dal):
+        close_all()  # every command starts in a fresh process
+        result = runner.invoke(app, ["add", "--title", "t", "https://x.org", "aaa"])
+        assert result.exit_code == 0
+        assert len(get_dbapi_connections()) == 1  # no read-only one for check_tags
+
     def test_add_with_new_tags_yes(self, dal):
         result = runner.invoke(
             app,
@@ -151,3 +197,73 @@ class TestTags:
         result = runner.invoke(app, ["tags", "-v", "xxx"])
         print(result.stdout)
         assert result.exit_code == 0
+
+    def test_tags_related_all(self, dal):
+        result = runner.invoke(app, ["tags", "bbb,ccc", "-k", "1"])
+        print(result.stdout)
+        assert result.exit_code == 0
+        assert result.stdout == "   2: ccc\n"
+
+
+class TestLegacyDb:
+    @pytest.mark.parametrize("order", ("-o", "-O"))
+    def test_search_order_by_age(self, legacy_dal, order):
+        result = runner.invoke(app, ["search", "--np", order, "bla"])
+        print(result.stdout)
+        assert result.exit_code == 0
+        assert "Found: 3" in result.stdout
+        assert len(re.findall(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d", result.stdout)) == 3
+
+    def test_search_tags(self, legacy_dal):
+        result = runner.invoke(app, ["search", "--np", "-t", "aaa,"])
+        assert result.exit_code == 0
+        assert "Found: 4" in result.stdout
+
+    def test_tags(self, legacy_dal):
+        result = runner.invoke(app, ["tags", "ccc"])
+        assert result.exit_code == 0
+        assert result.stdout.startswith("   3: ccc\n")
+
+    def test_add_with_new_tags_no(self, legacy_dal):
+        result = runner.invoke(
+            app, ["add", "--title", "t", "https://www.google.com", "aaa,pa"], input="n\n"
+        )
+        assert "Create unknown_tags=['pa']" in result.stdout
+        assert result.exit_code == 1
+
+
+class TestStats:
+    def test_stats(self, dal):
+        result = runner.invoke(app, ["stats", "-n", "3", "-k", "2"])
+        print(result.stdout)
+        assert result.exit_code == 0
+        assert "Bookmarks:      10" in result.stdout
+        assert "Top tags:       bbb (" in result.stdout
+        assert "fts + tag bbb" in result.stdout
+
+    def test_stats_no_probes(self, dal):
+        result = runner.invoke(app, ["stats", "-n", "0"])
+        assert result.exit_code == 0
+        assert "Probe queries" not in result.stdout
+
+
+class TestFts:
+    def test_fts_integrity_check(self, dal):
+        result = runner.invoke(app, ["fts", "integrity-check"])
+        assert result.exit_code == 0
+        assert "FTS index ok" in result.stdout
+
+    def test_fts_rebuild(self, dal):
+        result = runner.invoke(app, ["fts", "rebuild", "-c", "3"])
+        assert result.exit_code == 0
+        assert "Rebuilt: 10 bookmarks indexed" in result.stdout
+
+    def test_fts_merge(self, dal):
+        result = runner.invoke(app, ["fts", "merge", "-a", "-s", "0"])
+        assert result.exit_code == 0
+        assert "nothing to merge" in result.stdout
+
+    def test_fts_config(self, dal):
+        result = runner.invoke(app, ["fts", "config", "--crisismerge", "8"])
+        assert result.exit_code == 0
+        assert "crisismerge: 8" in result.stdout
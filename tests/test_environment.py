@@ -3,3 +3,15 @@ from twbm.environment import config
 
 def test_env():
     assert config.dbfile == "tests/tests_data/bm_test.db"
+
+
+def test_pragmas(monkeypatch):
+    assert config.pragmas() == {}
+    monkeypatch.setattr(config, "twbm_pragma_profile", "safe")
+    monkeypatch.setattr(config, "twbm_cache_size", -2000)
+    assert config.pragmas() == {
+        "journal_mode": "wal",
+        "synchronous": "full",
+        "busy_timeout": 5000,
+        "cache_size": -2000,
+    }
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+from twbm import buku
+from twbm.buku import BukuDb
+from twbm.environment import config
+from twbm.fetch import fetch_all, host_of
+
+
+def test_host_of():
+    assert host_of("https://WWW.Example.com:8080/x?y") == "www.example.com"
+    assert host_of("not a url") == ""
+
+
+def test_fetch_all_limits():
+    lock = threading.Lock()
+    in_flight: Counter = Counter()
+    max_per_host: Counter = Counter()
+    max_total = 0
+
+    def fetch(url):
+        nonlocal max_total
+        host = host_of(url)
+        with lock:
+            in_flight[host] += 1
+            max_per_host[host] = max(max_per_host[host], in_flight[host])
+            max_total = max(max_total, sum(in_flight.values()))
+        time.sleep(0.01)
+        with lock:
+            in_flight[host] -= 1
+        return url.upper()
+
+    jobs = [(i, f"http://host{i % 5}.example.com/{i}") for i in range(100)]
+    results = dict(fetch_all(jobs, fetch, concurrency=8, per_host=2))
+
+    assert results == {i: url.upper() for i, url in jobs}
+    assert max(max_per_host.values()) == 2
+    assert max_total == 8
+
+
+def test_fetch_all_close_cancels():
+    started = []
+
+    def fetch(url):
+        started.append(url)
+        time.sleep(0.01)
+        return url
+
+    jobs = [(i, f"http://a.example.com/{i}") for i in range(100)]
+    for _ in fetch_all(jobs, fetch, concurrency=4, per_host=4):
+        break
+    assert len(started) < 100
+
+
+def test_fetch_all_invalid():
+    with pytest.raises(ValueError):
+        list(fetch_all([(1, "http://a.example.com")], str, concurrency=0))
+
+
+@pytest.mark.parametrize("processes", (0, 2))
+def test_refreshdb(tmp_path, http_server, monkeypatch, processes):
+    monkeypatch.setattr(buku, "PARSE_POOL_MIN", 0)
+    monkeypatch.setattr(config, "twbm_parse_processes", processes)
+    http_server.delay = 0.01
+    bukudb = BukuDb(dbfile=str(tmp_path / "bm.db"))
+    n = 40
+    for i in range(n):
+        bukudb.add_rec(f"{http_server.url}/page/{i}", title_in="old", fetch=False)
+
+    assert bukudb.refreshdb(0, threads=16)
+
+    recs = bukudb.get_rec_all()
+    assert [(r[2], r[4]) for r in recs] == [
+        (f"Page {i}", f"Description {i}") for i in range(n)
+    ]
+    assert http_server.requests == n
+    assert http_server.max_in_flight <= 4  # TWBM_HTTP_MAXSIZE, one host
+    assert http_server.connections <= 4  # kept alive across requests
+
+
+def test_shared_pool_manager(monkeypatch):
+    buku.clear_shared_PoolManagers()
+    manager = buku.get_shared_PoolManager()
+    assert buku.get_shared_PoolManager() is manager
+
+    monkeypatch.setattr(buku, "MYPROXY", "http://proxy.example.com:3128")
+    proxy_manager = buku.get_shared_PoolManager()
+    assert proxy_manager is not manager
+    assert proxy_manager.proxy.host == "proxy.example.com"
+    buku.clear_shared_PoolManagers()
+
+
+def test_network_handler_reuses_connections(http_server):
+    buku.clear_shared_PoolManagers()
+    for i in range(5):
+        title, desc, *_ = buku.network_handler(f"{http_server.url}/page/{i}")
+        assert (title, desc) == (f"Page {i}", f"Description {i}")
+
+    assert http_server.requests == 5
+    assert http_server.connections == 1
+
+
+def test_read_page_head(http_server):
+    http_server.body = "x" * 2_000_000
+    manager = buku.get_PoolManager()
+    resp = manager.request("GET", f"{http_server.url}/page/1", preload_content=False)
+    head = buku.read_page_head(resp, max_bytes=1_000_000, chunk_size=32)
+    buku.release_response(resp)
+    assert head.startswith(b"<html><head><title>Page 1</title>")
+    assert head.endswith(b"</head>")
+
+    resp = manager.request("GET", f"{http_server.url}/page/2", preload_content=False)
+    assert len(buku.read_page_head(resp, max_bytes=40)) == 40
+    buku.release_response(resp)
+
+
+def test_read_page_head_split_end_tag(http_server):
+    http_server.page = b"<html><head><title>x</title></head" + b" " * 50 + b">body"
+    manager = buku.get_PoolManager()
+    resp = manager.request("GET", f"{http_server.url}/page/1", preload_content=False)
+    head = buku.read_page_head(resp, max_bytes=1_000_000, chunk_size=16)
+    buku.release_response(resp)
+    assert head.endswith(b"</head" + b" " * 50 + b">")
+
+
+def test_network_handler_large_page(http_server):
+    http_server.body = "x" * 20_000_000
+    title, desc, *_ = buku.network_handler(f"{http_server.url}/page/1")
+    assert (title, desc) == ("Page 1", "Description 1")
+
+
+def test_network_handler_errors(http_server):
+    assert buku.network_handler("about:blank") == (None, None, None, 0, 1)
+    assert buku.network_handler(f"{http_server.url}/doc.pdf") == ("", "", "", 1, 0)
+    assert buku.network_handler("http://127.0.0.1:1/") == (None, None, None, 0, 0)
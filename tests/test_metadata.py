@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import pytest
+from twbm import buku
+from twbm.metadata import extract_metadata, sniff_charset
+
+PAGES = Path(__file__).parent / "tests_data" / "pages"
+CONTENT_TYPES = {"no_charset_header_only.html": "text/html; charset=utf-8"}
+
+
+class Response:
+    def __init__(self, data: bytes, content_type: str):
+        self.data = data
+        self.headers = {"content-type": content_type}
+
+
+def _page(name: str) -> Response:
+    return Response((PAGES / name).read_bytes(), CONTENT_TYPES.get(name, "text/html"))
+
+
+@pytest.mark.parametrize(
+    "name",
+    # title_in_body.html: upper case name="DESCRIPTION", only matched by the extractor
+    [p.name for p in sorted(PAGES.glob("*.html")) if p.name != "title_in_body.html"],
+)
+def test_same_as_beautifulsoup(name):
+    resp = _page(name)
+    charset = sniff_charset(resp.data, resp.headers["content-type"])
+    page = resp.data.decode(charset or "utf-8", errors="replace")
+    expected = buku.parse_decoded_page(page)
+    assert buku.get_data_from_page(resp) == expected
+
+
+def test_extract_metadata_latin1():
+    meta = extract_metadata(_page("latin1_http_equiv.html").data, "text/html")
+    assert meta.charset == "iso-8859-1"
+    assert meta.title == "Café Müller & Söhne - Startseite"
+    assert meta.description == "Kaffeerösterei in München, gegründet 1923."
+    assert meta.keywords == "Kaffee, Rösterei, München, Espresso, Bohnen"
+
+
+def test_extract_metadata_og():
+    meta = extract_metadata(_page("og_only.html").data)
+    assert meta.title == "Release notes for version 2.4"
+    assert meta.description.startswith("What is new: streaming fetch")
+    assert meta.og["title"] == "Release notes 2.4"
+    assert meta.og["url"] == "https://example.com/releases/2.4"
+
+
+def test_extract_metadata_description_precedence():
+    meta = extract_metadata(_page("large_head.html").data)
+    assert meta.title == "Dashboard | Example Analytics"
+    assert meta.description == "Traffic, conversions and retention at a glance."
+
+
+def test_extract_metadata_truncated():
+    meta = extract_metadata(b"<html><head><title>Cut  off\n title")
+    assert meta.title == "Cut off title"
+    assert meta.description is None
+
+
+def test_get_data_from_page_keywords_to_desc():
+    title, desc, keys = buku.get_data_from_page(_page("keywords_to_desc.html"))
+    assert title == "Tagged page"
+    assert desc.startswith("* this keyword string")
+    assert keys is None
+
+
+@pytest.mark.parametrize(
+    "data, content_type, expected",
+    (
+        (b'<meta charset="latin-1">', "text/html; charset=utf-8", "latin-1"),
+        (b"<title>x</title>", "text/html; charset=utf-8", "utf-8"),
+        (
+            b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">',
+            None,
+            "koi8-r",
+        ),
+        (b'<meta name="x" content="charset=bogus">', None, None),
+        (b"<title>x</title>", None, None),
+    ),
+)
+def test_sniff_charset(data, content_type, expected):
+    assert sniff_charset(data, content_type) == expected
+
+
+def test_unknown_charset():
+    meta = extract_metadata(b"<title>caf\xc3\xa9</title>", "text/html; charset=x-bogus")
+    assert meta.charset is None
+    assert meta.title == "café"
@@ -0,0 +1,49 @@
+"""Startup cost: modules imported by `twbm <command>` (python -X importtime)."""
+import os
+import subprocess
+import sys
+from typing import Dict, Sequence
+
+import pytest
+from twbm.environment import config
+
+# network, HTML, crypto: only for commands which fetch or encrypt
+LAZY_MODULES = ("twbm.buku", "urllib3", "bs4", "cryptography", "readline")
+
+
+def import_times(code: str, args: Sequence[str] = ()) -> Dict[str, int]:
+    """Modules imported by running code, with cumulative import time in us."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        env={**os.environ, "TWBM_DB_URL": config.twbm_db_url},
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def twbm_import_times(args: Sequence[str]) -> Dict[str, int]:
+    """Modules imported by `twbm <args>`, without the interpreter's own."""
+    baseline = import_times("pass")
+    times = import_times("from twbm import app; app()", args)
+    return {name: t for name, t in times.items() if name not in baseline}
+
+
+@pytest.mark.parametrize(
+    "args", (["--help"], ["show", "1"], ["tags"], ["search", "--np", "xxxxx"])
+)
+def test_lazy_imports(dal, args):
+    times = twbm_import_times(args)
+    assert "twbm.twb" in times
+    assert [m for m in LAZY_MODULES if m in times] == []
+
+
+def test_lazy_imports_twbuku():
+    times = import_times("import twbm")
+    assert [m for m in ("twbm.twb", *LAZY_MODULES) if m in times] == []
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+from twbm import app, buku, trace
+from twbm.environment import config
+from typer.testing import CliRunner
+
+
+@pytest.fixture()
+def tracer():
+    yield trace.enable()
+    trace.finish()
+
+
+def test_span_disabled():
+    assert not trace.enabled()
+    with trace.span("noop") as event:
+        assert event is None
+
+
+def test_span(tracer):
+    with trace.span("outer", n=1):
+        with trace.span("inner"):
+            pass
+
+    names = [e.name for e in tracer.events]
+    assert names == ["import", "inner", "outer"]
+    assert tracer.events[-1].args == {"n": 1}
+    assert tracer.events[-1].dur >= tracer.events[-2].dur
+
+
+def test_span_open_at_finish():
+    tracer = trace.enable()
+    with trace.span("open"):
+        trace.finish()
+
+    assert not trace.enabled()
+    assert tracer.events[-1].name == "open"
+
+
+def test_summary(tracer, capsys, dal):
+    with trace.span("phase"):
+        dal.get_bookmarks(fts_query="")
+
+    trace.finish()
+    err = capsys.readouterr().err
+    assert "phase" in err
+    assert "get_bookmarks_all" in err
+    assert "SQL statements: " in err
+
+
+def test_chrome_trace(tmp_path, dal):
+    path = tmp_path / "trace.json"
+    trace.enable(str(path))
+    dal.get_bookmarks(fts_query="xxxxx")
+    trace.finish()
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = {e["name"] for e in events if e["ph"] == "X"}
+    assert {"import", "get_bookmarks_fts"} <= spans
+    statements = [e["args"]["sql"] for e in events if e["ph"] == "i"]
+    assert any("bookmarks_fts match" in s for s in statements)
+
+
+def test_cli_trace(tmp_path, dal):
+    path = tmp_path / "trace.json"
+    result = CliRunner(mix_stderr=False).invoke(
+        app, ["--trace", str(path), "search", "--np", "-t", "aaa"]
+    )
+    assert result.exit_code == 0
+    assert not trace.enabled()
+
+    events = json.loads(path.read_text())["traceEvents"]
+    spans = {e["name"] for e in events if e["ph"] == "X"}
+    assert {"import", "filter", "search_bookmarks", "render"} <= spans
+
+
+def test_normalize_sql():
+    assert (
+        trace.normalize_sql("select *\n  from t where a = 'x''y' and id in (1, 2,3)")
+        == "select * from t where a = ? and id in (?, ...)"
+    )
+    assert trace.normalize_sql("select * from t1 where id in (?, ?)") == (
+        "select * from t1 where id in (?, ...)"
+    )
+
+
+def test_count_statements(dal):
+    with trace.count_statements() as counter:
+        for id_ in (1, 2, 3):
+            dal.get_bookmark_by_id(id_)
+
+    assert not trace.enabled()
+    assert counter.total == 3
+    ((sql, n),) = counter.counts.most_common(1)
+    assert n == 3
+    assert "where id = ?" in sql.lower()
+
+
+def test_count_statements_trigger_nested(dal):
+    with trace.count_statements() as counter:
+        dal.update_tags([1], tags=["xxx"])
+
+    assert counter.total == 3  # BEGIN, update, COMMIT
+    assert counter.nested > 0  # bookmark_tags, tag_counts, tag_pairs, FTS triggers
+
+
+def test_count_statements_n_plus_1(dal, caplog, monkeypatch):
+    # alembic's logging config in the dal fixture disables existing loggers
+    monkeypatch.setattr(logging.getLogger("twbm.trace"), "disabled", False)
+    with trace.count_statements(warn_threshold=2) as counter:
+        for id_ in (1, 2, 3, 4):
+            dal.get_bookmark_by_id(id_)
+
+    warnings = [r.message for r in caplog.records if "N+1" in r.message]
+    assert len(warnings) == 1
+    assert "dal.py" in warnings[0]  # innermost twbm frame: the query call
+    assert max(counter.counts.values()) == 4
+
+
+def test_count_statements_repeated(dal, caplog, monkeypatch):
+    monkeypatch.setattr(logging.getLogger("twbm.trace"), "disabled", False)
+    with trace.count_statements(warn_threshold=2) as counter:
+        for _ in range(4):
+            dal.get_bookmark_by_id(1)  # identical statement text every time
+
+    assert counter.total == 4 and counter.nested == 0
+    assert len([r for r in caplog.records if "N+1" in r.message]) == 1
+
+
+def test_cli_sql_stats(dal):
+    result = CliRunner(mix_stderr=False).invoke(
+        app, ["--sql-stats", "search", "--np", "-t", "aaa"]
+    )
+    assert result.exit_code == 0
+    assert "SQL statements: " in result.stderr
+
+
+def test_count_statements_bukudb(dal):
+    with trace.count_statements() as counter:
+        bdb = buku.BukuDb(dbfile=config.dbfile)
+        for id_ in (1, 2, 3):
+            bdb.get_rec_by_id(id_)
+
+    assert max(counter.counts.values()) == 3
+
+
+def test_twbuku_sql_stats(tmp_path):
+    script = "import sys; from twbm import main; sys.argv[0] = 'twbuku'; main()"
+    result = subprocess.run(
+        [sys.executable, "-c", script, "--db", str(tmp_path / "bm.db"), "-p", "1"],
+        env={**os.environ, "TWBM_SQL_STATS": "1"},
+        capture_output=True,
+        text=True,
+    )
+    assert "SQL statements: " in result.stderr
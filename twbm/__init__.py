@@ -1,5 +1,18 @@
-from twbm.buku import main
-from twbm.twb import app
+import time
 
 __version__ = "0.17.4"
+_import_start = time.perf_counter()  # start of the "import" span, see twbm.trace
 __all__ = ["main", "app"]
+
+
+def __getattr__(name):
+    """Import the CLI on first access: twbm does not need buku.main and vice versa."""
+    if name == "main":
+        from twbm.buku import main
+
+        return main
+    if name == "app":
+        from twbm.twb import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,51 +1,46 @@
 import logging
-from typing import Sequence
+from typing import Optional, Sequence
 
-from twbm.db.dal import DAL, Bookmark
+from twbm import trace
+from twbm.db.dal import DAL, BookmarkRow
 from twbm.environment import config
 
 _log = logging.getLogger(__name__)
 
 
 class Bookmarks:
-    bms: Sequence[Bookmark]
-
     def __init__(self, fts_query: str):
         self.fts_query = fts_query
+        self._bms: Optional[Sequence[BookmarkRow]] = None
 
-        with DAL(env_config=config) as dal:
-            self.bms = dal.get_bookmarks(fts_query=fts_query)
-        _ = None
+    @property
+    def bms(self) -> Sequence[BookmarkRow]:
+        """All FTS matches, loaded on first access: use filter() to narrow in SQL."""
+        if self._bms is None:
+            with DAL(env_config=config, read_only=True) as dal:
+                self._bms = dal.get_bookmarks(fts_query=self.fts_query)
+        return self._bms
 
     @staticmethod
     def match_all(
-        tags: Sequence[str], bms: Sequence[Bookmark], not_: bool = False
-    ) -> Sequence[Bookmark]:
-        if not_:
-            filtered = [bm for bm in bms if not match_all_tags(tags, bm.split_tags)]
-        else:
-            filtered = [bm for bm in bms if match_all_tags(tags, bm.split_tags)]
-        return filtered
+        tags: Sequence[str], bms: Sequence[BookmarkRow], not_: bool = False
+    ) -> Sequence[BookmarkRow]:
+        tags_ = frozenset(tags)
+        return [bm for bm in bms if (tags_ <= bm.tag_set) != not_]
 
     @staticmethod
     def match_any(
-        tags: Sequence[str], bms: Sequence[Bookmark], not_: bool = False
-    ) -> Sequence[Bookmark]:
-        if not_:
-            filtered = [bm for bm in bms if not match_any_tag(tags, bm.split_tags)]
-        else:
-            filtered = [bm for bm in bms if match_any_tag(tags, bm.split_tags)]
-        return filtered
+        tags: Sequence[str], bms: Sequence[BookmarkRow], not_: bool = False
+    ) -> Sequence[BookmarkRow]:
+        tags_ = frozenset(tags)
+        return [bm for bm in bms if (not tags_.isdisjoint(bm.tag_set)) != not_]
 
     @staticmethod
     def match_exact(
-        tags: Sequence[str], bms: Sequence[Bookmark], not_: bool = False
-    ) -> Sequence[Bookmark]:
-        if not_:
-            filtered = [bm for bm in bms if not match_exact_tags(tags, bm.split_tags)]
-        else:
-            filtered = [bm for bm in bms if match_exact_tags(tags, bm.split_tags)]
-        return filtered
+        tags: Sequence[str], bms: Sequence[BookmarkRow], not_: bool = False
+    ) -> Sequence[BookmarkRow]:
+        tags_ = frozenset(tags)
+        return [bm for bm in bms if (tags_ == bm.tag_set) != not_]
 
     def filter(
         self,
@@ -54,31 +49,28 @@ class Bookmarks:
         tags_any: str = None,
         tags_any_not: str = None,
         tags_exact: str = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
     ):
-        tags_all_ = normalize_tag_string(tags_all)
-        tags_any_ = normalize_tag_string(tags_any)
-        tags_all_not_ = normalize_tag_string(tags_all_not)
-        tags_any_not_ = normalize_tag_string(tags_any_not)
-        tags_exact_ = normalize_tag_string(tags_exact)
-
-        # 0. over-rule
-        if tags_exact is not None:
-            self.bms = Bookmarks.match_exact(tags_exact_, self.bms)
-        else:
-            # 1. select viable
-            if tags_all is not None:
-                self.bms = Bookmarks.match_all(tags_all_, self.bms)
-
-            if tags_any is not None:
-                self.bms = Bookmarks.match_any(tags_any_, self.bms)
-
-            # 2. narrow down
-            if tags_any_not is not None:
-                self.bms = Bookmarks.match_any(tags_any_not_, self.bms, not_=True)
-
-            if tags_all_not is not None:
-                self.bms = Bookmarks.match_all(tags_all_not_, self.bms, not_=True)
-        return self.bms
+        """Tag filters and FTS query compiled into one SQL query.
+
+        Same semantics as chaining match_exact (over-ruling), match_all,
+        match_any and their negations on all FTS matches. FTS matches come in
+        order of rank, without FTS query in order of id: limit and offset page
+        through that order.
+        """
+        with trace.span("filter"), DAL(env_config=config, read_only=True) as dal:
+            self._bms = dal.search_bookmarks(
+                self.fts_query,
+                tags_all=normalize_tag_option(tags_all),
+                tags_all_not=normalize_tag_option(tags_all_not),
+                tags_any=normalize_tag_option(tags_any),
+                tags_any_not=normalize_tag_option(tags_any_not),
+                tags_exact=normalize_tag_option(tags_exact),
+                limit=limit,
+                offset=offset,
+            )
+        return self._bms
 
 
 def clean_tags(raw_tags: Sequence[str]) -> Sequence[str]:
@@ -110,11 +102,19 @@ def match_any_tag(tags: Sequence, bm_tags: Sequence) -> bool:
 
 
 def check_tags(tags: Sequence[str]) -> Sequence[str]:
+    # read-write: `twbm add` writes on the same shared connection afterwards
     with DAL(env_config=config) as dal:
         all_tags = set([r[0] for r in dal.get_all_tags()])
         return sorted((set(tags) - all_tags))
 
 
+def normalize_tag_option(tag_string: str = None) -> Optional[Sequence[str]]:
+    """Like normalize_tag_string, but None if the option is not given."""
+    if tag_string is None:
+        return None
+    return normalize_tag_string(tag_string)
+
+
 def normalize_tag_string(tag_string: str = None) -> Sequence[str]:
     if tag_string is None:
         tags_ = tuple()
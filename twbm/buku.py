@@ -18,8 +18,8 @@
 # along with buku.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import atexit
 import calendar
-import cgi
 import codecs
 import collections
 import contextlib
@@ -46,17 +46,10 @@ from itertools import chain
 from subprocess import DEVNULL, PIPE, Popen
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-import urllib3
-from bs4 import BeautifulSoup
-from urllib3.exceptions import LocationParseError
-from urllib3.util import Retry, make_headers, parse_url
+import warnings
 
-# note catch ModuleNotFoundError instead Exception
-# when python3.5 not supported
-try:
-    import readline
-except Exception:
-    import pyreadline as readline  # type: ignore
+# urllib3, bs4, certifi and readline are imported where needed: they are not
+# used by most commands but cost most of the startup time.
 try:
     from mypy_extensions import TypedDict
 except ImportError:
@@ -131,6 +124,8 @@ USER_AGENT = (
 )
 MYHEADERS = None  # Default dictionary of headers
 MYPROXY = None  # Default proxy
+REFRESH_BATCH = 256  # refreshdb records per commit
+PARSE_POOL_MIN = 100  # refreshdb records worth starting parse processes for
 TEXT_BROWSERS = ["elinks", "links", "links2", "lynx", "w3m", "www-browser"]
 IGNORE_FF_BOOKMARK_FOLDERS = frozenset(["placesRoot", "bookmarksMenuFolder"])
 
@@ -150,11 +145,9 @@ LOGERR = LOGGER.error
 #
 #     CA_CERTS = certifi.where()
 if os.path.isfile("/etc/ssl/certs/ca-certificates.crt"):
-    CA_CERTS = "/etc/ssl/certs/ca-certificates.crt"
+    CA_CERTS: Optional[str] = "/etc/ssl/certs/ca-certificates.crt"
 else:
-    import certifi
-
-    CA_CERTS = certifi.where()
+    CA_CERTS = None  # certifi bundle, see get_ca_certs()
 
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS "main"."bookmarks" (
@@ -171,7 +164,7 @@ CREATE TABLE IF NOT EXISTS "main"."bookmarks" (
 create_trigger_sql = """
 CREATE TRIGGER IF NOT EXISTS [UpdateLastTime]
     AFTER
-    UPDATE
+    UPDATE OF URL, metadata, tags, "desc", flags
     ON bookmarks
     FOR EACH ROW
     WHEN NEW.last_update_ts <= OLD.last_update_ts
@@ -456,6 +449,7 @@ class BukuDb:
         chatty: Optional[bool] = False,
         dbfile: Optional[str] = None,
         colorize: Optional[bool] = True,
+        conn: Optional[sqlite3.Connection] = None,
     ) -> None:
         """Database initialization API.
 
@@ -471,13 +465,23 @@ class BukuDb:
             Sets the verbosity of the APIs. Default is False.
         colorize : bool, optional
             Indicates whether color should be used in output. Default is True.
+        conn : sqlite3.Connection, optional
+            Existing connection to reuse instead of opening dbfile.
+            Default is None.
         """
 
         self.json = json
         self.field_filter = field_filter
         self.chatty = chatty
         self.colorize = colorize
-        self.conn, self.cur = BukuDb.initdb(dbfile, self.chatty)
+        self.conn, self.cur = BukuDb.initdb(dbfile, self.chatty, conn)
+        self._tables: Dict[str, bool] = {}
+        if conn is not None:
+            from twbm.db.connection import table_cache
+
+            self._tables = table_cache(conn)  # checked once per shared connection
+        self.tag_index = self.has_table("bookmark_tags")
+        self.tag_counts = self.has_table("tag_counts")
 
     @staticmethod
     def get_default_dbdir():
@@ -510,7 +514,9 @@ class BukuDb:
 
     @staticmethod
     def initdb(
-        dbfile: Optional[str] = None, chatty: Optional[bool] = False
+        dbfile: Optional[str] = None,
+        chatty: Optional[bool] = False,
+        conn: Optional[sqlite3.Connection] = None,
     ) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
         """Initialize the database connection.
 
@@ -523,6 +529,9 @@ class BukuDb:
             Custom database file path (including filename).
         chatty : bool
             If True, shows informative message on DB creation.
+        conn : sqlite3.Connection, optional
+            Existing connection to reuse, dbfile is ignored then.
+            Its schema is not touched: no table or trigger creation.
 
         Returns
         -------
@@ -530,56 +539,86 @@ class BukuDb:
             (connection, cursor).
         """
 
-        if not dbfile:
-            dbpath = BukuDb.get_default_dbdir()
-            filename = "bookmarks.db"
-            dbfile = os.path.join(dbpath, filename)
-        else:
-            dbfile = os.path.abspath(dbfile)
-            dbpath, filename = os.path.split(dbfile)
+        if conn is None:
+            if not dbfile:
+                dbpath = BukuDb.get_default_dbdir()
+                filename = "bookmarks.db"
+                dbfile = os.path.join(dbpath, filename)
+            else:
+                dbfile = os.path.abspath(dbfile)
+                dbpath, filename = os.path.split(dbfile)
 
-        try:
-            if not os.path.exists(dbpath):
-                os.makedirs(dbpath)
-        except Exception as e:
-            LOGERR(e)
-            os._exit(1)
+            try:
+                if not os.path.exists(dbpath):
+                    os.makedirs(dbpath)
+            except Exception as e:
+                LOGERR(e)
+                os._exit(1)
 
-        db_exists = os.path.exists(dbfile)
-        enc_exists = os.path.exists(dbfile + ".enc")
+            db_exists = os.path.exists(dbfile)
+            enc_exists = os.path.exists(dbfile + ".enc")
 
-        if db_exists and not enc_exists:
-            pass
-        elif enc_exists and not db_exists:
-            LOGERR("Unlock database first")
-            sys.exit(1)
-        elif db_exists and enc_exists:
-            LOGERR("Both encrypted and flat DB files exist!")
-            sys.exit(1)
-        elif chatty:
-            # not db_exists and not enc_exists
-            print("DB file is being created at %s.\nYou should encrypt it." % dbfile)
+            if db_exists and not enc_exists:
+                pass
+            elif enc_exists and not db_exists:
+                LOGERR("Unlock database first")
+                sys.exit(1)
+            elif db_exists and enc_exists:
+                LOGERR("Both encrypted and flat DB files exist!")
+                sys.exit(1)
+            elif chatty:
+                # not db_exists and not enc_exists
+                print("DB file is being created at %s.\nYou should encrypt it." % dbfile)
 
         try:
-            # Create a connection
-            conn = sqlite3.connect(dbfile, check_same_thread=False)
+            # Create a connection, unless an existing one is reused
+            if conn is None:
+                from twbm.db.pragmas import apply_pragmas
+                from twbm.environment import config
+
+                conn = sqlite3.connect(dbfile, check_same_thread=False)
+                apply_pragmas(conn, config.pragmas())
+                # Create table if it doesn't exist
+                # flags: designed to be extended in future using bitwise masks
+                # Masks:
+                #     0b00000001: set title immutable
+                # queries.create_db(conn)
+                conn.execute(create_table_sql)
+                conn.execute(create_trigger_sql)
+                conn.commit()
+            # a reused connection is twbm's: schema managed by alembic, no DDL
             conn.create_function("REGEXP", 2, regexp)
-            cur = conn.cursor()
+            from twbm import trace
 
-            # Create table if it doesn't exist
-            # flags: designed to be extended in future using bitwise masks
-            # Masks:
-            #     0b00000001: set title immutable
-            # queries.create_db(conn)
-            conn.execute(create_table_sql)
-            conn.execute(create_trigger_sql)
-            conn.commit()
+            trace.watch(conn)  # TWBM_SQL_STATS, TWBM_TRACE
+            cur = conn.cursor()
         except Exception as e:
             LOGERR("initdb(): %s", e)
             sys.exit(1)
 
         return (conn, cur)
 
+    def has_table(self, name: str) -> bool:
+        """Check for optional tables of twbm databases, e.g. the tag index.
+
+        Parameters
+        ----------
+        name : str
+            Table name, e.g. bookmark_tags or tag_counts.
+
+        Returns
+        -------
+        bool
+            True if the table exists.
+        """
+
+        if name not in self._tables:
+            self.cur.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+            )
+            self._tables[name] = self.cur.fetchone() is not None
+        return self._tables[name]
+
     def get_rec_all(self):
         """Get all the bookmarks in the database.
 
@@ -875,7 +914,7 @@ class BukuDb:
         tags_in: Optional[str] = None,
         desc: Optional[str] = None,
         immutable: Optional[int] = -1,
-        threads: int = 4,
+        threads: int = 256,
     ) -> bool:
         """Update an existing record at index.
 
@@ -899,7 +938,7 @@ class BukuDb:
         immutable : int, optional
             Disable title fetch from web if 1. Default is -1.
         threads : int, optional
-            Number of threads to use to refresh full DB. Default is 4.
+            Number of concurrent fetches to refresh full DB. Default is 256.
 
         Returns
         -------
@@ -1058,7 +1097,10 @@ class BukuDb:
         index : int
             DB index of record to update. 0 indicates all records.
         threads: int
-            Number of threads to use to refresh full DB. Default is 4.
+            Number of concurrent fetches to refresh full DB, at most
+            TWBM_HTTP_MAXSIZE per host. Pages are parsed in
+            TWBM_PARSE_PROCESSES worker processes, results are written by the
+            calling thread in batches of REFRESH_BATCH.
         """
 
         if index == 0:
@@ -1086,9 +1128,6 @@ class BukuDb:
             blank_url_str = "Index %d: No title\n"
             success_str = "Title: [%s]\nIndex %d: updated\n"
 
-        done = {"value": 0}  # count threads completed
-        processed = {"value": 0}  # count number of records processed
-
         # An additional call to generate default headers
         # gen_headers() is called within network_handler()
         # However, this initial call to setup headers
@@ -1097,109 +1136,71 @@ class BukuDb:
         if not MYHEADERS:
             gen_headers()
 
-        cond = threading.Condition()
-        cond.acquire()
+        from twbm.environment import config
 
-        def refresh(count, cond):
-            """Inner function to fetch titles and update records.
+        processes = config.twbm_parse_processes
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if recs < PARSE_POOL_MIN:
+            processes = 0  # starting the processes takes longer
 
-            Parameters
-            ----------
-            count : int
-                Dummy input to adhere to convention.
-            cond : threading condition object.
-            """
+        # immutable title: HTTP HEAD only
+        head_only = {row[1]: bool(row[2] & 1) for row in resultset}
+        jobs = [(row[0], row[1]) for row in resultset]
 
-            count = 0
-
-            while True:
-                query = "UPDATE bookmarks SET"
-                arguments = []
-
-                cond.acquire()
-                if resultset:
-                    row = resultset.pop()
-                else:
-                    cond.release()
-                    break
-                cond.release()
-
-                title, desc, tags, mime, bad = network_handler(row[1], row[2] & 1)
-                count += 1
-
-                cond.acquire()
+        query = (
+            "UPDATE bookmarks SET metadata = coalesce(?, metadata),"
+            " desc = coalesce(?, desc) WHERE id = ?"
+        )
+        batch = []
+        processed = 0
+        try:
+            for id_, (title, desc, tags, mime, bad) in fetch_pages(
+                jobs, head_only, concurrency=threads, processes=processes
+            ):
+                processed += 1
 
                 if bad:
-                    print(bad_url_str % row[0])
-                    cond.release()
+                    print(bad_url_str % id_)
                     continue
 
                 if mime:
                     if self.chatty:
-                        print(mime_str % row[0])
-                    cond.release()
+                        print(mime_str % id_)
                     continue
 
-                to_update = False
-
-                if not title or title == "":
-                    LOGERR(blank_url_str, row[0])
-                else:
-                    query += " metadata = ?,"
-                    arguments += (title,)
-                    to_update = True
-
-                if desc:
-                    query += " desc = ?,"
-                    arguments += (desc,)
-                    to_update = True
-
-                if not to_update:
-                    cond.release()
+                if not title:
+                    LOGERR(blank_url_str, id_)
+                    title = None
+                if not title and not desc:
                     continue
 
-                query = query[:-1] + " WHERE id = ?"
-                arguments += (row[0],)
-                LOGDBG('refreshdb query: "%s", args: %s', query, arguments)
-
-                self.cur.execute(query, arguments)
-
-                # Save after fetching 32 titles per thread
-                if count & 0b11111 == 0:
-                    self.conn.commit()
+                batch.append((title, desc or None, id_))
+                if self.chatty and title:
+                    print(success_str % (title, id_))
 
-                if self.chatty:
-                    print(success_str % (title, row[0]))
-                cond.release()
+                if len(batch) == REFRESH_BATCH:
+                    self._update_metadata(query, batch)
 
                 if INTERRUPTED:
                     break
-
-            LOGDBG("Thread %d: processed %d", threading.get_ident(), count)
-            with cond:
-                done["value"] += 1
-                processed["value"] += count
-                cond.notify()
-
-        if recs < threads:
-            threads = recs
-
-        for i in range(threads):
-            thread = threading.Thread(target=refresh, args=(i, cond))
-            thread.start()
-
-        while done["value"] < threads:
-            cond.wait()
-            LOGDBG("%d threads completed", done["value"])
+        finally:
+            self._update_metadata(query, batch)
 
         # Guard: records found == total records processed
-        if recs != processed["value"]:
-            LOGERR("Records: %d, processed: %d !!!", recs, processed["value"])
+        if recs != processed and not INTERRUPTED:
+            LOGERR("Records: %d, processed: %d !!!", recs, processed)
 
-        cond.release()
-        self.conn.commit()
         return True
 
+    def _update_metadata(self, query: str, batch: List[tuple]) -> None:
+        """Write and commit a batch of refreshed (title, desc, id), then clear it."""
+        if batch:
+            LOGDBG('refreshdb query: "%s", %d records', query, len(batch))
+            self.cur.executemany(query, batch)
+            self.conn.commit()
+            batch.clear()
+
     def edit_update_rec(self, index, immutable=-1):
         """Edit in editor and update a record.
 
@@ -1471,7 +1472,11 @@ class BukuDb:
         LOGDBG("search_operator: %s", search_operator)
         LOGDBG("excluded_tags: %s", excluded_tags)
 
-        if search_operator == "AND":
+        if self.tag_index and all(tag.strip(DELIM) for tag in tags_):
+            query, tags_ = self._search_by_tag_index(
+                tags_, search_operator, excluded_tags
+            )
+        elif search_operator == "AND":
             query = (
                 "SELECT id, url, metadata, tags, desc, flags FROM bookmarks "
                 "WHERE tags LIKE '%' || ? || '%' "
@@ -1509,6 +1514,78 @@ class BukuDb:
         )
         return self.cur.fetchall()
 
+    def _tag_in(self, n: int) -> str:
+        """Condition on bookmark_tags.tag: one of n tags, ASCII case-insensitive
+        like the LIKE matching on bookmarks.tags.
+
+        With tag_counts the spellings are looked up among the distinct tags
+        first, so bookmark_tags is still searched by its tag index.
+
+        Parameters
+        ----------
+        n : int
+            Number of tags, i.e. query arguments.
+
+        Returns
+        -------
+        str
+            SQL condition.
+        """
+
+        placeholders = ", ".join("?" * n)
+        if self.tag_counts:
+            return (
+                "tag IN (SELECT tag FROM tag_counts "
+                "WHERE tag COLLATE NOCASE IN ({}))".format(placeholders)
+            )
+        return "tag COLLATE NOCASE IN ({})".format(placeholders)
+
+    def _search_by_tag_index(
+        self, tags_: List[str], search_operator: str, excluded_tags: Optional[str]
+    ) -> Tuple[str, List[str]]:
+        """Build the search_by_tag() query on the bookmark_tags index.
+
+        Parameters
+        ----------
+        tags_ : list
+            DELIM wrapped tags to search for.
+        search_operator : str
+            'AND' to match all tags, 'OR' to match any tag.
+        excluded_tags : str or None
+            Regex of tags to exclude.
+
+        Returns
+        -------
+        tuple
+            (query, query arguments).
+        """
+
+        args = [tag.strip(DELIM) for tag in tags_]
+        tag_in = self._tag_in(len(args))
+        if search_operator == "AND":
+            query = (
+                "SELECT id, url, metadata, tags, desc, flags FROM bookmarks "
+                "WHERE id IN (SELECT bookmark_id FROM bookmark_tags WHERE {} "
+                "GROUP BY bookmark_id HAVING COUNT(DISTINCT lower(tag)) = {}) ".format(
+                    tag_in, len({arg.lower() for arg in args})
+                )
+            )
+            if excluded_tags:
+                args.append(excluded_tags)
+                query += "AND tags NOT REGEXP ? "
+            query += "ORDER BY id ASC"
+        else:
+            query = (
+                "SELECT id, url, metadata, tags, desc, flags FROM bookmarks "
+                "JOIN (SELECT bookmark_id, COUNT(*) AS score FROM bookmark_tags "
+                "WHERE {} GROUP BY bookmark_id) ON bookmark_id = id".format(tag_in)
+            )
+            if excluded_tags:
+                args.append(excluded_tags)
+                query += " WHERE tags NOT REGEXP ? "
+            query += " ORDER BY score DESC"
+        return query, args
+
     def search_keywords_and_filter_by_tags(
         self,
         keywords: List[str],
@@ -2001,6 +2078,10 @@ class BukuDb:
              dictionary of {tag: usage_count}).
         """
 
+        if self.tag_counts:
+            dic = dict(self.cur.execute("SELECT tag, n FROM tag_counts"))
+            return sorted(dic), dic
+
         tags = []
         unique_tags = []
         dic = {}
@@ -2042,20 +2123,32 @@ class BukuDb:
         if not len(tags):
             return tagstr
 
-        qry = "SELECT DISTINCT tags FROM bookmarks WHERE tags LIKE ?"
+        if self.tag_index:
+            qry = (
+                "SELECT DISTINCT tags FROM bookmarks WHERE id IN "
+                "(SELECT bookmark_id FROM bookmark_tags WHERE {})".format(
+                    self._tag_in(1)
+                )
+            )
+        else:
+            qry = "SELECT DISTINCT tags FROM bookmarks WHERE tags LIKE ?"
         tagset = set()
         for tag in tags:
             if tag == "":
                 continue
 
-            self.cur.execute(qry, ("%" + delim_wrap(tag) + "%",))
+            if self.tag_index:
+                self.cur.execute(qry, (tag,))
+            else:
+                self.cur.execute(qry, ("%" + delim_wrap(tag) + "%",))
             results = self.cur.fetchall()
             for row in results:
                 # update tagset with unique tags in row
                 tagset |= set(row[0].strip(DELIM).split(DELIM))
 
-        # remove user supplied tags from tagset
-        tagset.difference_update(tags)
+        # remove user supplied tags from tagset, case-insensitive like the lookup
+        lowered = {tag.lower() for tag in tags}
+        tagset = {tag for tag in tagset if tag.lower() not in lowered}
 
         if not len(tagset):
             return tagstr
@@ -2114,13 +2207,28 @@ class BukuDb:
             return self.delete_tag_at_index(0, orig)
 
         # Update bookmarks with original tag
-        query = "SELECT id, tags FROM bookmarks WHERE tags LIKE ?"
-        self.cur.execute(query, ("%" + orig + "%",))
+        if self.tag_index:
+            query = (
+                "SELECT id, tags FROM bookmarks WHERE id IN "
+                "(SELECT bookmark_id FROM bookmark_tags WHERE {})".format(
+                    self._tag_in(1)
+                )
+            )
+            self.cur.execute(query, (orig.strip(DELIM),))
+        else:
+            query = "SELECT id, tags FROM bookmarks WHERE tags LIKE ?"
+            self.cur.execute(query, ("%" + orig + "%",))
         results = self.cur.fetchall()
         if results:
             query = "UPDATE bookmarks SET tags = ? WHERE id = ?"
             for row in results:
-                tags = row[1].replace(orig, newtags)
+                # case-insensitive like the lookup
+                tags = re.sub(
+                    re.escape(orig),
+                    lambda _: newtags,
+                    row[1],
+                    flags=re.IGNORECASE | re.ASCII,
+                )
                 tags = parse_tags([tags])
                 self.cur.execute(
                     query,
@@ -2757,6 +2865,8 @@ class BukuDb:
                 return False
         else:
             try:
+                from bs4 import BeautifulSoup
+
                 with open(filepath, mode="r", encoding="utf-8") as infp:
                     soup = BeautifulSoup(infp, "html.parser")
             except ImportError:
@@ -2876,7 +2986,9 @@ class BukuDb:
         if MYPROXY is None:
             gen_headers()
 
-        ca_certs = os.getenv("BUKU_CA_CERTS", default=CA_CERTS)
+        import urllib3
+
+        ca_certs = os.getenv("BUKU_CA_CERTS", default=get_ca_certs())
         if MYPROXY:
             manager = urllib3.ProxyManager(
                 MYPROXY,
@@ -3687,6 +3799,8 @@ def is_bad_url(url):
     bool
         True if URL is malformed, False otherwise.
     """
+    from urllib3.exceptions import LocationParseError
+    from urllib3.util import parse_url
 
     # Get the netloc token
     try:
@@ -3806,6 +3920,8 @@ def parse_decoded_page(page):
         (title, description, keywords).
     """
 
+    from bs4 import BeautifulSoup
+
     title = None
     desc = None
     keys = None
@@ -3847,15 +3963,7 @@ def parse_decoded_page(page):
         if keywords:
             keys = keywords.get("content").strip().replace("\n", " ")
             keys = re.sub(r"\s{2,}", " ", keys)
-            if is_unusual_tag(keys):
-                if keys not in (title, desc):
-                    LOGDBG("keywords to description: %s", keys)
-                    if desc:
-                        desc = desc + "\n## " + keys
-                    else:
-                        desc = "* " + keys
-
-                keys = None
+            desc, keys = merge_keywords(title, desc, keys)
     except Exception as e:
         LOGDBG(e)
 
@@ -3866,54 +3974,130 @@ def parse_decoded_page(page):
     return (title, desc, keys)
 
 
-def get_data_from_page(resp):
-    """Detect HTTP response encoding and invoke parser with decoded data.
+def merge_keywords(title, desc, keys):
+    """Move keywords which are no usable tags into the description.
+
+    Returns
+    -------
+    tuple
+        (description, keywords).
+    """
+    if keys and is_unusual_tag(keys):
+        if keys not in (title, desc):
+            LOGDBG("keywords to description: %s", keys)
+            if desc:
+                desc = desc + "\n## " + keys
+            else:
+                desc = "* " + keys
+
+        keys = None
+    return desc, keys
+
+
+_HEAD_END = re.compile(rb"</head\s*>", re.IGNORECASE)
+
+
+def read_page_head(resp, max_bytes: int, chunk_size: int = 16 * 1024) -> bytes:
+    """Read a streamed response up to and including </head>, at most max_bytes.
+
+    Title and meta tags are in the head: the rest of the page is not downloaded.
+    The caller releases resp, see release_response.
+
+    Parameters
+    ----------
+    resp : HTTP response
+        Response of a request with preload_content=False.
+    max_bytes : int
+        Stop reading after max_bytes (decoded), even without </head>.
+    chunk_size : int
+        Bytes per read. Default is 16 KiB.
+
+    Returns
+    -------
+    bytes
+        Page up to </head> or max_bytes.
+    """
+    data = bytearray()
+    for chunk in resp.stream(chunk_size):
+        # </head> may be split between chunks: search again from the last "<",
+        # a fixed lookback misses "</head" followed by whitespace
+        start = max(0, data.rfind(b"<"))
+        data += chunk
+        match = _HEAD_END.search(data, start)
+        if match:
+            del data[match.end() :]
+        if match or len(data) >= max_bytes:
+            break
+    return bytes(data[:max_bytes])
+
+
+def release_response(resp, max_drain: int = 64 * 1024) -> None:
+    """Return the connection of a streamed response to its pool.
+
+    A short unread rest of the body is drained, so the connection can be
+    reused. A long or chunked one is not worth it: the connection is closed.
+    """
+    remaining = resp.length_remaining
+    if remaining is not None and remaining <= max_drain:
+        resp.drain_conn()
+    else:
+        resp.close()
+    resp.release_conn()
+
+
+def get_data_from_page(resp, data: Optional[bytes] = None):
+    """Detect HTTP response encoding and extract the page metadata.
+
+    Single html.parser pass, see twbm.metadata. parse_decoded_page() is the
+    former BeautifulSoup based parser.
 
     Parameters
     ----------
     resp : HTTP response
         Response from GET request.
+    data : bytes, optional
+        Page, or its head, already read from resp. Default is resp.data.
 
     Returns
     -------
     tuple
         (title, description, keywords).
     """
+    if data is None:
+        data = resp.data
+    return parse_page(data, resp.headers.get("content-type"))
 
-    try:
-        soup = BeautifulSoup(resp.data, "html.parser")
-    except Exception as e:
-        LOGERR("get_data_from_page(): %s", e)
 
-    try:
-        charset = None
-
-        if soup.meta and soup.meta.get("charset") is not None:
-            charset = soup.meta.get("charset")
-        elif "content-type" in resp.headers:
-            _, params = cgi.parse_header(resp.headers["content-type"])
-            if params.get("charset") is not None:
-                charset = params.get("charset")
-
-        if not charset and soup:
-            meta_tag = soup.find("meta", attrs={"http-equiv": "Content-Type"})
-            if meta_tag:
-                _, params = cgi.parse_header(meta_tag.attrs["content"])
-                charset = params.get("charset", charset)
-
-        if charset:
-            LOGDBG("charset: %s", charset)
-            title, desc, keywords = parse_decoded_page(
-                resp.data.decode(charset, errors="replace")
-            )
-        else:
-            title, desc, keywords = parse_decoded_page(
-                resp.data.decode(errors="replace")
-            )
+def parse_page(data: bytes, content_type: Optional[str] = None):
+    """Extract title, description and keywords from a page, or its head.
+
+    CPU bound part of network_handler(): refreshdb runs it in worker processes.
+
+    Parameters
+    ----------
+    data : bytes
+        Page, or its head.
+    content_type : str, optional
+        Content-Type header of the response.
+
+    Returns
+    -------
+    tuple
+        (title, description, keywords).
+    """
+    from twbm.metadata import extract_metadata
 
-        return (title, desc, keywords)
+    try:
+        meta = extract_metadata(data, content_type)
+        LOGDBG("charset: %s", meta.charset)
+        desc, keys = merge_keywords(meta.title, meta.description, meta.keywords)
+
+        LOGDBG("title: %s", meta.title)
+        LOGDBG("desc : %s", desc)
+        LOGDBG("keys : %s", keys)
+        return (meta.title, desc, keys)
     except Exception as e:
-        LOGERR(e)
+        LOGERR("parse_page(): %s", e)
         return (None, None, None)
 
 
@@ -3932,6 +4116,8 @@ def gen_headers():
 
     MYPROXY = os.environ.get("https_proxy")
     if MYPROXY:
+        from urllib3.util import make_headers, parse_url
+
         try:
             url = parse_url(MYPROXY)
         except Exception as e:
@@ -3947,19 +4133,45 @@ def gen_headers():
         LOGDBG("proxy: [%s]", MYPROXY)
 
 
-def get_PoolManager():
+def get_ca_certs():
+    """Path of the default CA bundle: the system bundle or certifi's.
+
+    Returns
+    -------
+    str
+        CA_CERTS if the system bundle exists, certifi.where() otherwise.
+    """
+    if CA_CERTS is not None:
+        return CA_CERTS
+
+    import certifi
+
+    return certifi.where()
+
+
+def get_PoolManager(num_pools: int = 1, maxsize: int = 1):
     """Creates a pool manager with proxy support, if applicable.
 
+    Parameters
+    ----------
+    num_pools : int
+        Number of hosts with kept-alive connections. Default is 1.
+    maxsize : int
+        Connections kept alive per host. Default is 1.
+
     Returns
     -------
     ProxyManager or PoolManager
         ProxyManager if https_proxy is defined, PoolManager otherwise.
     """
-    ca_certs = os.getenv("BUKU_CA_CERTS", default=CA_CERTS)
+    import urllib3
+
+    ca_certs = os.getenv("BUKU_CA_CERTS", default=get_ca_certs())
     if MYPROXY:
         return urllib3.ProxyManager(
             MYPROXY,
-            num_pools=1,
+            num_pools=num_pools,
+            maxsize=maxsize,
             headers=MYHEADERS,
             timeout=15,
             cert_reqs="CERT_REQUIRED",
@@ -3967,7 +4179,8 @@ def get_PoolManager():
         )
 
     return urllib3.PoolManager(
-        num_pools=1,
+        num_pools=num_pools,
+        maxsize=maxsize,
         headers=MYHEADERS,
         timeout=15,
         cert_reqs="CERT_REQUIRED",
@@ -3975,8 +4188,46 @@ def get_PoolManager():
     )
 
 
+_POOL_MANAGERS: Dict[tuple, Any] = {}
+_POOL_MANAGERS_LOCK = threading.Lock()
+
+
+def get_shared_PoolManager():
+    """Process-lifetime pool manager for the current proxy settings.
+
+    Connections (TLS sessions, resolved addresses) are kept alive and reused
+    across fetches from the same host. Size: TWBM_HTTP_POOLS hosts with up to
+    TWBM_HTTP_MAXSIZE connections each.
+
+    Returns
+    -------
+    ProxyManager or PoolManager
+        Shared manager, never to be cleared by the caller.
+    """
+    from twbm.environment import config
+
+    key = (MYPROXY, tuple(sorted((MYHEADERS or {}).items())))
+    with _POOL_MANAGERS_LOCK:
+        manager = _POOL_MANAGERS.get(key)
+        if manager is None:
+            LOGDBG("New pool manager, proxy: %s", MYPROXY)
+            manager = get_PoolManager(
+                num_pools=config.twbm_http_pools, maxsize=config.twbm_http_maxsize
+            )
+            _POOL_MANAGERS[key] = manager
+    return manager
+
+
+def clear_shared_PoolManagers():
+    """Close all kept-alive connections, e.g. after a proxy change."""
+    with _POOL_MANAGERS_LOCK:
+        for manager in _POOL_MANAGERS.values():
+            manager.clear()
+        _POOL_MANAGERS.clear()
+
+
 def network_handler(
-    url: str, http_head: Optional[bool] = False
+    url: str, http_head: Optional[bool] = False, manager=None
 ) -> Tuple[Optional[str], Optional[str], Optional[str], int, int]:
     """Handle server connection and redirections.
 
@@ -3986,20 +4237,46 @@ def network_handler(
         URL to fetch.
     http_head : bool
         If True, send only HTTP HEAD request. Default is False.
+    manager : PoolManager, optional
+        Pool manager to use. Default: get_shared_PoolManager().
 
     Returns
     -------
     tuple
         (title, description, tags, recognized mime, bad url).
     """
+    data, content_type, mime, bad = fetch_page(url, http_head, manager)
+    if data:
+        return page_result(data, mime, bad, parse_page(data, content_type))
+    return page_result(data, mime, bad)
+
+
+def fetch_page(
+    url: str, http_head: Optional[bool] = False, manager=None
+) -> Tuple[Optional[bytes], Optional[str], int, int]:
+    """Fetch the head of a page: network part of network_handler().
+
+    Parameters
+    ----------
+    url : str
+        URL to fetch.
+    http_head : bool
+        If True, send only HTTP HEAD request. Default is False.
+    manager : PoolManager, optional
+        Pool manager to use. Default: get_shared_PoolManager().
+
+    Returns
+    -------
+    tuple
+        (page head, content type, recognized mime, bad url). The page head is
+        None on network errors and empty for HEAD requests and HTTP errors.
+    """
 
-    page_title = None
-    page_desc = None
-    page_keys = None
-    exception = False
+    data = b""
+    content_type = None
 
     if is_nongeneric_url(url) or is_bad_url(url):
-        return (None, None, None, 0, 1)
+        return (None, None, 0, 1)
 
     if is_ignored_mime(url) or http_head:
         method = "HEAD"
@@ -4009,47 +4286,139 @@ def network_handler(
     if not MYHEADERS:
         gen_headers()
 
+    from urllib3.util import Retry
+
     try:
-        manager = get_PoolManager()
+        if manager is None:
+            manager = get_shared_PoolManager()
 
         while True:
-            resp = manager.request(method, url, retries=Retry(redirect=10))
-
-            if resp.status == 200:
-                if method == "GET":
-                    page_title, page_desc, page_keys = get_data_from_page(resp)
-            elif resp.status == 403 and url.endswith("/"):
-                # HTTP response Forbidden
-                # Handle URLs in the form of https://www.domain.com/
-                # which fail when trying to fetch resource '/'
-                # retry without trailing '/'
-
-                LOGDBG("Received status 403: retrying...")
-                # Remove trailing /
-                url = url[:-1]
-                resp.close()
-                continue
-            else:
-                LOGERR("[%s] %s", resp.status, resp.reason)
-
-            if resp:
-                resp.close()
+            resp = manager.request(
+                method, url, retries=Retry(redirect=10), preload_content=False
+            )
 
+            try:
+                if resp.status == 200:
+                    if method == "GET":
+                        from twbm.environment import config
+
+                        data = read_page_head(resp, config.twbm_fetch_max_bytes)
+                        content_type = resp.headers.get("content-type")
+                elif resp.status == 403 and url.endswith("/"):
+                    # HTTP response Forbidden
+                    # Handle URLs in the form of https://www.domain.com/
+                    # which fail when trying to fetch resource '/'
+                    # retry without trailing '/'
+
+                    LOGDBG("Received status 403: retrying...")
+                    # Remove trailing /
+                    url = url[:-1]
+                    continue
+                else:
+                    LOGERR("[%s] %s", resp.status, resp.reason)
+            finally:
+                # the only release: connection back to the pool, also on errors
+                release_response(resp)
             break
     except Exception as e:
         LOGERR("network_handler(): %s", e)
-        exception = True
-    finally:
-        if manager:
-            manager.clear()
-        if exception:
-            return (None, None, None, 0, 0)
-        if method == "HEAD":
-            return ("", "", "", 1, 0)
-        if page_title is None:
-            return ("", page_desc, page_keys, 0, 0)
+        return (None, None, 0, 0)
+
+    return (data, content_type, int(method == "HEAD"), 0)
+
+
+def fetch_pages(
+    jobs: List[Tuple[int, str]],
+    head_only: Dict[str, bool],
+    concurrency: int,
+    processes: int = 0,
+) -> Iterable[Tuple[int, tuple]]:
+    """Fetch and parse many pages, in stages.
+
+    fetch_page() runs in a thread pool (twbm.fetch.fetch_all), parse_page() in
+    a pool of worker processes: parsing is CPU bound pure Python and would
+    hold the GIL the fetch threads need. The caller is the writer stage.
+
+    Parameters
+    ----------
+    jobs : list
+        (DB index, URL) of the pages.
+    head_only : dict
+        URL: True to send only HTTP HEAD request.
+    concurrency : int
+        Number of concurrent fetches, at most TWBM_HTTP_MAXSIZE per host.
+    processes : int
+        Number of parse processes. 0: parse in the fetch threads.
+
+    Yields
+    ------
+    tuple
+        (DB index, network_handler() result), in completion order.
+    """
+    from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+    from multiprocessing import get_context
+
+    from twbm.environment import config
+    from twbm.fetch import fetch_all
+
+    # connections are kept alive per host, at most one per fetch in flight
+    manager = get_shared_PoolManager()
+    per_host = config.twbm_http_maxsize
+
+    if not processes:
+
+        def fetch(url):
+            return network_handler(url, head_only[url], manager=manager)
+
+        yield from fetch_all(jobs, fetch, concurrency, per_host)
+        return
+
+    def fetch_head(url):
+        return fetch_page(url, head_only[url], manager=manager)
 
-        return (page_title, page_desc, page_keys, 0, 0)
+    parsing: Dict[Future, int] = {}  # future: DB index
+
+    def parsed():
+        """Results of finished parses, waits for at least one."""
+        done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+        for future in done:
+            title, desc, keys = future.result()
+            yield parsing.pop(future), (title or "", desc, keys, 0, 0)
+
+    # spawn: forking while the fetch threads run could copy held locks
+    with ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        for id_, (data, content_type, mime, bad) in fetch_all(
+            jobs, fetch_head, concurrency, per_host
+        ):
+            if not data:
+                yield id_, page_result(data, mime, bad)
+                continue
+            parsing[pool.submit(parse_page, data, content_type)] = id_
+
+            # bounded: page heads wait in the fetch stage, not in the pipe
+            while len(parsing) >= 4 * processes:
+                yield from parsed()
+
+        while parsing:
+            yield from parsed()
+
+
+def page_result(
+    data: Optional[bytes],
+    mime: int,
+    bad: int,
+    parsed: Tuple[Optional[str], Optional[str], Optional[str]] = (None, None, None),
+) -> Tuple[Optional[str], Optional[str], Optional[str], int, int]:
+    """network_handler() result of a fetch_page() result and its parse_page()."""
+    if bad:
+        return (None, None, None, 0, 1)
+    if data is None:
+        return (None, None, None, 0, 0)
+    if mime:
+        return ("", "", "", 1, 0)
+
+    title, desc, keys = parsed
+    return (title or "", desc, keys, 0, 0)
 
 
 def parse_tags(keywords=[]):
@@ -4843,6 +5212,7 @@ def browse(url):
     override_text_browser : bool
         If True, tries to open links in a GUI based browser.
     """
+    from urllib3.util import parse_url
 
     if not parse_url(url).scheme:
         # Prefix with 'http://' if no scheme
@@ -4903,7 +5273,9 @@ def check_upstream_release():
     if MYPROXY is None:
         gen_headers()
 
-    ca_certs = os.getenv("BUKU_CA_CERTS", default=CA_CERTS)
+    import urllib3
+
+    ca_certs = os.getenv("BUKU_CA_CERTS", default=get_ca_certs())
     if MYPROXY:
         manager = urllib3.ProxyManager(
             MYPROXY,
@@ -4991,6 +5363,21 @@ def delim_wrap(token):
     return token
 
 
+def import_readline():
+    """Import readline: line editing and history for input().
+
+    Returns
+    -------
+    module
+        readline, or pyreadline if readline is not available.
+    """
+    try:
+        import readline
+    except Exception:
+        import pyreadline as readline  # type: ignore
+    return readline
+
+
 def read_in(msg):
     """A wrapper to handle input() with interrupts disabled.
 
@@ -5443,6 +5830,8 @@ def main():
     """Main."""
     global ID_STR, ID_DB_STR, MUTE_STR, URL_STR, DESC_STR, DESC_WRAP, TAG_STR, TAG_WRAP, PROMPTMSG
 
+    import_readline()
+
     title_in = None
     tags_in = None
     desc_in = None
@@ -5617,7 +6006,7 @@ POSITIONAL ARGUMENTS:
     --tacit              reduce verbosity, skip some confirmations
     --nostdin            do not wait for input (must be first arg)
     --threads N          max network connections in full refresh
-                         default N=4, min N=1, max N=10
+                         default N=256, min N=1, max N=1024
     -V                   check latest upstream version available
     -g, --debug          show debug information and verbose logs""",
     )
@@ -5654,7 +6043,7 @@ POSITIONAL ARGUMENTS:
     addarg("--suggest", action="store_true", help=hide)
     addarg("--tacit", action="store_true", help=hide)
     addarg("--nostdin", action="store_true", help=hide)
-    addarg("--threads", type=int, default=4, choices=range(1, 11), help=hide)
+    addarg("--threads", type=int, default=256, choices=range(1, 1025), help=hide)
     addarg("-V", dest="upstream", action="store_true", help=hide)
     addarg("-g", "--debug", action="store_true", help=hide)
     # Undocumented APIs
@@ -5671,6 +6060,15 @@ POSITIONAL ARGUMENTS:
         argparser.print_help(sys.stdout)
         sys.exit(0)
 
+    # Count SQL statements of this run, report at exit (TWBM_SQL_STATS=1)
+    from twbm.environment import config
+
+    if config.twbm_sql_stats:
+        from twbm import trace
+
+        trace.start_counting(config.twbm_sql_warn)
+        atexit.register(trace.report_counting)
+
     # By default, buku uses ANSI colors. As Windows does not really use them,
     # we'd better check for known working console emulators first. Currently,
     # only ConEmu is supported. If the user does not use ConEmu, colors are
@@ -5739,7 +6137,8 @@ POSITIONAL ARGUMENTS:
         LOGDBG("Python v%s", ("%d.%d.%d" % sys.version_info[:3]))
     else:
         logging.disable(logging.WARNING)
-        urllib3.disable_warnings()
+        # urllib3.disable_warnings() without importing urllib3
+        warnings.filterwarnings("ignore", module=r"urllib3(\.|$)")
 
     # Handle encrypt/decrypt options at top priority
     if args.lock is not None:
@@ -5940,7 +6339,7 @@ POSITIONAL ARGUMENTS:
     # Add cmdline search options to readline history
     if search_opted and len(args.keywords):
         try:
-            readline.add_history(" ".join(args.keywords))
+            import_readline().add_history(" ".join(args.keywords))
         except Exception:
             pass
 
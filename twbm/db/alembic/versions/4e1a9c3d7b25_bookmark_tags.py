@@ -0,0 +1,84 @@
+"""bookmark_tags
+
+Normalized, indexed tags: one row per (bookmark, tag), kept in sync with
+bookmarks.tags by triggers. Tag lookups become index lookups instead of
+LIKE scans over the comma-wrapped tags string.
+
+Revision ID: 4e1a9c3d7b25
+Revises: 7c2eff0bf291
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4e1a9c3d7b25"
+down_revision = "7c2eff0bf291"
+branch_labels = None
+depends_on = None
+
+
+def split_tags(tags: str) -> str:
+    """json_each() over the tags of ',tag1,tag2,': CTEs are not allowed in triggers."""
+    return f"json_each('[' || replace(json_quote(trim({tags}, ',')), ',', '\",\"') || ']')"
+
+
+create_table = """
+CREATE TABLE bookmark_tags (
+    bookmark_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (bookmark_id, tag)
+) WITHOUT ROWID;
+"""
+
+create_index = """
+CREATE INDEX bookmark_tags_tag ON bookmark_tags (tag, bookmark_id);
+"""
+
+after_insert = f"""
+CREATE TRIGGER bookmark_tags_ai AFTER INSERT ON bookmarks
+    BEGIN
+        INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag)
+        SELECT new.id, value FROM {split_tags("new.tags")} WHERE value <> '';
+    END;
+"""
+
+after_delete = """
+CREATE TRIGGER bookmark_tags_ad AFTER DELETE ON bookmarks
+    BEGIN
+        DELETE FROM bookmark_tags WHERE bookmark_id = old.id;
+    END;
+"""
+
+# only touch the rows of tags which actually changed
+after_update = f"""
+CREATE TRIGGER bookmark_tags_au AFTER UPDATE OF id, tags ON bookmarks
+    BEGIN
+        DELETE FROM bookmark_tags
+        WHERE bookmark_id = old.id
+          AND (new.id <> old.id OR tag NOT IN (SELECT value FROM {split_tags("new.tags")}));
+        INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag)
+        SELECT new.id, value FROM {split_tags("new.tags")} WHERE value <> '';
+    END;
+"""
+
+backfill = f"""
+INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag)
+SELECT b.id, t.value FROM bookmarks b, {split_tags("b.tags")} t WHERE t.value <> '';
+"""
+
+
+def upgrade():
+    op.execute(create_table)
+    op.execute(create_index)
+    op.execute(after_insert)
+    op.execute(after_delete)
+    op.execute(after_update)
+    op.execute(backfill)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER bookmark_tags_au;")
+    op.execute("DROP TRIGGER bookmark_tags_ad;")
+    op.execute("DROP TRIGGER bookmark_tags_ai;")
+    op.execute("DROP TABLE bookmark_tags;")
@@ -0,0 +1,58 @@
+"""tag_counts
+
+Tag frequencies maintained by triggers on bookmark_tags: listing tags and
+checking for unknown tags cost O(#tags) instead of splitting every row.
+
+Revision ID: 9b2d5f8e1c47
+Revises: 4e1a9c3d7b25
+Create Date: 2026-10-18 10:03:54.118342
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9b2d5f8e1c47"
+down_revision = "4e1a9c3d7b25"
+branch_labels = None
+depends_on = None
+
+create_table = """
+CREATE TABLE tag_counts (
+    tag TEXT NOT NULL PRIMARY KEY,
+    n INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+after_insert = """
+CREATE TRIGGER tag_counts_ai AFTER INSERT ON bookmark_tags
+    BEGIN
+        INSERT INTO tag_counts (tag, n) VALUES (new.tag, 1)
+        ON CONFLICT (tag) DO UPDATE SET n = n + 1;
+    END;
+"""
+
+after_delete = """
+CREATE TRIGGER tag_counts_ad AFTER DELETE ON bookmark_tags
+    BEGIN
+        UPDATE tag_counts SET n = n - 1 WHERE tag = old.tag;
+        DELETE FROM tag_counts WHERE tag = old.tag AND n <= 0;
+    END;
+"""
+
+backfill = """
+INSERT INTO tag_counts (tag, n)
+SELECT tag, count(*) FROM bookmark_tags GROUP BY tag;
+"""
+
+
+def upgrade():
+    op.execute(create_table)
+    op.execute(after_insert)
+    op.execute(after_delete)
+    op.execute(backfill)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER tag_counts_ad;")
+    op.execute("DROP TRIGGER tag_counts_ai;")
+    op.execute("DROP TABLE tag_counts;")
@@ -0,0 +1,79 @@
+"""tag_pairs
+
+Tag co-occurrence counts maintained by triggers on bookmark_tags, both
+directions stored: related tags of a tag are a primary key range lookup.
+
+Revision ID: c61e0a4b8d93
+Revises: 9b2d5f8e1c47
+Create Date: 2026-10-18 10:41:07.553920
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c61e0a4b8d93"
+down_revision = "9b2d5f8e1c47"
+branch_labels = None
+depends_on = None
+
+create_table = """
+CREATE TABLE tag_pairs (
+    tag TEXT NOT NULL,
+    other TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (tag, other)
+) WITHOUT ROWID;
+"""
+
+# pairs with the tags already stored for the bookmark
+after_insert = """
+CREATE TRIGGER tag_pairs_ai AFTER INSERT ON bookmark_tags
+    BEGIN
+        INSERT INTO tag_pairs (tag, other, n)
+        SELECT new.tag, tag, 1 FROM bookmark_tags
+        WHERE bookmark_id = new.bookmark_id AND tag <> new.tag
+        ON CONFLICT (tag, other) DO UPDATE SET n = n + 1;
+        INSERT INTO tag_pairs (tag, other, n)
+        SELECT tag, new.tag, 1 FROM bookmark_tags
+        WHERE bookmark_id = new.bookmark_id AND tag <> new.tag
+        ON CONFLICT (tag, other) DO UPDATE SET n = n + 1;
+    END;
+"""
+
+# pairs with the tags still stored for the bookmark
+after_delete = """
+CREATE TRIGGER tag_pairs_ad AFTER DELETE ON bookmark_tags
+    BEGIN
+        UPDATE tag_pairs SET n = n - 1
+        WHERE tag = old.tag
+          AND other IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+        UPDATE tag_pairs SET n = n - 1
+        WHERE other = old.tag
+          AND tag IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+        DELETE FROM tag_pairs WHERE tag = old.tag AND n <= 0;
+        DELETE FROM tag_pairs
+        WHERE other = old.tag AND n <= 0
+          AND tag IN (SELECT tag FROM bookmark_tags WHERE bookmark_id = old.bookmark_id);
+    END;
+"""
+
+backfill = """
+INSERT INTO tag_pairs (tag, other, n)
+SELECT a.tag, b.tag, count(*)
+FROM bookmark_tags a JOIN bookmark_tags b
+    ON a.bookmark_id = b.bookmark_id AND a.tag <> b.tag
+GROUP BY a.tag, b.tag;
+"""
+
+
+def upgrade():
+    op.execute(create_table)
+    op.execute(after_insert)
+    op.execute(after_delete)
+    op.execute(backfill)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER tag_pairs_ad;")
+    op.execute("DROP TRIGGER tag_pairs_ai;")
+    op.execute("DROP TABLE tag_pairs;")
@@ -0,0 +1,72 @@
+"""fts update columns
+
+FTS maintenance only for updates of indexed columns, last_update_ts only for
+updates of content columns. The timestamp update of UpdateLastTime no longer
+fires bookmarks_au (and a second delete+insert of the FTS row).
+
+tags stays in the column list: tags is an indexed FTS column in this schema.
+
+Revision ID: d2f7a9c4e816
+Revises: c61e0a4b8d93
+Create Date: 2026-10-18 11:32:45.120417
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d2f7a9c4e816"
+down_revision = "c61e0a4b8d93"
+branch_labels = None
+depends_on = None
+
+# noinspection SqlResolve
+after_update = """
+CREATE TRIGGER bookmarks_au AFTER UPDATE OF id, URL, metadata, tags, "desc" ON bookmarks
+    BEGIN
+        INSERT INTO bookmarks_fts (bookmarks_fts, rowid, URL, metadata, tags, "desc")
+        VALUES ('delete', old.id, old.URL, old.metadata, old.tags, old.desc);
+        INSERT INTO bookmarks_fts (rowid, URL, metadata, tags, "desc")
+        VALUES (new.id, new.URL, new.metadata, new.tags, new.desc);
+    END;
+"""
+
+update_time_trigger = """
+CREATE TRIGGER [UpdateLastTime] AFTER UPDATE OF URL, metadata, tags, "desc", flags ON bookmarks
+    FOR EACH ROW WHEN NEW.last_update_ts <= OLD.last_update_ts
+    BEGIN
+        update bookmarks set last_update_ts=CURRENT_TIMESTAMP where id=OLD.id;
+    END;
+"""
+
+# noinspection SqlResolve
+after_update_all = """
+CREATE TRIGGER bookmarks_au AFTER UPDATE ON bookmarks
+    BEGIN
+        INSERT INTO bookmarks_fts (bookmarks_fts, rowid, URL, metadata, tags, "desc")
+        VALUES ('delete', old.id, old.URL, old.metadata, old.tags, old.desc);
+        INSERT INTO bookmarks_fts (rowid, URL, metadata, tags, "desc")
+        VALUES (new.id, new.URL, new.metadata, new.tags, new.desc);
+    END;
+"""
+
+update_time_trigger_all = """
+CREATE TRIGGER [UpdateLastTime] AFTER UPDATE ON bookmarks
+    FOR EACH ROW WHEN NEW.last_update_ts <= OLD.last_update_ts
+    BEGIN
+        update bookmarks set last_update_ts=CURRENT_TIMESTAMP where id=OLD.id;
+    END;
+"""
+
+
+def upgrade():
+    op.execute("DROP TRIGGER bookmarks_au;")
+    op.execute("DROP TRIGGER UpdateLastTime;")
+    op.execute(after_update)
+    op.execute(update_time_trigger)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER bookmarks_au;")
+    op.execute("DROP TRIGGER UpdateLastTime;")
+    op.execute(after_update_all)
+    op.execute(update_time_trigger_all)
@@ -0,0 +1,128 @@
+"""Process-wide database connections.
+
+One engine and one open connection per DB URL and mode, shared by DAL,
+Bookmarks and the BukuDb calls in twb.py. Opening the database once per process
+instead of once per `with DAL(...)` block avoids repeated engine creation and
+disposal.
+
+Modes: "rw" (default), "ro" (sqlite mode=ro: never writes, never takes a write
+lock) and "immutable" (mode=ro&immutable=1: no locking at all, only for files
+nobody writes to while twbm runs).
+"""
+import atexit
+import logging
+import sqlite3
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.pool import StaticPool
+from twbm import trace
+from twbm.db.pragmas import apply_pragmas
+from twbm.environment import config
+
+_log = logging.getLogger(__name__)
+
+MODES = ("rw", "ro", "immutable")
+
+_engines: Dict[Tuple[str, str], Engine] = {}
+_connections: Dict[Tuple[str, str], Connection] = {}
+
+
+def sqlite_uri(db_url: str, mode: str) -> str:
+    """sqlite3 URI filename of a read-only mode, e.g. file:/db/bm.db?mode=ro"""
+    uri = f"file:{quote(make_url(db_url).database)}?mode=ro"
+    return uri + "&immutable=1" if mode == "immutable" else uri
+
+
+def get_engine(db_url: str, mode: str = "rw") -> Engine:
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    engine = _engines.get((db_url, mode))
+    if engine is None:
+        _log.debug(f"Creating engine: {db_url}, {mode=}")
+        # StaticPool: exactly one DBAPI connection per engine, shared across threads
+        with trace.span("create_engine"):
+            if mode == "rw":
+                engine = create_engine(
+                    db_url,
+                    poolclass=StaticPool,
+                    connect_args={"check_same_thread": False},
+                )
+            else:
+                uri = sqlite_uri(db_url, mode)
+                engine = create_engine(
+                    "sqlite://",
+                    poolclass=StaticPool,
+                    creator=lambda: sqlite3.connect(
+                        uri, uri=True, check_same_thread=False
+                    ),
+                )
+        event.listen(
+            engine, "connect", _on_connect if mode == "rw" else _on_connect_read_only
+        )
+        _engines[(db_url, mode)] = engine
+    return engine
+
+
+def _on_connect(dbapi_connection: sqlite3.Connection, connection_record) -> None:
+    apply_pragmas(dbapi_connection, config.pragmas())
+
+
+def _on_connect_read_only(
+    dbapi_connection: sqlite3.Connection, connection_record
+) -> None:
+    # the journal mode is a property of the file, changing it needs a write
+    pragmas = config.pragmas()
+    pragmas.pop("journal_mode", None)
+    apply_pragmas(dbapi_connection, pragmas)
+
+
+def get_connection(db_url: str, mode: str = "rw") -> Connection:
+    conn = _connections.get((db_url, mode))
+    if conn is None or conn.closed:
+        engine = get_engine(db_url, mode)
+        with trace.span("connect"):
+            conn = engine.connect()
+        trace.watch(conn.connection.dbapi_connection)
+        _connections[(db_url, mode)] = conn
+    return conn
+
+
+def get_dbapi_connection(db_url: str, mode: str = "rw") -> sqlite3.Connection:
+    """Raw sqlite3 connection of the shared connection, e.g. for BukuDb."""
+    return get_connection(db_url, mode).connection.dbapi_connection
+
+
+def get_dbapi_connections() -> List[sqlite3.Connection]:
+    return [
+        conn.connection.dbapi_connection
+        for conn in _connections.values()
+        if not conn.closed
+    ]
+
+
+def table_cache(dbapi_connection: sqlite3.Connection) -> Dict[str, bool]:
+    """has_table() results of a shared connection, kept until it is closed.
+
+    A new dict for other connections, e.g. of BukuDb(dbfile) without conn.
+    """
+    for conn in _connections.values():
+        if not conn.closed and conn.connection.dbapi_connection is dbapi_connection:
+            tables: Dict[str, bool] = conn.info.setdefault("tables", {})
+            return tables
+    return {}
+
+
+def close_all() -> None:
+    """Close all shared connections, e.g. before the DB file is replaced."""
+    for conn in _connections.values():
+        conn.close()
+    for engine in _engines.values():
+        engine.dispose()
+    _connections.clear()
+    _engines.clear()
+
+
+atexit.register(close_all)
@@ -1,12 +1,30 @@
+import json
 import logging
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Sequence
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import aiosql
 import sqlalchemy as sa
 from pydantic import BaseModel
-from sqlalchemy import create_engine
 from sqlalchemy.engine import Connection, Engine
+from twbm import trace
+from twbm.db.connection import get_connection, get_engine, table_cache
 
 # from twbm.environment import Environment
 
@@ -44,6 +62,265 @@ class Bookmark(BaseModel):
     def split_tags(self) -> Sequence[str]:
         return [tag for tag in self.tags.split(",") if tag != ""]
 
+    @property
+    def tag_set(self) -> FrozenSet[str]:
+        return frozenset(self.split_tags)
+
+
+class BookmarkRow:
+    """Bookmark as read from the DB on hot paths: no validation.
+
+    Same attributes as Bookmark. Tags are split once, last_update_ts is parsed
+    on first access. Bookmark (pydantic) stays for input and single rows.
+    """
+
+    __slots__ = (
+        "id",
+        "URL",
+        "metadata",
+        "desc",
+        "flags",
+        "_tags",
+        "_split_tags",
+        "_tag_set",
+        "_last_update_ts",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        URL: str = "",
+        metadata: Optional[str] = "",
+        tags: str = ",,",
+        desc: str = "",
+        flags: int = 0,
+        last_update_ts: Union[datetime, str, None] = None,
+    ):
+        self.id = id
+        self.URL = URL
+        self.metadata = metadata
+        self.tags = tags
+        self.desc = desc
+        self.flags = flags
+        self._last_update_ts = last_update_ts
+
+    def __repr__(self):
+        return f"BookmarkRow(id={self.id!r}, URL={self.URL!r}, tags={self.tags!r})"
+
+    @property
+    def tags(self) -> str:
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags: str):
+        self._tags = tags
+        self._split_tags: Optional[Tuple[str, ...]] = None
+        self._tag_set: Optional[FrozenSet[str]] = None
+
+    @property
+    def split_tags(self) -> Sequence[str]:
+        split_tags = self._split_tags
+        if split_tags is None:
+            split_tags = tuple(t for t in (self._tags or "").split(",") if t)
+            self._split_tags = split_tags
+        return split_tags
+
+    @property
+    def tag_set(self) -> FrozenSet[str]:
+        tag_set = self._tag_set
+        if tag_set is None:
+            tag_set = self._tag_set = frozenset(self.split_tags)
+        return tag_set
+
+    @property
+    def last_update_ts(self) -> datetime:
+        if isinstance(self._last_update_ts, str):
+            self._last_update_ts = datetime.fromisoformat(self._last_update_ts)
+        elif self._last_update_ts is None:  # like Bookmark
+            self._last_update_ts = datetime.utcnow()
+        return self._last_update_ts
+
+    @last_update_ts.setter
+    def last_update_ts(self, last_update_ts: Union[datetime, str, None]):
+        self._last_update_ts = last_update_ts
+
+
+@dataclass
+class QueryStats:
+    calls: int = 0
+    total: float = 0.0  # seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+@dataclass
+class DbStats:
+    bookmarks: int
+    page_count: int
+    page_size: int
+    freelist_count: int
+    journal_mode: str
+    fts_segments: int
+    fts_size: int  # bytes
+    tags: int = 0  # distinct tags, see DAL.get_db_stats
+
+    @property
+    def size(self) -> int:
+        return self.page_count * self.page_size
+
+
+# Query registry: parsed once per process instead of per call. sqlite3 keeps
+# prepared statements per connection keyed by SQL text, so the unchanged SQL
+# strings of the registry hit that cache on the shared connection.
+SQL_PATH = Path(__file__).parent.absolute() / "sql"
+queries = aiosql.from_path(
+    SQL_PATH / "queries.sql",
+    "sqlite3",
+    record_classes={
+        "Bookmark": Bookmark,
+        "BookmarkRow": BookmarkRow,
+        "DbStats": DbStats,
+    },
+)
+query_stats: Dict[str, QueryStats] = defaultdict(QueryStats)
+
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        with trace.span(name, cat="query"):
+            yield
+    finally:
+        stats = query_stats[name]
+        stats.calls += 1
+        stats.total += time.perf_counter() - start
+
+
+# FTS5 merge configuration, see https://www.sqlite.org/fts5.html#the_automerge_option
+FTS_CONFIG_DEFAULTS = {"automerge": 4, "crisismerge": 16, "usermerge": 4}
+
+_TAGS_ALL = (
+    "select bookmark_id from bookmark_tags where tag in ({}) "
+    "group by bookmark_id having count(*) = {}"
+)
+_TAGS_ANY = "select bookmark_id from bookmark_tags where tag in ({})"
+
+# bookmarks columns for the FTS matches: FTS tables created by
+# scripts/twbm-upgrade-db.sh have no last_update_ts column
+_FTS_SELECT = (
+    "select bookmarks.* from bookmarks_fts "
+    "cross join bookmarks on bookmarks.id = bookmarks_fts.rowid "
+    "where bookmarks_fts match ?"
+)
+
+
+def compile_tag_filter(
+    id_column: str,
+    tags_all: Optional[Sequence[str]] = None,
+    tags_all_not: Optional[Sequence[str]] = None,
+    tags_any: Optional[Sequence[str]] = None,
+    tags_any_not: Optional[Sequence[str]] = None,
+    tags_exact: Optional[Sequence[str]] = None,
+) -> Tuple[List[str], List[str]]:
+    """Compile the tag algebra of Bookmarks.filter to bookmark_tags lookups.
+
+    None means option not given. Empty tag lists behave like the set matching
+    in twbm.bookmarks, e.g. matching any of no tags matches nothing.
+
+    Returns: (where conditions, parameters)
+    """
+
+    def tags_in(tags: Sequence[str]) -> str:
+        params.extend(tags)
+        return ", ".join("?" * len(tags))
+
+    conditions: List[str] = []
+    params: List[str] = []
+
+    if tags_exact is not None:
+        tags = sorted(set(tags_exact))
+        if tags:
+            conditions.append(
+                f"{id_column} in ({_TAGS_ALL.format(tags_in(tags), len(tags))})"
+            )
+        conditions.append(
+            "not exists (select 1 from bookmark_tags "
+            f"where bookmark_id = {id_column} and tag not in ({tags_in(tags)}))"
+        )
+        return conditions, params
+
+    if tags_all:
+        tags = sorted(set(tags_all))
+        conditions.append(
+            f"{id_column} in ({_TAGS_ALL.format(tags_in(tags), len(tags))})"
+        )
+    if tags_any is not None:
+        if tags_any:
+            conditions.append(f"{id_column} in ({_TAGS_ANY.format(tags_in(tags_any))})")
+        else:
+            conditions.append("0")
+    if tags_any_not:
+        conditions.append(
+            f"{id_column} not in ({_TAGS_ANY.format(tags_in(tags_any_not))})"
+        )
+    if tags_all_not is not None:
+        tags = sorted(set(tags_all_not))
+        if tags:
+            conditions.append(
+                f"{id_column} not in ({_TAGS_ALL.format(tags_in(tags), len(tags))})"
+            )
+        else:
+            conditions.append("0")
+    return conditions, params
+
+
+def compile_tag_scan(
+    tags_all: Optional[Sequence[str]] = None,
+    tags_all_not: Optional[Sequence[str]] = None,
+    tags_any: Optional[Sequence[str]] = None,
+    tags_any_not: Optional[Sequence[str]] = None,
+    tags_exact: Optional[Sequence[str]] = None,
+) -> Tuple[List[str], List[str]]:
+    """compile_tag_filter without bookmark_tags: matches on bookmarks.tags.
+
+    For databases created by scripts/twbm-upgrade-db.sh without the tag tables.
+    Returns: (where conditions, parameters)
+    """
+
+    def has_tags(tags: Sequence[str], op: str) -> str:
+        params.extend(f",{tag}," for tag in tags)
+        return f" {op} ".join("instr(bookmarks.tags, ?) > 0" for _ in tags)
+
+    conditions: List[str] = []
+    params: List[str] = []
+
+    if tags_exact is not None:
+        tags = sorted(set(tags_exact))
+        stripped = "trim(bookmarks.tags, ',')"
+        if tags:
+            conditions.append(has_tags(tags, "and"))
+            conditions.append(
+                f"length({stripped}) - length(replace({stripped}, ',', ''))"
+                f" = {len(tags) - 1}"
+            )
+        else:
+            conditions.append(f"{stripped} = ''")
+        return conditions, params
+
+    if tags_all:
+        conditions.append(has_tags(sorted(set(tags_all)), "and"))
+    if tags_any is not None:
+        conditions.append(f"({has_tags(tags_any, 'or')})" if tags_any else "0")
+    if tags_any_not:
+        conditions.append(f"not ({has_tags(tags_any_not, 'or')})")
+    if tags_all_not is not None:
+        tags = sorted(set(tags_all_not))
+        conditions.append(f"not ({has_tags(tags, 'and')})" if tags else "0")
+    return conditions, params
+
 
 # noinspection PyPropertyAccess
 class DAL:
@@ -52,55 +329,108 @@ class DAL:
 
     is_simulated_environment: bool
 
-    def __init__(self, env_config: "Environment"):
+    def __init__(self, env_config: "Environment", read_only: bool = False):
+        """read_only: sqlite mode=ro, with TWBM_IMMUTABLE immutable=1."""
         self.bm_db_url = env_config.twbm_db_url
-        self.record_classes = {
-            "Bookmark": Bookmark,
-        }
-
-        # aiosql setup
-        # sql_files_path = Path(__file__).parent.absolute() / Path("sql")
-        # self.aiosql_queries = aiosql.from_path(
-        #     f"{sql_files_path}", "sqlite3", record_classes=record_classes
-        # )
-        # self.aiosql_queries = aiosql.from_path(f"{sql_files_path}", "sqlite3")
+        self.mode = "rw"
+        if read_only:
+            self.mode = "immutable" if env_config.twbm_immutable else "ro"
+        self._tables: Dict[str, bool] = {}
 
     def __enter__(self):
-        self._sql_alchemy_db_engine: Engine = create_engine(self.bm_db_url)
-        self._conn = self._sql_alchemy_db_engine.connect()
+        # shared per process, DB URL and mode, closed at exit (twbm.db.connection)
+        self._sql_alchemy_db_engine: Engine = get_engine(self.bm_db_url, self.mode)
+        self._conn = get_connection(self.bm_db_url, self.mode)
+        self._tables = table_cache(self._conn.connection.dbapi_connection)
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self._conn.close()
-        self._sql_alchemy_db_engine.dispose()
+        if exc_type is not None:
+            self._conn.connection.rollback()
 
     @property
     def conn(self):
         return self._conn
 
+    def _run(self, name: str, **kwargs):
+        """Execute registry query `name`, recording its timing in query_stats."""
+        with timed(name):
+            return getattr(queries, name)(self.conn.connection, **kwargs)
+
+    def has_table(self, name: str) -> bool:
+        """Check for optional tables, e.g. the tag index: databases created by
+        scripts/twbm-upgrade-db.sh do not have them."""
+        if name not in self._tables:
+            self._tables[name] = self._run("has_table", table=name) > 0
+        return self._tables[name]
+
+    def _tag_filter(self, id_column: str, *tags: Optional[Sequence[str]]):
+        """compile_tag_filter, or compile_tag_scan without bookmark_tags."""
+        if self.has_table("bookmark_tags"):
+            return compile_tag_filter(id_column, *tags)
+        return compile_tag_scan(*tags)
+
     # TODO: not working
     def delete_bookmark(self, id: int) -> int:
-        query = """
-            -- name: delete_bookmark<!
-            delete from bookmarks where id = :id
-            returning *;
+        result = self._run("delete_bookmark", id=id)
+        self.conn.connection.commit()
+        return result
+
+    def delete_bookmarks(
+        self,
+        ids: Sequence[int],
+        compact: bool = False,
+        on_progress: Optional[Callable[[int], None]] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        """Delete bookmarks in one transaction, compaction in one pass.
+
+        Without compaction the ids of the remaining bookmarks do not change: the
+        gaps are the tombstones of the deleted bookmarks until `compact`.
+        on_progress is called with the number of ids of each deleted chunk.
         """
-        queries = aiosql.from_str(query, "sqlite3")
-        result = queries.delete_bookmark(self.conn.connection, id=id)
+        ids = list(ids)
+        result = 0
+        try:
+            for i in range(0, len(ids), chunk_size):
+                chunk = ids[i : i + chunk_size]
+                result += self._run("delete_bookmarks", ids=json.dumps(chunk))
+                if on_progress is not None:
+                    on_progress(len(chunk))
+            if compact:
+                self._fill_gaps()
+        except Exception:
+            self.conn.connection.rollback()
+            raise
         self.conn.connection.commit()
         return result
 
-    def insert_bookmark(self, bm: Bookmark) -> int:
-        query = """
-            -- name: insert_bookmark<!
-            -- record_class: Bookmark
-            insert into bookmarks (URL, metadata, tags, desc, flags)
-            values (:URL, :metadata, :tags, :desc, :flags)
-            returning *;
+    def compact(self) -> List[Tuple[int, int]]:
+        """Fill the id gaps left by deletes with the bookmarks of highest id.
+
+        Like BukuDb.compactdb, but one transaction for all gaps and an UPDATE of
+        the id instead of DELETE+INSERT of the row. Returns (old id, new id).
         """
-        queries = aiosql.from_str(query, "sqlite3", record_classes=self.record_classes)
-        result = queries.insert_bookmark(
-            self.conn.connection,
+        try:
+            moves = self._fill_gaps()
+        except Exception:
+            self.conn.connection.rollback()
+            raise
+        self.conn.connection.commit()
+        return moves
+
+    def _fill_gaps(self) -> List[Tuple[int, int]]:
+        ids = [row[0] for row in self._run("get_ids")]
+        n = len(ids)
+        gaps = sorted(set(range(1, n + 1)).difference(ids))
+        moves = list(zip((id_ for id_ in ids if id_ > n), gaps))
+        for id_, new_id in moves:
+            self._run("move_bookmark", id=id_, new_id=new_id)
+        return moves
+
+    def insert_bookmark(self, bm: Bookmark) -> int:
+        result = self._run(
+            "insert_bookmark",
             URL=bm.URL,
             metadata=bm.metadata,
             tags=bm.tags,
@@ -111,121 +441,265 @@ class DAL:
         return result
 
     def update_bookmark(self, bm: Bookmark) -> int:
-        query = """
-            -- name: update_bookmark<!
-            update bookmarks
-            set tags = :tags
-            where id = :id
-            returning *;
+        result = self._run("update_bookmark", id=bm.id, tags=bm.tags)
+        self.conn.connection.commit()
+        return result
+
+    def update_tags(
+        self,
+        ids: Sequence[int],
+        tags: Sequence[str] = (),
+        tags_not: Sequence[str] = (),
+        force: bool = False,
+    ) -> List[BookmarkRow]:
+        """Add tags and remove tags_not (force: set tags) in one statement.
+
+        Returns the updated bookmarks, unknown ids are skipped.
         """
-        queries = aiosql.from_str(query, "sqlite3")
-        result = queries.update_bookmark(self.conn.connection, id=bm.id, tags=bm.tags)
+        if force:
+            name = "set_tags"
+            params = dict(tags=f",{','.join(sorted(set(tags)))},")
+        else:
+            name = "update_tags"
+            params = dict(
+                tags=json.dumps(list(tags)), tags_not=json.dumps(list(tags_not))
+            )
+        try:
+            result = self._run(name, ids=json.dumps(list(ids)), **params)
+        except Exception:
+            self.conn.connection.rollback()
+            raise
         self.conn.connection.commit()
         return result
 
     def get_bookmark_by_id(self, id_: int) -> Bookmark:
-        # Example query
-        # noinspection SqlResolve
-        query = """
-            -- name: get_bookmark_by_id^
-            -- record_class: Bookmark
-            select *
-            from bookmarks
-            where id = :id;
-            """
-        queries = aiosql.from_str(query, "sqlite3", record_classes=self.record_classes)
-        sql_result = queries.get_bookmark_by_id(self.conn.connection, id=id_)
+        sql_result = self._run("get_bookmark_by_id", id=id_)
         if not sql_result:
             # noinspection PyRedundantParentheses
             return Bookmark()
         return sql_result
 
-    def get_bookmarks(self, fts_query: str) -> Sequence[Bookmark]:
-        # Example query
-        # noinspection SqlResolve
+    def get_bookmarks_by_ids(self, ids: Sequence[int]) -> List[BookmarkRow]:
+        """Bookmarks of ids in one query, ordered by id, unknown ids skipped."""
+        return self._run("get_bookmarks_by_ids", ids=json.dumps(list(ids)))
+
+    def get_bookmarks(self, fts_query: str) -> Sequence[BookmarkRow]:
         if fts_query != "":
-            query = """
-                -- name: get_bookmarks
-                -- record_class: Bookmark
-                select *
-                from bookmarks_fts
-                where bookmarks_fts match :fts_query
-                order by rank;
-            """
-            queries = aiosql.from_str(
-                query, "sqlite3", record_classes=self.record_classes
-            )
-            sql_result = queries.get_bookmarks(
-                self.conn.connection, fts_query=fts_query
-            )
+            sql_result = self._run("get_bookmarks_fts", fts_query=fts_query)
         else:
-            query = """
-                -- name: get_bookmarks
-                -- record_class: Bookmark
-                select *
-                from bookmarks;
-            """
-            queries = aiosql.from_str(
-                query, "sqlite3", record_classes=self.record_classes
-            )
-            sql_result = queries.get_bookmarks(
-                self.conn.connection, fts_query=fts_query
-            )
+            sql_result = self._run("get_bookmarks_all")
 
         if not sql_result:
             # noinspection PyRedundantParentheses
-            return (Bookmark(),)
+            return (BookmarkRow(),)
         return sql_result
 
-    def get_related_tags(self, tag: str):
-        tag_query = f"%,{tag},%"
-        # noinspection SqlResolve
-        query = """
-            -- name: get_related_tags
-            with RECURSIVE split(tags, rest) AS (
-                SELECT '', tags || ','
-                FROM bookmarks
-                WHERE tags LIKE :tag_query
-                -- WHERE tags LIKE '%,ccc,%'
-                UNION ALL
-                SELECT substr(rest, 0, instr(rest, ',')),
-                       substr(rest, instr(rest, ',') + 1)
-                FROM split
-                WHERE rest <> '')
-            SELECT tags, count(tags) as n
-            FROM split
-            WHERE tags <> ''
-            group by tags
-            ORDER BY 2 desc;
+    def _search_query(
+        self,
+        fts_query: str,
+        *tags: Optional[Sequence[str]],
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[str, List]:
+        """FTS query and tag filters in one statement, see compile_tag_filter.
+
+        FTS matches come in order of rank, all other bookmarks in order of id.
+        """
+        if fts_query != "":
+            # +rowid: keeps FTS5 from re-running the match for every tag candidate
+            conditions, params = self._tag_filter("+bookmarks_fts.rowid", *tags)
+            query = _FTS_SELECT
+            query += "".join(f" and {c}" for c in conditions) + " order by rank"
+            params.insert(0, fts_query)
+        else:
+            conditions, params = self._tag_filter("id", *tags)
+            query = "select * from bookmarks"
+            if conditions:
+                query += " where " + " and ".join(conditions)
+            query += " order by id"
+        if limit is not None or offset:
+            query += " limit ? offset ?"
+            params += [-1 if limit is None else limit, offset]
+        _log.debug(f"{query=}, {params=}")
+        return query + ";", params
+
+    def search_bookmarks(
+        self,
+        fts_query: str,
+        tags_all: Optional[Sequence[str]] = None,
+        tags_all_not: Optional[Sequence[str]] = None,
+        tags_any: Optional[Sequence[str]] = None,
+        tags_any_not: Optional[Sequence[str]] = None,
+        tags_exact: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[BookmarkRow]:
+        """All matches of the compiled FTS query and tag filters, see _search_query."""
+        query, params = self._search_query(
+            fts_query,
+            tags_all,
+            tags_all_not,
+            tags_any,
+            tags_any_not,
+            tags_exact,
+            limit=limit,
+            offset=offset,
+        )
+        with timed("search_bookmarks"):
+            cursor = self.conn.connection.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+        with trace.span("materialize", n=len(rows)):
+            return [BookmarkRow(**dict(zip(columns, row))) for row in rows]
+
+    def iter_bookmarks(
+        self,
+        fts_query: str,
+        tags_all: Optional[Sequence[str]] = None,
+        tags_all_not: Optional[Sequence[str]] = None,
+        tags_any: Optional[Sequence[str]] = None,
+        tags_any_not: Optional[Sequence[str]] = None,
+        tags_exact: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        page_size: int = 1000,
+    ) -> Iterator[BookmarkRow]:
+        """Matches of search_bookmarks in the same order, fetched page by page.
+
+        Without an FTS query the id order is a rowid scan, so the first bookmark
+        arrives in constant time; memory stays at one page either way.
         """
-        queries = aiosql.from_str(query, "sqlite3")
-        sql_result = queries.get_related_tags(self.conn.connection, tag_query=tag_query)
+        query, params = self._search_query(
+            fts_query,
+            tags_all,
+            tags_all_not,
+            tags_any,
+            tags_any_not,
+            tags_exact,
+            limit=limit,
+            offset=offset,
+        )
+        with timed("iter_bookmarks"):
+            cursor = self.conn.connection.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+        while True:
+            with timed("iter_bookmarks"):
+                page = [
+                    BookmarkRow(**dict(zip(columns, row)))
+                    for row in cursor.fetchmany(page_size)
+                ]
+            yield from page
+            if len(page) < page_size:
+                return
+
+    def get_related_tags(self, tag: str, limit: Optional[int] = None):
+        """Tags used together with tag, with counts: tag_pairs lookup."""
+        name = "get_related_tags"
+        if not (self.has_table("tag_counts") and self.has_table("tag_pairs")):
+            name = "get_related_tags_scan"
+        sql_result = self._run(name, tag=tag, limit=-1 if limit is None else limit)
 
         # if not sql_result:
         #     # noinspection PyRedundantParentheses
         #     return (Bookmark(),)
         return sql_result
 
-    def get_all_tags(self, with_frequency: bool = False):
-        # noinspection SqlResolve
-        query = """
-            -- name: get_all_tags
-            with RECURSIVE split(tags, rest) AS (
-                SELECT '', tags || ','
-                FROM bookmarks
-                UNION ALL
-                SELECT substr(rest, 0, instr(rest, ',')),
-                       substr(rest, instr(rest, ',') + 1)
-                FROM split
-                WHERE rest <> '')
-            SELECT tags, count(tags) as n
-            FROM split
-            WHERE tags <> ''
-            group by tags
-            ORDER BY 2 desc;
+    def get_related_tags_all(self, tags: Sequence[str], limit: Optional[int] = None):
+        """Tags used together with all of tags, with counts (top-k with limit)."""
+        tags = sorted(set(tags))
+        name = "get_related_tags_all"
+        if not self.has_table("bookmark_tags"):
+            name = "get_related_tags_all_scan"
+        return self._run(
+            name,
+            tags=json.dumps(tags),
+            n_tags=len(tags),
+            limit=-1 if limit is None else limit,
+        )
+
+    def get_db_stats(self) -> DbStats:
+        """Sizes and counts of the database, its FTS index and tags."""
+        stats = self._run("get_db_stats")
+        if self.has_table("tag_counts"):
+            stats.tags = self._run("count_tags")
+        else:
+            stats.tags = len(self.get_all_tags())
+        return stats
+
+    def fts_optimize(self) -> None:
+        """Merge all FTS index segments into one."""
+        self._run("fts_optimize")
+        self.conn.connection.commit()
+
+    def fts_merge(self, pages: int) -> bool:
+        """Incremental merge step writing about `pages` pages, committed.
+
+        Returns: whether the step did any work, see FTS5 'merge' command.
+        """
+        dbapi_connection = self.conn.connection.dbapi_connection
+        changes = dbapi_connection.total_changes
+        self._run("fts_merge", pages=pages)
+        self.conn.connection.commit()
+        return dbapi_connection.total_changes - changes >= 2
+
+    def get_fts_config(self) -> Dict[str, int]:
+        """Merge configuration of the FTS index, defaults where not set."""
+        config = dict(FTS_CONFIG_DEFAULTS)
+        config.update((k, v) for k, v in self._run("get_fts_config") if k in config)
+        return config
+
+    def set_fts_config(self, key: str, value: int) -> None:
+        if key not in FTS_CONFIG_DEFAULTS:
+            raise ValueError(f"Unknown FTS config: {key}")
+        self._run("fts_set_config", key=key, value=value)
+        self.conn.connection.commit()
+
+    def fts_integrity_check(self) -> List[str]:
+        """Problems of the FTS index: structure and document count vs. bookmarks.
+
+        FTS5's check against the content table (rank 1) does not apply: the
+        triggers do not index the id column.
         """
-        queries = aiosql.from_str(query, "sqlite3")
-        sql_result = queries.get_all_tags(self.conn.connection)
+        problems = []
+        try:
+            self._run("fts_integrity_check")
+        except sqlite3.DatabaseError as e:
+            problems.append(f"integrity-check: {e}")
+        n_docs = self._run("fts_count_docs")
+        n_bookmarks = self.get_db_stats().bookmarks
+        if n_docs != n_bookmarks:
+            problems.append(f"{n_docs} documents indexed, {n_bookmarks} bookmarks")
+        return problems
+
+    def fts_rebuild(
+        self,
+        chunk_size: int = 10_000,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """Rebuild the FTS index chunk by chunk in one transaction.
+
+        on_progress is called with the number of bookmarks of each chunk.
+        Returns: number of indexed bookmarks
+        """
+        ids = [row[0] for row in self._run("get_ids")]
+        try:
+            self._run("fts_delete_all")
+            for i in range(0, len(ids), chunk_size):
+                chunk = ids[i : i + chunk_size]
+                self._run("fts_index_bookmarks", first=chunk[0], last=chunk[-1])
+                if on_progress is not None:
+                    on_progress(len(chunk))
+        except Exception:
+            self.conn.connection.rollback()
+            raise
+        self.conn.connection.commit()
+        return len(ids)
+
+    def get_all_tags(self, with_frequency: bool = False):
+        if self.has_table("tag_counts"):
+            sql_result = self._run("get_all_tags")
+        else:
+            sql_result = self._run("get_all_tags_scan")
 
         return sql_result
         # if with_frequency:
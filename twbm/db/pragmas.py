@@ -0,0 +1,48 @@
+"""SQLite pragma profiles, applied to every new connection of DAL and BukuDb.
+
+default: SQLite's defaults (rollback journal, fsync per commit, no mmap).
+fast:    WAL, fsync at checkpoints only, 256MB mmap, 64MB page cache.
+safe:    WAL, fsync per commit.
+
+WAL is persistent: it stays the journal mode of the database file.
+"""
+import re
+import sqlite3
+from typing import Dict, Union
+
+PragmaValue = Union[int, str]
+
+PRAGMAS = (
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+    "busy_timeout",
+)
+
+PROFILES: Dict[str, Dict[str, PragmaValue]] = {
+    "default": {},
+    "fast": {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative: KiB
+        "temp_store": "memory",
+        "busy_timeout": 5000,
+    },
+    "safe": {
+        "journal_mode": "wal",
+        "synchronous": "full",
+        "busy_timeout": 5000,
+    },
+}
+
+_VALUE = re.compile(r"-?\w+")
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, PragmaValue]) -> None:
+    for name, value in pragmas.items():
+        if name not in PRAGMAS or not _VALUE.fullmatch(str(value)):
+            raise ValueError(f"Invalid pragma: {name}={value}")
+        conn.execute(f"pragma {name} = {value}")
@@ -0,0 +1,181 @@
+-- Queries of twbm.db.dal.DAL, loaded once per process.
+
+-- name: delete_bookmark<!
+delete from bookmarks where id = :id
+returning *;
+
+-- name: delete_bookmarks!
+delete from bookmarks where id in (select value from json_each(:ids));
+
+-- name: get_ids
+select id from bookmarks order by id;
+
+-- name: move_bookmark!
+update bookmarks set id = :new_id where id = :id;
+
+-- name: insert_bookmark<!
+-- record_class: Bookmark
+insert into bookmarks (URL, metadata, tags, desc, flags)
+values (:URL, :metadata, :tags, :desc, :flags)
+returning *;
+
+-- name: update_bookmark<!
+update bookmarks
+set tags = :tags
+where id = :id
+returning *;
+
+-- name: set_tags
+-- record_class: BookmarkRow
+update bookmarks
+set tags = :tags
+where id in (select value from json_each(:ids))
+returning *;
+
+-- name: update_tags
+-- record_class: BookmarkRow
+-- new taglist: (taglist + tags) - tags_not, sorted
+update bookmarks
+set tags = (
+    select ',' || coalesce(group_concat(tag, ','), '') || ','
+    from (
+        select value as tag
+        from json_each('[' || replace(json_quote(trim(bookmarks.tags, ',')), ',', '","') || ']')
+        where value <> ''
+        union
+        select value from json_each(:tags)
+        except
+        select value from json_each(:tags_not)
+        order by 1))
+where id in (select value from json_each(:ids))
+returning *;
+
+-- name: get_bookmark_by_id^
+-- record_class: Bookmark
+select *
+from bookmarks
+where id = :id;
+
+-- name: get_bookmarks_fts
+-- record_class: BookmarkRow
+select bookmarks.*
+from bookmarks_fts
+         cross join bookmarks on bookmarks.id = bookmarks_fts.rowid
+where bookmarks_fts match :fts_query
+order by rank;
+
+-- name: get_bookmarks_all
+-- record_class: BookmarkRow
+select *
+from bookmarks;
+
+-- name: get_bookmarks_by_ids
+-- record_class: BookmarkRow
+select *
+from bookmarks
+where id in (select value from json_each(:ids))
+order by id;
+
+-- name: get_related_tags
+select tag, n from tag_counts where tag = :tag
+union all
+select other, n from tag_pairs where tag = :tag
+order by 2 desc, 1 desc
+limit :limit;
+
+-- name: get_related_tags_all
+select tag, count(*) as n
+from bookmark_tags
+where bookmark_id in (
+    select bookmark_id
+    from bookmark_tags
+    where tag in (select value from json_each(:tags))
+    group by bookmark_id
+    having count(*) = :n_tags)
+group by tag
+order by 2 desc, 1 desc
+limit :limit;
+
+-- name: get_all_tags
+select tag, n
+from tag_counts
+order by 2 desc, 1 desc;
+
+-- name: get_all_tags_scan
+-- get_all_tags without tag_counts: split bookmarks.tags
+select value as tag, count(distinct bookmarks.id) as n
+from bookmarks,
+     json_each('[' || replace(json_quote(trim(bookmarks.tags, ',')), ',', '","') || ']')
+where value <> ''
+group by value
+order by 2 desc, 1 desc;
+
+-- name: get_related_tags_scan
+-- get_related_tags without tag_counts and tag_pairs: split bookmarks.tags
+select value as tag, count(distinct bookmarks.id) as n
+from bookmarks,
+     json_each('[' || replace(json_quote(trim(bookmarks.tags, ',')), ',', '","') || ']')
+where value <> ''
+  and instr(bookmarks.tags, ',' || :tag || ',') > 0
+group by value
+order by 2 desc, 1 desc
+limit :limit;
+
+-- name: get_related_tags_all_scan
+-- get_related_tags_all without bookmark_tags: split bookmarks.tags
+select value as tag, count(distinct bookmarks.id) as n
+from bookmarks,
+     json_each('[' || replace(json_quote(trim(bookmarks.tags, ',')), ',', '","') || ']')
+where value <> ''
+  and (select count(*)
+       from json_each(:tags) as t
+       where instr(bookmarks.tags, ',' || t.value || ',') > 0) = :n_tags
+group by value
+order by 2 desc, 1 desc
+limit :limit;
+
+-- name: has_table$
+select count(*) from sqlite_master where type = 'table' and name = :table;
+
+-- name: count_tags$
+select count(*) from tag_counts;
+
+-- name: get_db_stats^
+-- record_class: DbStats
+-- FTS5 shadow tables: one _idx row per segment leaf range, _data holds the pages
+select (select count(*) from bookmarks)                            as bookmarks,
+       (select page_count from pragma_page_count())                as page_count,
+       (select page_size from pragma_page_size())                  as page_size,
+       (select freelist_count from pragma_freelist_count())        as freelist_count,
+       (select journal_mode from pragma_journal_mode())            as journal_mode,
+       (select count(distinct segid) from bookmarks_fts_idx)       as fts_segments,
+       (select coalesce(sum(length(block)), 0) from bookmarks_fts_data) as fts_size;
+
+-- name: fts_optimize!
+insert into bookmarks_fts(bookmarks_fts) values ('optimize');
+
+-- name: fts_merge!
+-- pages > 0: only levels with usermerge segments, < 0: any segments
+insert into bookmarks_fts(bookmarks_fts, rank) values ('merge', :pages);
+
+-- name: fts_set_config!
+insert into bookmarks_fts(bookmarks_fts, rank) values (:key, :value);
+
+-- name: get_fts_config
+select k, v from bookmarks_fts_config;
+
+-- name: fts_integrity_check!
+insert into bookmarks_fts(bookmarks_fts) values ('integrity-check');
+
+-- name: fts_count_docs$
+select count(*) from bookmarks_fts_docsize;
+
+-- name: fts_delete_all!
+insert into bookmarks_fts(bookmarks_fts) values ('delete-all');
+
+-- name: fts_index_bookmarks!
+-- same columns as the bookmarks_ai trigger: 'rebuild' would index id as well
+insert into bookmarks_fts (rowid, URL, metadata, tags, "desc")
+select id, URL, metadata, tags, "desc"
+from bookmarks
+where id between :first and :last;
@@ -5,8 +5,10 @@ Edit service environment to override
 # Base Environment
 ################################################################################
 from pathlib import Path
+from typing import Dict, Optional
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
+from twbm.db.pragmas import PRAGMAS, PROFILES, PragmaValue
 
 ROOT_DIR = Path(__file__).parent.absolute()
 
@@ -14,11 +16,50 @@ ROOT_DIR = Path(__file__).parent.absolute()
 class Environment(BaseSettings):
     log_level: str = "INFO"
     twbm_db_url: str = "sqlite:///db/bm.db"
+    # no compaction on delete: ids stay valid until `twbm compact`
+    twbm_stable_ids: bool = False
+    # per-phase timing: "summary" or a *.json trace file, see twbm.trace
+    twbm_trace: Optional[str] = None
+    # count SQL statements per command, warn above twbm_sql_warn executions
+    twbm_sql_stats: bool = False
+    twbm_sql_warn: int = 50
+    # SQLite pragmas: a profile of twbm.db.pragmas, single pragmas override it
+    twbm_pragma_profile: str = "default"
+    twbm_journal_mode: Optional[str] = None
+    twbm_synchronous: Optional[str] = None
+    twbm_mmap_size: Optional[int] = None
+    twbm_cache_size: Optional[int] = None
+    twbm_temp_store: Optional[str] = None
+    twbm_busy_timeout: Optional[int] = None
+    # read-only commands open the file with immutable=1: no locks, no change
+    # detection, only safe if no other process writes while twbm runs
+    twbm_immutable: bool = False
+    # shared HTTP connection pool for page fetches: hosts kept, connections per host
+    twbm_http_pools: int = 256
+    twbm_http_maxsize: int = 4
+    # page fetches read up to </head>, at most this many bytes
+    twbm_fetch_max_bytes: int = 512 * 1024
+    # refresh: processes parsing fetched pages, None: one per core
+    twbm_parse_processes: Optional[int] = None
+
+    @validator("twbm_pragma_profile")
+    def known_profile(cls, v):
+        if v not in PROFILES:
+            raise ValueError(f"{v} not in {list(PROFILES)}")
+        return v
 
     @property
     def dbfile(self):
         return f"{self.twbm_db_url.split('sqlite:///')[-1]}"
 
+    def pragmas(self) -> Dict[str, PragmaValue]:
+        pragmas = dict(PROFILES[self.twbm_pragma_profile])
+        for name in PRAGMAS:
+            value = getattr(self, f"twbm_{name}")
+            if value is not None:
+                pragmas[name] = value
+        return pragmas
+
 
 config = Environment()
 _ = None
@@ -0,0 +1,76 @@
+"""Concurrent page fetching for bulk metadata refresh.
+
+fetch_all() runs a fetch function over many URLs in a thread pool with a global
+concurrency limit and a per-host limit. Hosts are scheduled round robin, so a
+host with thousands of bookmarks neither starves the others nor gets more than
+`per_host` requests at once. Results are yielded in the calling thread as they
+complete: the caller is the single DB writer, no locking needed.
+"""
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Hashable, Iterable, Iterator, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+_log = logging.getLogger(__name__)
+
+CONCURRENCY = 256  # requests in flight
+PER_HOST = 4  # requests in flight per host
+
+K = TypeVar("K", bound=Hashable)
+R = TypeVar("R")
+
+
+def host_of(url: str) -> str:
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def fetch_all(
+    jobs: Iterable[Tuple[K, str]],
+    fetch: Callable[[str], R],
+    concurrency: int = CONCURRENCY,
+    per_host: int = PER_HOST,
+) -> Iterator[Tuple[K, R]]:
+    """Yield (key, fetch(url)) for every (key, url) job, in completion order.
+
+    Closing the generator early (break, exception) cancels the jobs not started.
+    """
+    if concurrency < 1 or per_host < 1:
+        raise ValueError(f"Invalid limits: {concurrency=}, {per_host=}")
+
+    pending: Dict[str, Deque[Tuple[K, str]]] = defaultdict(deque)
+    for key, url in jobs:
+        pending[host_of(url)].append((key, url))
+    n_jobs = sum(len(q) for q in pending.values())
+    if n_jobs == 0:
+        return
+
+    ready: Deque[str] = deque(pending)  # hosts with pending jobs and a free slot
+    in_flight: Dict[str, int] = defaultdict(int)
+    futures: Dict[Future, Tuple[str, K]] = {}
+
+    workers = min(concurrency, n_jobs)
+    _log.debug(f"Fetching {n_jobs} URLs, {len(pending)} hosts, {workers=}")
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+    try:
+        while ready or futures:
+            while ready and len(futures) < workers:
+                host = ready.popleft()
+                key, url = pending[host].popleft()
+                futures[executor.submit(fetch, url)] = (host, key)
+                in_flight[host] += 1
+                if pending[host] and in_flight[host] < per_host:
+                    ready.append(host)
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                host, key = futures.pop(future)
+                in_flight[host] -= 1
+                if pending[host] and in_flight[host] == per_host - 1:
+                    ready.append(host)  # host was at its limit
+                yield key, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
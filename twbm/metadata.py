@@ -0,0 +1,157 @@
+"""Page title, description and keywords in a single html.parser pass.
+
+Replaces BeautifulSoup in get_data_from_page: no tree is built, the meta tags
+are picked up as start tag events and parsing stops at </head> once the title
+is known. The charset is sniffed from the raw bytes (meta charset, then the
+Content-Type header, then meta http-equiv, like buku) before decoding.
+"""
+import codecs
+import re
+from dataclasses import dataclass, field
+from email.message import Message
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+_META_CHARSET = re.compile(
+    rb"""<meta(?:\s+[\w:-]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?)*?"""
+    rb"""\s+charset\s*=\s*["']?\s*([\w.:-]+)""",
+    re.IGNORECASE,
+)
+_META_HTTP_EQUIV = re.compile(
+    rb"""<meta\s[^>]*http-equiv\s*=\s*["']?content-type[^>]*>""", re.IGNORECASE
+)
+_CHARSET_PARAM = re.compile(rb"""charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+_SPACES = re.compile(r"\s{2,}")
+
+# description variants, by precedence
+_DESCRIPTIONS = {
+    ("name", "description"): 0,
+    ("property", "description"): 1,
+    ("name", "og:description"): 2,
+    ("property", "og:description"): 3,
+}
+
+
+@dataclass
+class PageMetadata:
+    charset: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    keywords: Optional[str] = None
+    og: Dict[str, str] = field(default_factory=dict)  # og:* properties
+
+
+class _Done(Exception):
+    """Everything needed has been seen."""
+
+
+class _MetadataParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.meta = PageMetadata()
+        self._title: Optional[List[str]] = None  # inside <title>
+        self._description_rank = len(_DESCRIPTIONS)
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+        if tag == "meta":
+            self._handle_meta(dict(attrs))
+        elif tag == "title" and self.meta.title is None:
+            self._title = []
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_data(self, data: str):
+        if self._title is not None:
+            self._title.append(data)
+
+    def handle_endtag(self, tag: str):
+        if tag == "title" and self._title is not None:
+            self.meta.title = "".join(self._title)
+            self._title = None
+        elif tag == "head" and self.meta.title is not None:
+            raise _Done
+
+    def close(self):
+        super().close()
+        if self._title is not None:  # unclosed <title>, e.g. page cut off
+            self.meta.title = "".join(self._title)
+            self._title = None
+
+    def _handle_meta(self, attrs: Dict[str, Optional[str]]) -> None:
+        content = attrs.get("content")
+        if content is None:
+            return
+        for key in ("name", "property"):
+            value = (attrs.get(key) or "").lower()
+            if not value:
+                continue
+            rank = _DESCRIPTIONS.get((key, value))
+            if rank is not None and rank < self._description_rank:
+                self._description_rank = rank
+                self.meta.description = content
+            if value.startswith("og:"):
+                self.meta.og.setdefault(value[3:], content)
+            elif value == "keywords" and key == "name":
+                if self.meta.keywords is None:
+                    self.meta.keywords = content
+
+
+def sniff_charset(data: bytes, content_type: Optional[str] = None) -> Optional[str]:
+    """Charset of an HTML page: meta charset, Content-Type header, http-equiv."""
+    match = _META_CHARSET.search(data)
+    if match:
+        return match.group(1).decode("ascii")
+    if content_type:
+        header = Message()
+        header["content-type"] = content_type
+        charset = header.get_param("charset")
+        if charset:
+            return str(charset)
+    match = _META_HTTP_EQUIV.search(data)
+    if match:
+        match = _CHARSET_PARAM.search(match.group())
+        if match:
+            return match.group(1).decode("ascii")
+    return None
+
+
+def _clean(text: Optional[str], newlines: bool = False) -> Optional[str]:
+    if text is None:
+        return None
+    text = text.strip()
+    if not newlines:
+        text = text.replace("\n", " ")
+    return _SPACES.sub(" ", text)
+
+
+def extract_metadata(data: bytes, content_type: Optional[str] = None) -> PageMetadata:
+    """Title, description, keywords and og:* properties of an HTML page.
+
+    Parameters
+    ----------
+    data : bytes
+        Page, or its head.
+    content_type : str, optional
+        Content-Type header of the response.
+    """
+    charset = sniff_charset(data, content_type)
+    try:
+        codecs.lookup(charset or "utf-8")
+    except LookupError:
+        charset = None
+    text = data.decode(charset or "utf-8", errors="replace")
+
+    parser = _MetadataParser()
+    try:
+        parser.feed(text)
+        parser.close()
+    except _Done:
+        pass
+
+    meta = parser.meta
+    meta.charset = charset
+    meta.title = _clean(meta.title)
+    meta.description = _clean(meta.description, newlines=True)
+    meta.keywords = _clean(meta.keywords)
+    return meta
@@ -0,0 +1,290 @@
+"""Opt-in per-phase timing: TWBM_TRACE=summary|<file>.json or `twbm --trace`.
+
+Spans around import, engine creation, SQL queries, materialization, filtering
+and rendering, plus every SQL statement seen by the sqlite3 trace callback.
+At exit either a summary table is printed to stderr, or the spans are written
+as Chrome trace event JSON (load in https://ui.perfetto.dev or chrome://tracing).
+
+Statement counting (TWBM_SQL_STATS or `twbm --sql-stats`) shares the trace
+callback: statements grouped by normalized SQL, with an N+1 warning when one of
+them runs more than TWBM_SQL_WARN times.
+
+Disabled, span() returns a shared no-op context manager.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+import twbm
+
+_log = logging.getLogger(__name__)
+
+_NULL_SPAN = nullcontext()
+
+
+@dataclass
+class Event:
+    name: str
+    cat: str
+    start: float  # perf_counter seconds
+    dur: Optional[float] = None  # None: instant event, e.g. SQL statement
+    args: Dict[str, Any] = field(default_factory=dict)
+    tid: int = 0
+
+
+class Tracer:
+    def __init__(self, output: str):
+        self.output = output
+        self.events: List[Event] = []
+        self.t0 = twbm._import_start
+
+    def add(self, event: Event) -> None:
+        self.events.append(event)
+
+    def summary(self, file: TextIO) -> None:
+        totals: Dict[str, List[float]] = defaultdict(list)
+        n_sql: Dict[str, int] = defaultdict(int)
+        for event in self.events:
+            if event.dur is None:
+                n_sql[event.cat] += 1
+            else:
+                totals[event.name].append(event.dur)
+        wall = time.perf_counter() - self.t0
+
+        header = f"{'span':<24} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'%':>5}"
+        print(header, file=file)
+        for name, durs in sorted(totals.items(), key=lambda kv: -sum(kv[1])):
+            total = sum(durs)
+            print(
+                f"{name:<24} {len(durs):>6} {total * 1000:>10.2f}"
+                f" {total / len(durs) * 1000:>9.3f} {total / wall * 100:>5.1f}",
+                file=file,
+            )
+        print(f"{'wall':<24} {'':>6} {wall * 1000:>10.2f}", file=file)
+        print(
+            f"SQL statements: {n_sql['sql']} (+{n_sql['sql.nested']} nested)",
+            file=file,
+        )
+        file.flush()
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+
+        def us(t: float) -> float:
+            return round((t - self.t0) * 1e6, 3)
+
+        events = []
+        for e in self.events:
+            event = dict(name=e.name, cat=e.cat, ts=us(e.start), pid=pid, tid=e.tid)
+            if e.dur is None:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=round(e.dur * 1e6, 3))
+            if e.args:
+                event["args"] = e.args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self) -> None:
+        if self.output.endswith(".json"):
+            with open(self.output, "w") as f:
+                json.dump(self.chrome_trace(), f)
+        else:
+            self.summary(sys.stderr)
+
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_SPACE = re.compile(r"\s+")
+# statements that can fire triggers, also after a WITH clause
+_SQL_WRITE = re.compile(
+    r"^\s*(?:with\b.*?\b)?(?:insert|update|delete|replace)\b", re.I | re.S
+)
+
+
+def normalize_sql(statement: str) -> str:
+    """SQL text without literals: statements differing only in values group."""
+    statement = _SQL_STRING.sub("?", statement)
+    statement = _SQL_NUMBER.sub("?", statement)
+    statement = _SQL_SPACE.sub(" ", statement).strip()
+    return _SQL_LIST.sub("(?, ...)", statement)
+
+
+class StatementCounter:
+    """Executed statements by normalized SQL, warns once per N+1 suspect.
+
+    Nested statements (triggers, FTS5 internals) are only counted in total.
+    """
+
+    def __init__(self, warn_threshold: int = 50):
+        self.warn_threshold = warn_threshold
+        self.counts: Counter = Counter()
+        self.nested = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, statement: str, nested: bool = False) -> None:
+        if nested:
+            self.nested += 1
+            return
+        sql = normalize_sql(statement)
+        self.counts[sql] += 1
+        if self.counts[sql] == self.warn_threshold + 1:
+            _log.warning(
+                f"N+1 suspect, executed more than {self.warn_threshold} times"
+                f" at {_caller()}: {sql[:200]}"
+            )
+
+    def report(self, file: TextIO, top: int = 10) -> None:
+        print(
+            f"SQL statements: {self.total} ({len(self.counts)} distinct,"
+            f" +{self.nested} nested)",
+            file=file,
+        )
+        for sql, n in self.counts.most_common(top):
+            flag = "!" if n > self.warn_threshold else " "
+            print(f"{flag}{n:>7}  {sql[:120]}", file=file)
+        file.flush()
+
+
+def _caller() -> str:
+    """Innermost twbm frame outside this module: where the loop runs."""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename  # skips queries.sql: aiosql query functions
+        if "twbm" in filename and filename.endswith(".py") and filename != __file__:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "?"
+
+
+_tracer: Optional[Tracer] = None
+_counter: Optional[StatementCounter] = None
+_last_statement: Optional[str] = None
+
+
+class _Span:
+    __slots__ = ("tracer", "event")
+
+    def __init__(self, tracer: Tracer, name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer  # finish() may run before the span is closed
+        self.event = Event(name, cat, 0.0, args=args, tid=threading.get_ident())
+
+    def __enter__(self):
+        self.event.start = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.event.dur = time.perf_counter() - self.event.start
+        self.tracer.add(self.event)
+
+
+def span(name: str, cat: str = "twbm", **args):
+    """Context manager timing a phase, no-op unless tracing is enabled."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, cat, args)
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def enable(output: str = "summary") -> Tracer:
+    """Start tracing: output "summary" (stderr table) or a *.json trace file.
+
+    The "import" span covers the time from importing twbm until now.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(output)
+        now = time.perf_counter()
+        _tracer.add(Event("import", "twbm", _tracer.t0, now - _tracer.t0))
+        atexit.register(finish)
+        _watch_all()
+    _tracer.output = output
+    return _tracer
+
+
+def finish() -> None:
+    """Stop tracing and write its output."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        atexit.unregister(finish)
+        tracer.write()
+
+
+def start_counting(warn_threshold: int = 50) -> StatementCounter:
+    """Count executed statements until stop_counting()."""
+    global _counter
+    _counter = StatementCounter(warn_threshold)
+    _watch_all()
+    return _counter
+
+
+def stop_counting() -> Optional[StatementCounter]:
+    global _counter
+    counter, _counter = _counter, None
+    return counter
+
+
+def report_counting(file: Optional[TextIO] = None) -> None:
+    """stop_counting() and print its report (default: stderr), e.g. at exit."""
+    counter = stop_counting()
+    if counter is not None:
+        counter.report(file or sys.stderr)
+
+
+@contextmanager
+def count_statements(warn_threshold: int = 50) -> Iterator[StatementCounter]:
+    """Statements executed in the with block, e.g. for tests and benchmarks."""
+    global _counter
+    previous = _counter
+    try:
+        yield start_counting(warn_threshold)
+    finally:
+        _counter = previous
+
+
+def _on_sql(statement: str) -> None:
+    global _last_statement
+    # "-- " prefix: statement of a virtual table, e.g. FTS5 reading its content.
+    # Trigger programs are reported with the expanded text of the outer statement,
+    # and only writes fire triggers: a repeated read is a new statement (N+1).
+    nested = statement.startswith("-- ") or (
+        statement == _last_statement and _SQL_WRITE.match(statement) is not None
+    )
+    if not statement.startswith("-- "):
+        _last_statement = statement
+    if _counter is not None:
+        _counter.add(statement, nested)
+    if _tracer is not None:
+        cat = "sql.nested" if nested else "sql"
+        _tracer.add(Event("sql", cat, time.perf_counter(), args={"sql": statement}))
+
+
+def watch(conn: sqlite3.Connection) -> None:
+    """Record every SQL statement executed on conn, if tracing or counting."""
+    if _tracer is not None or _counter is not None:
+        conn.set_trace_callback(_on_sql)
+
+
+def _watch_all() -> None:
+    """watch() the connections opened before tracing or counting started."""
+    from twbm.db.connection import get_dbapi_connections
+
+    for conn in get_dbapi_connections():
+        watch(conn)
@@ -1,22 +1,28 @@
 import logging
 import os
+import re
+import statistics
 import sys
+import time
 import webbrowser
 from os import isatty
-from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Tuple, Union
 
 # import for nuitka
 # noinspection PyUnresolvedReferences
 import sqlalchemy.sql.default_comparator  # noqa: F401
 import typer
+from twbm import trace
 from twbm.bookmarks import Bookmarks, check_tags, clean_tags, parse_tags
-from twbm.buku import BukuDb, edit_rec
-from twbm.db.dal import DAL, Bookmark
+from twbm.db.connection import get_dbapi_connection
+from twbm.db.dal import DAL, Bookmark, BookmarkRow
 from twbm.environment import config
 from twbm.handle_uri import open_it
 
 if TYPE_CHECKING:
-    pass
+    from twbm.buku import BukuDb
+
+# twbm.buku is imported where needed, see twbm.buku for its lazy imports
 
 _log = logging.getLogger(__name__)
 log_fmt = r"%(asctime)-15s %(levelname)s %(name)s %(funcName)s:%(lineno)d %(message)s"
@@ -36,45 +42,76 @@ Features:
 
 app = typer.Typer(help=HELP_DESC)
 
+
+@app.callback()
+def main_callback(
+    ctx: typer.Context,
+    trace_output: str = typer.Option(
+        config.twbm_trace,
+        "--trace",
+        help="per-phase timing: 'summary' (stderr) or a *.json Chrome trace file",
+    ),
+    sql_stats: bool = typer.Option(
+        config.twbm_sql_stats,
+        "--sql-stats",
+        help=f"count SQL statements, warn on N+1 (> {config.twbm_sql_warn} times)",
+    ),
+):
+    if trace_output:
+        trace.enable(trace_output)
+        ctx.call_on_close(trace.finish)
+    if sql_stats:
+        trace.start_counting(config.twbm_sql_warn)
+        ctx.call_on_close(trace.report_counting)
+
+
 fts_sql = """
 -- name: fts
 -- record_class: Bookmark
 """
 
 
+def _bukudb() -> "BukuDb":
+    """BukuDb on the process-wide connection shared with DAL."""
+    from twbm.buku import BukuDb
+
+    return BukuDb(dbfile=config.dbfile, conn=get_dbapi_connection(config.twbm_db_url))
+
+
 def _update_tags(
     ids: Sequence[int],
     tags: Optional[Sequence[str]] = None,
     tags_not: Optional[Sequence[str]] = None,
     force: bool = False,
 ):
-    bms = Bookmarks(fts_query="").bms
     if tags is None:
         tags = ()
     if tags_not is None:
         tags_not = ()
 
     with DAL(env_config=config) as dal:
-        # to allow for redefinition: set -> list
-        # (https://mypy.readthedocs.io/en/stable/common_issues.html#redefinitions-with-incompatible-types)
-        new_tags: Iterable
-        for id in ids:
-            bm = bms[id - 1]
-            if force:
-                new_tags = set(tags)
-            else:
-                new_tags = (set(bm.split_tags) | set(tags)) - set(tags_not)
-            new_tags = sorted(new_tags)
-            new_tags_str = f",{','.join(new_tags)},"
-            _log.debug(f"{new_tags_str=}")
-            bm.tags = new_tags_str
-            dal.update_bookmark(bm)
+        bms = dal.update_tags(ids, tags=tags, tags_not=tags_not, force=force)
+    show_bms(bms)
+    return bms
 
-            show_bms((bm,))
+
+def show_bms(
+    bms: Sequence[Union[Bookmark, BookmarkRow]],
+    err: bool = True,
+    show_timestamp: bool = False,
+    start: int = 0,
+):
+    with trace.span("render"):
+        _show_bms(bms, err, show_timestamp, start)
 
 
-def show_bms(bms: Sequence[Bookmark], err: bool = True, show_timestamp: bool = False):
-    for i, bm in enumerate(bms):
+def _show_bms(
+    bms: Sequence[Union[Bookmark, BookmarkRow]],
+    err: bool,
+    show_timestamp: bool,
+    start: int,
+):
+    for i, bm in enumerate(bms, start=start):
         offset = len(str(i)) + 2
 
         bmid_formatted = typer.style(
@@ -103,7 +140,7 @@ def show_bms(bms: Sequence[Bookmark], err: bool = True, show_timestamp: bool = F
         typer.secho("", err=err)
 
 
-def process(bms: Sequence[Bookmark]):  # noqa: max-complexity: 18
+def process(bms: Sequence[BookmarkRow]):  # noqa: max-complexity: 18
     help_text = """
         <n1> <n2>:      opens selection in browser
         p <n1> <n2>:    print id-list of selection
@@ -113,6 +150,11 @@ def process(bms: Sequence[Bookmark]):  # noqa: max-complexity: 18
         q:              quit
         h:              help
     """
+    try:
+        import readline  # noqa: F401  line editing for input()
+    except ImportError:
+        pass
+
     typer.secho(f"Selection: ", fg=typer.colors.GREEN, err=True)
     selection: List = input().split()
 
@@ -144,27 +186,23 @@ def process(bms: Sequence[Bookmark]):  # noqa: max-complexity: 18
             if len(selection) == 0:
                 typer.echo(f"-W- no selection. Do nothing.")
                 raise typer.Exit()
-            else:
-                for i in reversed(selection):  # must be reversed because of compacting
-                    bm = bms[i]
-                    typer.echo(bm.id)
-                    _ = BukuDb(dbfile=config.dbfile).delete_rec(
-                        index=bm.id, delay_commit=False
-                    )
-                    typer.echo(f"-M- Deleted entry: {bm.metadata}: {bm.URL}")
+            with DAL(env_config=config) as dal:
+                dal.delete_bookmarks(
+                    ids=[bms[i].id for i in selection],
+                    compact=not config.twbm_stable_ids,
+                )
+            for i in reversed(selection):
+                typer.echo(f"Index {bms[i].id} deleted", err=True)
+                typer.echo(f"-M- Deleted entry: {bms[i].metadata}: {bms[i].URL}")
 
         elif cmd == "e":
             if len(selection) == 0:
                 for bm in bms:
-                    _ = BukuDb(dbfile=config.dbfile).edit_update_rec(
-                        index=bm.id, immutable=1
-                    )
+                    _ = _bukudb().edit_update_rec(index=bm.id, immutable=1)
             else:
                 for i in selection:
                     typer.echo(bms[i].id)
-                    _ = BukuDb(dbfile=config.dbfile).edit_update_rec(
-                        index=bms[i].id, immutable=1
-                    )
+                    _ = _bukudb().edit_update_rec(index=bms[i].id, immutable=1)
 
         elif cmd == "h":
             typer.echo(help_text, err=True)
@@ -207,6 +245,12 @@ def search(
         None, "--prefix", help="tags to prefix the tags option"
     ),
     non_interactive: bool = typer.Option(False, "--np", help="no prompt"),
+    limit: int = typer.Option(
+        None, "--limit", help="at most limit bookmarks, in order of FTS rank or id"
+    ),
+    offset: int = typer.Option(
+        0, "--offset", help="skip the first offset bookmarks, in that order"
+    ),
     order_desc: bool = typer.Option(False, "-o", help="order by age, descending."),
     order_asc: bool = typer.Option(False, "-O", help="order by age, ascending."),
     verbose: bool = typer.Option(False, "-v", "--verbose"),
@@ -235,6 +279,9 @@ def search(
         # Open all matching sites non-interactively                           :
         twbm search poker --np | twbm open\n
 
+        # Page through results                                                :
+        twbm search poker --limit 20 --offset 40\n
+
 
     \nCommands in interactive mode:\n
         <n1> <n2>:      opens selection in browser\n
@@ -252,21 +299,23 @@ def search(
     if verbose:
         typer.echo(f"{config.twbm_db_url=}, {tags_all=}", err=True)
 
+    paged = limit is not None or offset > 0
     bms = Bookmarks(fts_query=fts_query).filter(
-        tags_all, tags_all_not, tags_any, tags_any_not, tags_exact
+        tags_all, tags_all_not, tags_any, tags_any_not, tags_exact, limit, offset
     )
 
-    # ordering of results
+    # ordering of results, a page keeps the order it was cut from
     # cast to avoid mypy error: Returning Any from function declared to return "SupportsLessThan"
     # https://github.com/python/mypy/issues/9656
-    k = lambda bm: bm.last_update_ts
-    if order_desc:
-        bms = sorted(bms, key=k)
-    elif order_asc:
-        bms = sorted(bms, key=k, reverse=True)
-    else:
-        k = lambda bm: bm.metadata.lower() if bm.metadata else ""
-        bms = sorted(bms, key=k)
+    with trace.span("sort"):
+        k = lambda bm: bm.last_update_ts
+        if order_desc:
+            bms = sorted(bms, key=k)
+        elif order_asc:
+            bms = sorted(bms, key=k, reverse=True)
+        elif not paged:
+            k = lambda bm: bm.metadata.lower() if bm.metadata else ""
+            bms = sorted(bms, key=k)
 
     show_bms(bms, show_timestamp=order_desc or order_asc)
     typer.echo(f"Found: {len(bms)}", err=True)
@@ -284,12 +333,17 @@ def delete(
     ids: str = typer.Argument(None, help="list of ids, separated by comma, no blanks"),
     verbose: bool = typer.Option(False, "-v", "--verbose"),
 ):
-    """Delete search results in descending order of DB index."""
+    """
+    Delete bookmarks in one transaction.
+
+    The gaps are filled with the bookmarks of highest id (buku compatible),
+    except in stable id mode (TWBM_STABLE_IDS=1).
+    """
     if verbose:
         typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
 
     # Gotcha: running from IDE looks like pipe, comment out for testing
-    is_pipe = not isatty(sys.stdin.fileno())
+    is_pipe = not sys.stdin.isatty()
 
     if is_pipe:
         ids = sys.stdin.readline()
@@ -300,12 +354,19 @@ def delete(
         typer.secho(f"-E- Wrong input format.", fg=typer.colors.RED, err=True)
         raise typer.Abort()
 
-    for id_ in sorted(id_list, reverse=True):
-        # use buku because of DB compactdb
-        with DAL(env_config=config) as dal:
-            bm = dal.get_bookmark_by_id(id_=id_)
-            show_bms((bm,))
-        _ = BukuDb(dbfile=config.dbfile).delete_rec(index=id_, delay_commit=False)
+    with DAL(env_config=config) as dal:
+        bms = list(reversed(dal.get_bookmarks_by_ids(ids=id_list)))
+        show_bms(bms)
+        with typer.progressbar(
+            length=len(id_list), label="Deleting", file=sys.stderr
+        ) as progress:
+            dal.delete_bookmarks(
+                ids=id_list,
+                compact=not config.twbm_stable_ids,
+                on_progress=progress.update,
+            )
+    for bm in bms:
+        typer.echo(f"Index {bm.id} deleted", err=True)
 
 
 @app.command()
@@ -352,7 +413,15 @@ def update(
         raise typer.Abort()
 
     print(id_list)
-    _update_tags(id_list, tags, tags_not, force=force)
+    start = time.perf_counter()
+    bms = _update_tags(id_list, tags, tags_not, force=force)
+    if verbose:
+        elapsed = time.perf_counter() - start
+        typer.echo(
+            f"-M- Updated {len(bms)} bookmarks in {elapsed:.3f}s"
+            f" ({len(bms) / elapsed:.0f}/s)",
+            err=True,
+        )
 
 
 @app.command()
@@ -387,7 +456,7 @@ def open(
         raise typer.Abort()
 
     print(ids)
-    with DAL(env_config=config) as dal:
+    with DAL(env_config=config, read_only=True) as dal:
         for id_ in ids:
             bm = dal.get_bookmark_by_id(id_=id_)
             show_bms((bm,))
@@ -448,6 +517,8 @@ def add(
                 err=True,
             )
             raise typer.Exit()
+        from twbm.buku import edit_rec
+
         result = edit_rec(
             editor=editor, url=url, title_in=title, tags_in=tags_in, desc=""
         )
@@ -456,7 +527,7 @@ def add(
         else:
             raise typer.Abort()
 
-    id_ = BukuDb(dbfile=config.dbfile).add_rec(
+    id_ = _bukudb().add_rec(
         url=url,
         title_in=title,
         tags_in=tags_in,
@@ -480,7 +551,7 @@ def show(
         typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
 
     # _ = BukuDb(dbfile=config.dbfile).print_rec(index=id_)  # noqa E800
-    with DAL(env_config=config) as dal:
+    with DAL(env_config=config, read_only=True) as dal:
         bm = dal.get_bookmark_by_id(id_=id_)
         show_bms((bm,))
 
@@ -497,7 +568,7 @@ def edit(
     immutable = -1 if nofetch else 1
     if verbose:
         typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
-    _ = BukuDb(dbfile=config.dbfile).edit_update_rec(index=id_, immutable=immutable)
+    _ = _bukudb().edit_update_rec(index=id_, immutable=immutable)
 
 
 @app.command()
@@ -506,10 +577,13 @@ def tags(
     tag: str = typer.Argument(
         None,
         help=(
-            "tag for which related tags should be shown. No input: all tags are"
-            " printed."
+            "tag(s) for which related tags should be shown, comma separated."
+            " No input: all tags are printed."
         ),
     ),
+    top: int = typer.Option(
+        None, "-k", "--top", help="show only the k most frequent related tags"
+    ),
     verbose: bool = typer.Option(False, "-v", "--verbose"),
 ):
     """
@@ -517,22 +591,238 @@ def tags(
 
     With tag as parameter:
     Show related tags, i.e. tags which are used in combination with tag.
+    With several tags: tags which are used in combination with all of them.
     """
     if verbose:
         typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
 
+    tags_ = None
     if tag is not None:
-        tag = tag.strip(",").strip().lower()
+        tags_ = [t.strip().lower() for t in tag.split(",") if t.strip() != ""]
 
-    with DAL(env_config=config) as dal:
-        if tag is None:
+    with DAL(env_config=config, read_only=True) as dal:
+        if not tags_:
             tags = dal.get_all_tags()
+        elif len(tags_) == 1:
+            tags = dal.get_related_tags(tag=tags_[0], limit=top)
         else:
-            tags = dal.get_related_tags(tag=tag)
+            tags = dal.get_related_tags_all(tags=tags_, limit=top)
         for t in tags:
             typer.echo(f"{t[1]:>4}: {t[0]}", err=True)
 
 
+@app.command()
+def compact(
+    verbose: bool = typer.Option(False, "-v", "--verbose"),
+):
+    """
+    Fill the id gaps left by deletes in stable id mode (TWBM_STABLE_IDS=1).
+
+    Bookmarks with the highest ids are moved into the gaps, in one transaction.
+    """
+    if verbose:
+        typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
+
+    with DAL(env_config=config) as dal:
+        moves = dal.compact()
+    for id_, new_id in moves:
+        typer.echo(f"Index {id_} moved to {new_id}", err=True)
+    typer.echo(f"-M- Compacted: {len(moves)} bookmarks moved.", err=True)
+
+
+def _format_size(n: float) -> str:
+    if n < 1024:
+        return f"{n:.0f} B"
+    for unit in ("KB", "MB"):
+        n /= 1024
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024:.1f} GB"
+
+
+def _probe_queries(dal: DAL, top_tag: Optional[str]) -> List[Tuple[str, Callable]]:
+    """Standard probes: a title word and the most frequent tag of the database."""
+    probes = [("bookmark by id", lambda: dal.get_bookmarks_by_ids([1]))]
+    first = next(dal.iter_bookmarks("", limit=1), None)
+    words = re.findall(r"\w{3,}", first.metadata or "") if first else []
+    if words:
+        fts = f'"{words[0]}"'
+        probes.append((f"fts {fts}", lambda: dal.search_bookmarks(fts)))
+        probes.append((f"fts {fts}*", lambda: dal.search_bookmarks(f"{fts}*")))
+    if top_tag is not None:
+        probes.append((f"tag {top_tag}", lambda: dal.search_bookmarks("", [top_tag])))
+        if words:
+            probes.append(
+                (f"fts + tag {top_tag}", lambda: dal.search_bookmarks(fts, [top_tag]))
+            )
+        probes.append((f"related {top_tag}", lambda: dal.get_related_tags(top_tag)))
+    probes.append(("all tags", dal.get_all_tags))
+    return probes
+
+
+@app.command()
+def stats(
+    rounds: int = typer.Option(
+        20, "-n", "--rounds", help="rounds per probe query, 0: no probes"
+    ),
+    top: int = typer.Option(10, "-k", "--top", help="number of top tags"),
+    verbose: bool = typer.Option(False, "-v", "--verbose"),
+):
+    """
+    Show database and index health: sizes, FTS segments, tags, probe latencies.
+
+    Many FTS segments: `twbm fts optimize`, many free pages: VACUUM.
+    """
+    if verbose:
+        typer.echo(f"Using DB: {config.twbm_db_url}", err=True)
+
+    wal = f"{config.dbfile}-wal"
+    with DAL(env_config=config, read_only=True) as dal:
+        db_stats = dal.get_db_stats()
+        top_tags = dal.get_all_tags()[:top]
+
+        typer.echo(f"{'Bookmarks:':<16}{db_stats.bookmarks}")
+        typer.echo(
+            f"{'Database:':<16}{_format_size(db_stats.size)}"
+            f" ({db_stats.page_count} pages of {db_stats.page_size} bytes,"
+            f" {db_stats.freelist_count} free), journal mode {db_stats.journal_mode}"
+        )
+        wal_size = os.path.getsize(wal) if os.path.exists(wal) else 0
+        typer.echo(f"{'WAL:':<16}{_format_size(wal_size)}")
+        typer.echo(
+            f"{'FTS index:':<16}{db_stats.fts_segments} segments,"
+            f" {_format_size(db_stats.fts_size)}"
+        )
+        typer.echo(f"{'Tags:':<16}{db_stats.tags} distinct")
+        typer.echo(
+            f"{'Top tags:':<16}{', '.join(f'{tag} ({n})' for tag, n in top_tags)}"
+        )
+
+        if rounds <= 0:
+            return
+        typer.echo(f"\nProbe queries ({rounds} rounds){'p50 ms':>17}{'p95 ms':>10}")
+        top_tag = top_tags[0][0] if top_tags else None
+        for name, probe in _probe_queries(dal, top_tag):
+            durations = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                probe()
+                durations.append((time.perf_counter() - start) * 1000)
+            if len(durations) > 1:
+                q = statistics.quantiles(durations, n=100, method="inclusive")
+                p50, p95 = q[49], q[94]
+            else:
+                p50 = p95 = durations[0]
+            typer.echo(f"  {name[:32]:<32}{p50:>10.2f}{p95:>10.2f}")
+
+
+fts_app = typer.Typer(help="FTS index maintenance, see `twbm stats` for its health.")
+app.add_typer(fts_app, name="fts")
+
+
+@fts_app.command("optimize")
+def fts_optimize():
+    """
+    Merge all index segments into one: fastest search, rewrites the whole index.
+    """
+    with DAL(env_config=config) as dal:
+        before = dal.get_db_stats().fts_segments
+        start = time.perf_counter()
+        dal.fts_optimize()
+        after = dal.get_db_stats().fts_segments
+    typer.echo(
+        f"-M- Optimized: {before} -> {after} segments"
+        f" in {time.perf_counter() - start:.1f}s.",
+        err=True,
+    )
+
+
+@fts_app.command("merge")
+def fts_merge(
+    pages: int = typer.Option(
+        500, "-p", "--pages", help="page budget: pages written per merge step"
+    ),
+    steps: int = typer.Option(
+        1, "-s", "--steps", help="merge steps, each committed, 0: until done"
+    ),
+    all_levels: bool = typer.Option(
+        False, "-a", "--all", help="merge any segments, not only full levels"
+    ),
+):
+    """
+    Incremental merge: bounded work per step, e.g. after large imports.
+    """
+    with DAL(env_config=config) as dal:
+        step = 0
+        while steps == 0 or step < steps:
+            step += 1
+            if not dal.fts_merge(-pages if all_levels else pages):
+                typer.echo(f"Step {step}: nothing to merge", err=True)
+                break
+            segments = dal.get_db_stats().fts_segments
+            typer.echo(f"Step {step}: {segments} segments", err=True)
+
+
+@fts_app.command("config")
+def fts_config(
+    automerge: int = typer.Option(
+        None, help="segments per level to merge automatically (0: off, 2-16)"
+    ),
+    crisismerge: int = typer.Option(
+        None, help="segments per level to merge immediately, blocking the write"
+    ),
+    usermerge: int = typer.Option(
+        None, help="segments per level to merge by `twbm fts merge` (2-16)"
+    ),
+):
+    """
+    Show or set the merge configuration of the FTS index.
+    """
+    values = dict(automerge=automerge, crisismerge=crisismerge, usermerge=usermerge)
+    with DAL(env_config=config) as dal:
+        for key, value in values.items():
+            if value is not None:
+                dal.set_fts_config(key, value)
+        for key, value in dal.get_fts_config().items():
+            typer.echo(f"{key}: {value}")
+
+
+@fts_app.command("integrity-check")
+def fts_integrity_check():
+    """
+    Check the FTS index structure and that every bookmark is indexed.
+    """
+    with DAL(env_config=config) as dal:
+        problems = dal.fts_integrity_check()
+    for problem in problems:
+        typer.secho(f"-E- {problem}", fg=typer.colors.RED, err=True)
+    if problems:
+        typer.secho("-E- Run: twbm fts rebuild", fg=typer.colors.RED, err=True)
+        raise typer.Exit(1)
+    typer.echo("-M- FTS index ok.", err=True)
+
+
+@fts_app.command("rebuild")
+def fts_rebuild(
+    chunk_size: int = typer.Option(
+        10_000, "-c", "--chunk-size", help="bookmarks indexed per chunk"
+    ),
+    optimize: bool = typer.Option(
+        True, "--optimize/--no-optimize", help="merge into one segment afterwards"
+    ),
+):
+    """
+    Rebuild the FTS index from the bookmarks, in one transaction.
+    """
+    with DAL(env_config=config) as dal:
+        n = dal.get_db_stats().bookmarks
+        with typer.progressbar(length=n, label="Indexing", file=sys.stderr) as progress:
+            n = dal.fts_rebuild(chunk_size=chunk_size, on_progress=progress.update)
+        if optimize:
+            dal.fts_optimize()
+    typer.echo(f"-M- Rebuilt: {n} bookmarks indexed.", err=True)
+
+
 if __name__ == "__main__":
     _log.debug(config)
     app()